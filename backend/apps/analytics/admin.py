@@ -13,6 +13,7 @@ def _register(key, model):
 _register("projects", models.Project)
 _register("tasks", models.Task)
 _register("time", models.TimeEntry)
+_register("time", models.LaborRate)
 
 # catalog
 _register("products", models.Product)
@@ -33,3 +34,7 @@ _register("invoice_lines", models.InvoiceLine)
 _register("expenses", models.Expense)
 _register("analytics", models.AnalyticsEvent)
 _register("aggregated_metrics", models.AggregatedMetric)
+_register("aggregated_metrics", models.RollupCheckpoint)
+_register("analytics", models.EventArchive)
+_register("sales", models.DocumentSequence)
+_register("analytics", models.Tombstone)
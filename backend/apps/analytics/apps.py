@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AnalyticsConfig(AppConfig):
     name = "apps.analytics"
     verbose_name = "Analytics & ERP"
+
+    def ready(self):
+        from . import signals
+
+        signals.connect()
@@ -0,0 +1,216 @@
+"""Batch create / partial update / delete for analytics viewsets.
+
+A batch body looks like::
+
+    {"mode": "atomic" | "best_effort",
+     "create": [{...}, ...],
+     "update": [{"id": 1, ...}, ...],
+     "delete": [3, 4]}
+
+Every item is validated with the viewset's own serializer. Related objects
+referenced by primary key are loaded once per field for the whole batch,
+rows to update are fetched with one ``in_bulk`` and the writes go through
+``bulk_create`` / ``bulk_update`` / one set-based delete, so the query count
+does not grow with the batch size. A body that is not an object, or ids that
+do not convert to the model's primary key, are reported as errors (400).
+
+``atomic`` applies nothing unless every item is valid; ``best_effort``
+applies the valid items and reports the rest.
+"""
+from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from rest_framework import serializers as drf_serializers
+
+from . import changes, resultcache
+
+MODES = ("atomic", "best_effort")
+
+
+class _PreloadedQueryset:
+    """Stands in for a related field's queryset, answering ``get(pk=...)`` from a dict."""
+
+    def __init__(self, model, objects):
+        self.model = model
+        self.objects = objects
+
+    def get(self, pk):
+        try:
+            key = self.model._meta.pk.to_python(pk)
+        except DjangoValidationError:
+            raise ValueError(pk)
+        try:
+            return self.objects[key]
+        except KeyError:
+            raise self.model.DoesNotExist
+
+    def all(self):
+        return self
+
+
+def _related_fields(serializer):
+    return {
+        name: field
+        for name, field in serializer.fields.items()
+        if isinstance(field, drf_serializers.PrimaryKeyRelatedField) and not field.read_only
+    }
+
+
+def _preload(serializer, items):
+    """One query per writable FK field covering every pk mentioned in ``items``."""
+    preloaded = {}
+    for name, field in _related_fields(serializer).items():
+        queryset = field.get_queryset()
+        model = queryset.model
+        keys = set()
+        for item in items:
+            value = item.get(name) if isinstance(item, dict) else None
+            if value is None or isinstance(value, bool):
+                continue
+            try:
+                keys.add(model._meta.pk.to_python(value))
+            except DjangoValidationError:
+                continue
+        preloaded[name] = _PreloadedQueryset(model, queryset.in_bulk(keys) if keys else {})
+    return preloaded
+
+
+def _use_preloaded(serializer, preloaded):
+    for name, field in _related_fields(serializer).items():
+        field.queryset = preloaded[name]
+    return serializer
+
+
+def _error(index, errors, **extra):
+    return {"index": index, "status": "error", "errors": errors, **extra}
+
+
+def run_batch(view, payload):
+    """Validate and apply a batch; returns ``(results, http_status_hint)``."""
+    if not isinstance(payload, dict):
+        raise drf_serializers.ValidationError({"non_field_errors": ["Expected a JSON object."]})
+    mode = payload.get("mode", "atomic")
+    if mode not in MODES:
+        raise drf_serializers.ValidationError({"mode": f"Expected one of {', '.join(MODES)}."})
+    creates = payload.get("create") or []
+    updates = payload.get("update") or []
+    deletes = payload.get("delete") or []
+    if not all(isinstance(group, list) for group in (creates, updates, deletes)):
+        raise drf_serializers.ValidationError("create, update and delete must be lists.")
+
+    model = view.get_queryset().model
+    serializer_class = view.get_serializer_class()
+    context = view.get_serializer_context()
+    results = {"create": [], "update": [], "delete": []}
+    has_updated_at = any(f.name == "updated_at" for f in model._meta.concrete_fields)
+
+    # Validate creates with one shared serializer.
+    creator = serializer_class(context=context)
+    preloaded = _preload(creator, creates + updates)
+    _use_preloaded(creator, preloaded)
+    new_objects = []
+    for index, item in enumerate(creates):
+        try:
+            data = creator.run_validation(item)
+        except drf_serializers.ValidationError as exc:
+            results["create"].append(_error(index, exc.detail))
+            continue
+        new_objects.append((index, model(**data)))
+
+    # Validate partial updates against rows fetched in one query.
+    visible = view.filter_queryset(view.get_queryset())
+    update_keys = []
+    for index, item in enumerate(updates):
+        if not isinstance(item, dict) or item.get("id") is None:
+            results["update"].append(_error(index, {"id": ["This field is required."]}))
+            continue
+        try:
+            update_keys.append((index, item, model._meta.pk.to_python(item["id"])))
+        except DjangoValidationError:
+            results["update"].append(_error(index, {"id": ["Invalid id."]}, id=item["id"]))
+    instances = visible.in_bulk([key for _, _, key in update_keys]) if update_keys else {}
+    changed = []
+    changed_fields = set()
+    for index, item, key in update_keys:
+        instance = instances.get(key)
+        if instance is None:
+            results["update"].append(_error(index, {"id": ["Not found."]}, id=item["id"]))
+            continue
+        serializer = _use_preloaded(
+            serializer_class(instance, data=item, partial=True, context=context), preloaded
+        )
+        if not serializer.is_valid():
+            results["update"].append(_error(index, serializer.errors, id=item["id"]))
+            continue
+        for attr, value in serializer.validated_data.items():
+            setattr(instance, attr, value)
+            changed_fields.add(model._meta.get_field(attr).name)
+        changed.append((index, instance))
+
+    # Deletes only touch rows the caller can see.
+    delete_keys = []
+    for index, pk in enumerate(deletes):
+        try:
+            delete_keys.append((index, pk, model._meta.pk.to_python(pk)))
+        except DjangoValidationError:
+            results["delete"].append(_error(index, {"id": ["Invalid id."]}, id=pk))
+    existing = set(visible.filter(pk__in=[key for _, _, key in delete_keys]).values_list("pk", flat=True))
+    to_delete = []
+    for index, pk, key in delete_keys:
+        if key in existing:
+            to_delete.append((index, pk, key))
+        else:
+            results["delete"].append(_error(index, {"id": ["Not found."]}, id=pk))
+
+    failed = any(results[group] for group in results)
+    if mode == "atomic" and failed:
+        return _sorted(results), False
+
+    def write_creates():
+        model.objects.bulk_create([obj for _, obj in new_objects])
+        changes.notify(model, [obj for _, obj in new_objects], "upsert")
+        results["create"] += [{"index": i, "status": "created", "id": obj.pk} for i, obj in new_objects]
+
+    def write_updates():
+        if changed:
+            fields = set(changed_fields)
+            if has_updated_at:
+                now = timezone.now()
+                for _, instance in changed:
+                    instance.updated_at = now
+                fields.add("updated_at")
+            model.objects.bulk_update([instance for _, instance in changed], sorted(fields))
+            changes.notify(model, [instance for _, instance in changed], "upsert")
+        results["update"] += [{"index": i, "status": "updated", "id": obj.pk} for i, obj in changed]
+
+    def write_deletes():
+        if to_delete:
+            # One DELETE per table; tombstones, line totals and change
+            # notifications are written once per model (see deletion.py).
+            model.objects.filter(pk__in=[key for _, _, key in to_delete]).delete()
+        results["delete"] += [{"index": i, "status": "deleted", "id": pk} for i, pk, _ in to_delete]
+
+    steps = [("create", new_objects, write_creates), ("update", changed, write_updates), ("delete", to_delete, write_deletes)]
+    if mode == "atomic":
+        try:
+            with transaction.atomic():
+                for _, _, step in steps:
+                    step()
+        except (DatabaseError, ObjectDoesNotExist) as exc:
+            results = {group: [_error(item[0], {"non_field_errors": [str(exc)]}) for item in items] for group, items, _ in steps}
+            return _sorted(results), False
+    else:
+        for group, items, step in steps:
+            try:
+                with transaction.atomic():
+                    step()
+            except (DatabaseError, ObjectDoesNotExist) as exc:
+                failed = True
+                results[group] += [_error(item[0], {"non_field_errors": [str(exc)]}) for item in items]
+    # bulk_create / bulk_update bypass the model signals the result cache listens to.
+    resultcache.bump(model)
+    return _sorted(results), not failed
+
+
+def _sorted(results):
+    return {group: sorted(items, key=lambda item: item["index"]) for group, items in results.items()}
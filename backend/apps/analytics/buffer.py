@@ -0,0 +1,197 @@
+"""In-process buffered writer for AnalyticsEvent rows.
+
+Request code calls :func:`track`, which only puts a small dict on a bounded
+queue. A background thread drains the queue with ``bulk_create`` whenever a
+batch fills up or the flush interval elapses, so INSERT latency never sits on
+the request path. ``POST /events/`` goes through it. When the queue is full
+the call waits up to ``BLOCK_TIMEOUT`` seconds (backpressure, default 0.1) for
+the writer to make room and then drops the event, counting it in
+:attr:`EventBuffer.stats`; ``0`` drops immediately.
+
+The buffer is flushed on interpreter exit (``atexit``), which covers graceful
+WSGI worker shutdown; ASGI servers get the same through
+:func:`with_lifespan_flush`, which handles the ``lifespan.shutdown`` event.
+
+Configure with ``ANALYTICS_EVENT_BUFFER`` in settings, e.g.
+``{"MAX_SIZE": 10000, "BATCH_SIZE": 500, "FLUSH_INTERVAL": 1.0, "BLOCK_TIMEOUT": 0.1}``.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {"MAX_SIZE": 10000, "BATCH_SIZE": 500, "FLUSH_INTERVAL": 1.0, "BLOCK_TIMEOUT": 0.1}
+
+
+class EventBuffer:
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=1.0, block_timeout=0.1):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._atexit_registered = False
+        self.stats = {"enqueued": 0, "blocked": 0, "written": 0, "dropped": 0, "flushes": 0, "errors": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def track(self, event_name, user=None, project=None, path=None, properties=None, timestamp=None):
+        """Queue one event; returns False if it had to be dropped."""
+        row = {
+            "event_name": event_name,
+            "user_id": getattr(user, "pk", user),
+            "project_id": getattr(project, "pk", project),
+            "path": path,
+            "properties": properties or {},
+            "timestamp": timestamp or timezone.now(),
+        }
+        self.start()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if not self.block_timeout:
+                self._count("dropped")
+                return False
+            # Backpressure: wake the writer and wait for it to make room.
+            self._wake.set()
+            self._count("blocked")
+            try:
+                self._queue.put(row, timeout=self.block_timeout)
+            except queue.Full:
+                self._count("dropped")
+                return False
+        self._count("enqueued")
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def start(self):
+        """Start the writer thread, restarting it in a freshly forked worker."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="analytics-event-buffer", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.shutdown)
+                self._atexit_registered = True
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                self.flush()
+            self.flush()
+        finally:
+            connection.close()
+
+    def _take_batch(self):
+        batch = []
+        try:
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        from .models import AnalyticsEvent
+        from .resultcache import bump
+
+        try:
+            AnalyticsEvent.objects.bulk_create([AnalyticsEvent(**row) for row in batch])
+            bump(AnalyticsEvent)
+        except Exception:
+            logger.exception("Dropping %d buffered analytics events after a failed write", len(batch))
+            self._count("errors")
+            self._count("dropped", len(batch))
+            close_old_connections()
+        else:
+            self._count("written", len(batch))
+            self._count("flushes")
+
+    def flush(self):
+        """Write everything currently queued in the calling thread."""
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._write(batch)
+
+    def shutdown(self, timeout=10.0):
+        """Stop the writer thread and flush whatever is still queued."""
+        thread = self._thread
+        self._stop.set()
+        self._wake.set()
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout)
+        self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                options = {**DEFAULTS, **getattr(settings, "ANALYTICS_EVENT_BUFFER", {})}
+                _buffer = EventBuffer(
+                    max_size=options["MAX_SIZE"],
+                    batch_size=options["BATCH_SIZE"],
+                    flush_interval=options["FLUSH_INTERVAL"],
+                    block_timeout=options["BLOCK_TIMEOUT"],
+                )
+    return _buffer
+
+
+def track(event_name, **kwargs):
+    """Record an analytics event without touching the database on this thread."""
+    return get_buffer().track(event_name, **kwargs)
+
+
+def shutdown():
+    if _buffer is not None:
+        _buffer.shutdown()
+
+
+def with_lifespan_flush(app):
+    """Wrap an ASGI app so ``lifespan.shutdown`` flushes the event buffer."""
+
+    async def application(scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await sync_to_async(shutdown, thread_sensitive=False)()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    return application
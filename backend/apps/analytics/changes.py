@@ -0,0 +1,287 @@
+"""In-process change broadcast feeding the server-sent-events stream.
+
+Model signals on the streamed models publish a small notification
+(``{"model", "op", "id", "project"}``) once the writing transaction commits.
+:class:`Broadcast` hands it to the subscribed streams that want it, by
+scheduling ``put_nowait`` on the subscriber's event loop, so a connection
+costs one ``asyncio.Queue`` and no thread. A subscriber that falls
+``QUEUE_SIZE`` notifications behind is marked as overflowed and told to
+resync instead of blocking the publisher.
+
+A stream only sees changes of projects its user can see. Every streamed
+model leads to a project model (:data:`PROJECT_PATHS`), and every project
+model has an access rule (:data:`PROJECT_ACCESS`): an analytics project is
+visible to its owner, an ``apps.projects`` project to the users in its
+``ProjectMembership`` rows. Apps stream their own models with
+:func:`register`. Before a notification is queued, the rule is asked which
+of the subscribed users may see its project, in one query per project model
+for all the notifications of a write; rows without a project reach nobody.
+A stream opened with ``?project=`` is checked against the same rule when it
+subscribes, and is indexed by that project. Access is withdrawn when the
+session ends: logging out, or the user being deactivated or deleted, closes
+their streams (:meth:`Broadcast.revoke`).
+
+Only writes made in this process are seen; a deployment with several
+workers needs a shared transport (e.g. PostgreSQL LISTEN/NOTIFY) in front of
+:meth:`Broadcast.publish`.
+"""
+import asyncio
+import itertools
+import threading
+from collections import defaultdict
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from . import deletion, models
+
+QUEUE_SIZE = 1000
+
+
+def owned_pairs(project_ids, user_ids, batch=None):
+    """``(project, user)`` pairs among ``project_ids`` x ``user_ids`` where the user owns the analytics project.
+
+    Projects removed by ``batch`` (a delete still in progress) are judged by
+    their deleted rows.
+    """
+    manager = models.Project._base_manager.using(batch.using) if batch is not None else models.Project._base_manager
+    pairs = set(manager.filter(pk__in=project_ids, owner_id__in=user_ids).values_list("pk", "owner_id"))
+    for pk in project_ids if batch is not None else ():
+        project = batch.get(models.Project, pk)
+        if project is not None and project.owner_id in user_ids:
+            pairs.add((pk, project.owner_id))
+    return pairs
+
+
+# Streamed model -> lookup from a row to its project (None: the row is the project).
+PROJECT_PATHS = {
+    models.Project: None,
+    models.Task: "project",
+    models.TimeEntry: "task__project",
+    models.SalesOrder: "project",
+    models.SalesOrderLine: "order__project",
+    models.PurchaseOrder: "project",
+    models.PurchaseOrderLine: "order__project",
+    models.Invoice: "project",
+    models.InvoiceLine: "invoice__project",
+    models.Expense: "project",
+}
+# Project model -> ``access(project_ids, user_ids, batch=None)``, the visible (project, user) pairs.
+PROJECT_ACCESS = {models.Project: owned_pairs}
+
+
+class Subscription:
+    def __init__(self, loop, user_id, session_key=None, project=None):
+        self.loop = loop
+        self.user_id = user_id
+        self.session_key = session_key
+        # Only events of this ``(project model, pk)`` (None: of every visible project).
+        self.project = project
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+        self.revoked = False
+
+    def _offer(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def _revoke(self):
+        self.revoked = True
+        # Wakes a stream waiting on an empty queue; a full one is woken anyway.
+        self._offer(None)
+
+
+class Broadcast:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._everything = set()
+        self._by_project = defaultdict(set)
+        self._by_user = defaultdict(set)
+        self._ids = itertools.count(1)
+        self.stats = {"published": 0, "delivered": 0}
+
+    def __bool__(self):
+        return bool(self._by_user)
+
+    def user_ids(self):
+        """Users with at least one open stream."""
+        with self._lock:
+            return set(self._by_user)
+
+    def subscribe(self, user_id, session_key=None, project=None):
+        subscription = Subscription(asyncio.get_running_loop(), user_id, session_key, project)
+        with self._lock:
+            if project is None:
+                self._everything.add(subscription)
+            else:
+                self._by_project[project].add(subscription)
+            self._by_user[user_id].add(subscription)
+        return subscription
+
+    def _discard(self, subscription):
+        if subscription.project is None:
+            self._everything.discard(subscription)
+        else:
+            watchers = self._by_project.get(subscription.project)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self._by_project[subscription.project]
+        streams = self._by_user.get(subscription.user_id)
+        if streams is not None:
+            streams.discard(subscription)
+            if not streams:
+                del self._by_user[subscription.user_id]
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._discard(subscription)
+
+    def _schedule(self, subscription, callback, *args):
+        try:
+            subscription.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The subscriber's loop has shut down.
+            self.unsubscribe(subscription)
+
+    def publish(self, event, project, users):
+        """Queue ``event`` of ``project`` (``(project model, pk)``) for the streams of ``users``.
+
+        Thread-safe; may be called from any thread or event loop.
+        """
+        item = (next(self._ids), event)
+        with self._lock:
+            targets = [subscription for subscription in self._everything if subscription.user_id in users]
+            targets.extend(
+                subscription for subscription in self._by_project.get(project, ()) if subscription.user_id in users
+            )
+            self.stats["published"] += 1
+            self.stats["delivered"] += len(targets)
+        for subscription in targets:
+            self._schedule(subscription, subscription._offer, item)
+
+    def revoke(self, user_id, session_key=None):
+        """Close the streams of ``user_id`` (only those of ``session_key`` when given)."""
+        with self._lock:
+            targets = [
+                subscription
+                for subscription in self._by_user.get(user_id, ())
+                if session_key is None or subscription.session_key == session_key
+            ]
+            for subscription in targets:
+                self._discard(subscription)
+        for subscription in targets:
+            self._schedule(subscription, subscription._revoke)
+
+
+broadcast = Broadcast()
+
+
+def _concrete(model):
+    return model._meta.concrete_model
+
+
+def _project_model(model, path):
+    for name in path.split("__") if path else ():
+        model = model._meta.get_field(name).related_model
+    return _concrete(model)
+
+
+def audience(project_model, project_ids, batch=None):
+    """``{project pk: user ids}``: which users with an open stream may see each of ``project_ids``."""
+    users = broadcast.user_ids()
+    project_ids = {pk for pk in project_ids if pk is not None}
+    visible = defaultdict(set)
+    if users and project_ids:
+        for project, user in PROJECT_ACCESS[project_model](project_ids, users, batch):
+            visible[project].add(user)
+    return visible
+
+
+def can_see(project_model, project_id, user_id):
+    return bool(PROJECT_ACCESS[_concrete(project_model)]({project_id}, {user_id}))
+
+
+def notify(model, instances, op, using=None, batch=None):
+    """Publish ``op`` ("upsert" or "delete") for ``instances`` after the current transaction commits.
+
+    Deletes are judged while their rows (and membership rows removed with
+    them) are still in ``batch``; upserts by the committed state.
+    """
+    concrete = _concrete(model)
+    if not broadcast or concrete not in PROJECT_PATHS or not instances:
+        return
+    label = concrete._meta.label_lower
+    path = PROJECT_PATHS[concrete]
+    project_model = _project_model(concrete, path)
+    projects = deletion.follow(concrete, instances, path, batch)
+    events = [
+        {"model": label, "op": op, "id": obj.pk, "project": project} for obj, project in zip(instances, projects)
+    ]
+    visible = audience(project_model, projects, batch) if batch is not None else None
+
+    def send():
+        users = visible if visible is not None else audience(project_model, projects)
+        for event in events:
+            broadcast.publish(event, (project_model, event["project"]), users.get(event["project"], ()))
+
+    transaction.on_commit(send, using=using)
+
+
+def _saved(sender, instance, using, **kwargs):
+    notify(sender, [instance], "upsert", using)
+
+
+def _deleted(sender, instances, batch):
+    notify(sender, instances, "delete", batch.using, batch)
+
+
+def _logged_out(sender, request, user, **kwargs):
+    if user is not None:
+        broadcast.revoke(user.pk, getattr(request.session, "session_key", None))
+
+
+def _user_saved(sender, instance, **kwargs):
+    if not instance.is_active:
+        broadcast.revoke(instance.pk)
+
+
+def _user_deleted(sender, instance, **kwargs):
+    broadcast.revoke(instance.pk)
+
+
+def _connect_model(model):
+    label = model._meta.label
+    post_save.connect(_saved, sender=model, dispatch_uid=f"changes.saved.{label}")
+    deletion.register(model, _deleted, "changes.deleted")
+
+
+def register(model, project_path=None, access=None):
+    """Stream changes of ``model`` (and its proxies).
+
+    ``project_path`` leads from a row to its project (None: the row is the
+    project). ``access(project_ids, user_ids, batch=None)`` is the visibility
+    rule of a model that is a project.
+    """
+    concrete = _concrete(model)
+    PROJECT_PATHS[concrete] = project_path
+    if access is not None:
+        PROJECT_ACCESS[concrete] = access
+    for candidate in apps.get_models():
+        if _concrete(candidate) is concrete:
+            _connect_model(candidate)
+
+
+def connect():
+    User = get_user_model()
+    user_logged_out.connect(_logged_out, dispatch_uid="changes.logged_out")
+    post_save.connect(_user_saved, sender=User, dispatch_uid="changes.user_saved")
+    post_delete.connect(_user_deleted, sender=User, dispatch_uid="changes.user_deleted")
+    for model in apps.get_models():
+        if _concrete(model) in PROJECT_PATHS:
+            _connect_model(model)
@@ -0,0 +1,69 @@
+"""Conditional GET (ETag / If-None-Match) for list and detail endpoints.
+
+The validator is known before anything is read from the database: a hash of
+the normalized request (path, query string, user, media type) and the
+result cache's version of every table the response reads
+(``conditional_models``, see :mod:`apps.analytics.resultcache`). The versions
+move on every write to those tables, so a matching ``If-None-Match`` is
+answered with 304 from a cache lookup alone, without the page query or any
+serialization. A 200 carries the validator taken before its rows were read,
+so a write racing the read costs the client one more full response, never a
+stale 304.
+
+Writes that bypass the ORM signals call ``resultcache.bump`` for the tables
+they touch, as they already must for the result cache.
+"""
+import hashlib
+
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def _matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+class ConditionalGetMixin:
+    # Models whose tables list/retrieve responses read (default: the viewset's model).
+    conditional_models = None
+
+    def __init_subclass__(cls, **kwargs):
+        from .resultcache import watch
+
+        super().__init_subclass__(**kwargs)
+        queryset = getattr(cls, "queryset", None)
+        if cls.conditional_models is None and queryset is not None:
+            cls.conditional_models = [queryset.model]
+        watch(*(cls.conditional_models or []))
+
+    def compute_etag(self, request):
+        from .resultcache import versions
+
+        params = sorted((name, value) for name in request.GET for value in request.GET.getlist(name))
+        user = getattr(request.user, "pk", None)
+        media_type = getattr(request, "accepted_media_type", None)
+        state = (type(self).__qualname__, request.path, params, user, media_type, versions(self.conditional_models))
+        return 'W/"%s"' % hashlib.md5(repr(state).encode()).hexdigest()
+
+    def conditional_response(self, request, render):
+        etag = self.compute_etag(request)
+        if _matches(request.headers.get("If-None-Match"), etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response = render()
+        if response.status_code == status.HTTP_200_OK:
+            response["ETag"] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        # get_object() turns a malformed or unknown lookup value into a 404.
+        return self.conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
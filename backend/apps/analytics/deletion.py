@@ -0,0 +1,133 @@
+"""Set-based side effects of deletes.
+
+Django sends ``post_delete`` once per row, so a receiver that writes per row
+(a header total, a tombstone) makes a delete cost one query per row.
+Handlers registered here are called instead once per model with every row of
+that model the delete removed, after the last row is gone and still inside
+the delete's transaction. The collector sends ``pre_delete`` for every row
+before it deletes any, so counting those tells when the last ``post_delete``
+has arrived. The counting receivers are connected only to registered models,
+so deletes of other models keep Django's fast-delete path.
+
+A handler is called as ``handler(sender, instances, batch)``; ``batch`` can
+tell whether another row (e.g. the header of a deleted line) is removed by
+the same delete, and :func:`follow` reads lookups through such rows.
+"""
+import threading
+from collections import defaultdict
+
+from django.db import connections
+from django.db.models.signals import post_delete, pre_delete
+
+_handlers = defaultdict(dict)
+_local = threading.local()
+
+
+class Batch:
+    """The rows removed by one delete, grouped by sender."""
+
+    def __init__(self, origin, using):
+        # Holding the origin keeps its id() from being reused while the batch is open.
+        self.origin = origin
+        self.using = using
+        self.depth = len(connections[using].atomic_blocks)
+        self.expected = 0
+        self.received = 0
+        self.rows = defaultdict(list)
+        self._by_key = {}
+
+    def add(self, sender, instance):
+        self.rows[sender].append(instance)
+        self._by_key[(sender._meta.concrete_model, instance.pk)] = instance
+        self.received += 1
+
+    def get(self, model, pk):
+        """The ``model`` row ``pk`` if this delete removed it, else None."""
+        return self._by_key.get((model._meta.concrete_model, pk))
+
+    def contains(self, model, pk):
+        return (model._meta.concrete_model, pk) in self._by_key
+
+    def flush(self):
+        for sender, instances in list(self.rows.items()):
+            for handler in _handlers[sender].values():
+                handler(sender, instances, self)
+
+
+def _batches():
+    batches = getattr(_local, "batches", None)
+    if batches is None:
+        batches = _local.batches = {}
+    return batches
+
+
+def _expect(sender, instance, using, origin=None, **kwargs):
+    batches = _batches()
+    key = (using, id(origin))
+    batch = batches.get(key)
+    if batch is None or batch.received:
+        batch = Batch(origin, using)
+        # A batch left by a delete that failed midway: its transaction block is gone.
+        for stale in [k for k, b in batches.items() if b.using == using and b.depth >= batch.depth]:
+            del batches[stale]
+        batches[key] = batch
+    batch.expected += 1
+
+
+def _collect(sender, instance, using, origin=None, **kwargs):
+    batches = _batches()
+    key = (using, id(origin))
+    batch = batches.get(key)
+    if batch is None:
+        # Connected mid-delete or sent by hand: handle the row on its own.
+        batch = batches[key] = Batch(origin, using)
+        batch.expected = 1
+    batch.add(sender, instance)
+    if batch.received >= batch.expected:
+        del batches[key]
+        batch.flush()
+
+
+def watch(sender):
+    """Collect deleted ``sender`` rows into batches so handlers can look them up."""
+    label = sender._meta.label
+    pre_delete.connect(_expect, sender=sender, dispatch_uid=f"deletion.expect.{label}")
+    post_delete.connect(_collect, sender=sender, dispatch_uid=f"deletion.collect.{label}")
+
+
+def register(sender, handler, uid):
+    """Call ``handler`` once per delete with the removed ``sender`` rows."""
+    _handlers[sender][uid] = handler
+    watch(sender)
+
+
+def follow(model, instances, path, batch=None):
+    """Value of the ``path`` lookup (e.g. ``"task__project"``) on each of ``instances``.
+
+    A ``path`` of None gives the instances' own pks. Relations already
+    loaded, or deleted by the same ``batch``, are followed in memory; the rest
+    cost one query per hop for all instances together.
+    """
+    if path is None:
+        return [instance.pk for instance in instances]
+    first, _, rest = path.partition("__")
+    field = model._meta.get_field(first)
+    values = [getattr(instance, field.attname) for instance in instances]
+    if not rest:
+        return values
+    related = field.related_model
+    parents, missing = {}, set()
+    for instance, value in zip(instances, values):
+        if value is None or value in parents:
+            continue
+        if field.is_cached(instance):
+            parents[value] = getattr(instance, first)
+        elif batch is not None and batch.contains(related, value):
+            parents[value] = batch.get(related, value)
+        else:
+            missing.add(value)
+    resolved = dict(zip(parents, follow(related, list(parents.values()), rest, batch)))
+    if missing:
+        manager = related._base_manager.using(batch.using) if batch is not None else related._base_manager
+        resolved.update(manager.filter(pk__in=missing).values_list("pk", rest))
+    return [resolved.get(value) for value in values]
@@ -0,0 +1,182 @@
+"""Batch ingestion of AnalyticsEvent rows.
+
+Bodies are consumed as a stream of records (NDJSON lines or the items of a
+JSON array, decoded incrementally chunk by chunk). Each record is validated
+with one shared serializer instance, foreign keys are resolved once per
+chunk and valid rows are written with ``bulk_create``. Invalid records are
+reported by line number and never abort the rest of the batch.
+"""
+import codecs
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers as drf_serializers
+
+from . import models, resultcache, serializers
+
+DEFAULT_CHUNK_SIZE = 500
+READ_SIZE = 64 * 1024
+# An item that is still undecodable after this many characters is treated as malformed.
+MAX_ITEM_SIZE = 1024 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def iter_ndjson(stream):
+    """Yield ``(line_number, record_or_exception)`` for each non-blank NDJSON line."""
+    for number, raw in enumerate(stream, start=1):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            yield number, json.loads(raw)
+        except ValueError as exc:
+            yield number, exc
+
+
+def _skip_whitespace(buffer, pos):
+    while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+def _may_continue(record, buffer, end):
+    """True if ``record`` is a number that the rest of the body could still extend."""
+    if isinstance(record, bool) or not isinstance(record, (int, float)):
+        return False
+    rest = buffer[end:].lstrip(_WHITESPACE)
+    return not rest or rest[0] not in ",]"
+
+
+def iter_json_array(stream, read_size=READ_SIZE):
+    """Yield ``(index, record)`` for each item of a JSON array body (1-based).
+
+    The body is read ``read_size`` bytes at a time and each item is decoded
+    with ``raw_decode`` as soon as it is complete, so memory holds one chunk
+    plus the item being decoded rather than the whole array. A syntax error
+    ends the stream with ``(index, exception)``; items before it are kept.
+    """
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos, eof = "", 0, False
+    index, expect = 0, "["
+
+    def more():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(read_size)
+        eof = not chunk
+        buffer = buffer[pos:] + text.decode(chunk or b"", final=eof)
+        pos = 0
+
+    while True:
+        pos = _skip_whitespace(buffer, pos)
+        if pos >= len(buffer):
+            if eof:
+                yield max(index, 1), ValueError("Unexpected end of body; expected a JSON array of events.")
+                return
+            more()
+            continue
+        char = buffer[pos]
+        if expect == "[":
+            if char != "[":
+                yield 1, ValueError("Expected a JSON array of events.")
+                return
+            pos, expect = pos + 1, "item or ]"
+        elif char == "]" and expect in ("item or ]", ", or ]"):
+            return
+        elif expect == ", or ]":
+            if char != ",":
+                yield index, ValueError(f"Expected ',' or ']' after item {index}.")
+                return
+            pos, expect = pos + 1, "item"
+        else:
+            try:
+                record, end = _decoder.raw_decode(buffer, pos)
+            except ValueError as exc:
+                if eof or len(buffer) - pos > MAX_ITEM_SIZE:
+                    yield index + 1, exc
+                    return
+                more()
+                continue
+            if _may_continue(record, buffer, end) and not eof:
+                # A number may continue in the next chunk; decode it again with more input.
+                more()
+                continue
+            index += 1
+            yield index, record
+            pos, expect = end, ", or ]"
+
+
+def _existing_pks(model, pks):
+    if not pks:
+        return set()
+    return set(model.objects.filter(pk__in=pks).values_list("pk", flat=True))
+
+
+def _coerce_keys(pending, errors):
+    """Convert ``user`` / ``project`` to primary-key values, dropping rows where that fails."""
+    fields = {"user": get_user_model()._meta.pk, "project": models.Project._meta.pk}
+    kept = []
+    for line, row in pending:
+        try:
+            for name, pk in fields.items():
+                if row.get(name) not in (None, ""):
+                    row[name] = pk.to_python(row[name])
+                else:
+                    row[name] = None
+        except DjangoValidationError:
+            errors.append({"line": line, "errors": {name: [f'Incorrect type for pk "{row[name]}".']}})
+            continue
+        kept.append((line, row))
+    return kept
+
+
+def _flush(pending, errors):
+    """Resolve foreign keys for ``pending`` rows and bulk insert the valid ones."""
+    pending = _coerce_keys(pending, errors)
+    user_pks = _existing_pks(get_user_model(), {row["user"] for _, row in pending if row["user"] is not None})
+    project_pks = _existing_pks(models.Project, {row["project"] for _, row in pending if row["project"] is not None})
+
+    objs = []
+    for line, row in pending:
+        user, project = row.pop("user"), row.pop("project")
+        if user is not None and user not in user_pks:
+            errors.append({"line": line, "errors": {"user": [f'Invalid pk "{user}" - object does not exist.']}})
+            continue
+        if project is not None and project not in project_pks:
+            errors.append({"line": line, "errors": {"project": [f'Invalid pk "{project}" - object does not exist.']}})
+            continue
+        objs.append(models.AnalyticsEvent(user_id=user, project_id=project, **row))
+    models.AnalyticsEvent.objects.bulk_create(objs)
+    if objs:
+        resultcache.bump(models.AnalyticsEvent)
+    return len(objs)
+
+
+def ingest_events(records, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Validate and insert ``(line, record)`` pairs; returns a per-batch report."""
+    validator = serializers.AnalyticsEventIngestSerializer()
+    received = created = 0
+    errors = []
+    pending = []
+    for line, record in records:
+        received += 1
+        if isinstance(record, Exception):
+            errors.append({"line": line, "errors": {"non_field_errors": [str(record)]}})
+            continue
+        if not isinstance(record, dict):
+            errors.append({"line": line, "errors": {"non_field_errors": ["Expected a JSON object."]}})
+            continue
+        try:
+            pending.append((line, validator.run_validation(record)))
+        except drf_serializers.ValidationError as exc:
+            errors.append({"line": line, "errors": exc.detail})
+            continue
+        if len(pending) >= chunk_size:
+            created += _flush(pending, errors)
+            pending = []
+    if pending:
+        created += _flush(pending, errors)
+    errors.sort(key=lambda error: error["line"])
+    return {"received": received, "created": created, "errors": errors}
@@ -0,0 +1,108 @@
+"""Labor cost: logged minutes priced at the user's ``hourly_rate``, in SQL.
+
+Each time entry is worth ``duration_minutes * hourly_rate / 60``. To keep the
+result exact on every backend (SQLite stores decimals as floating point) the
+database sums integer "cent-minutes" — ``duration_minutes * round(rate * 100)``
+— and the division by 6000 happens once per result row in Python with
+``Decimal``, rounding half-up to cents.
+
+Rates are read at query time, so a rate change reprices past entries too.
+They come from the user's ``hourly_rate`` column when the configured user
+model has one, otherwise from the user's
+:class:`~apps.analytics.models.LaborRate` row (joined in the same query).
+Users without a rate are priced at ``ANALYTICS_DEFAULT_HOURLY_RATE``
+(default 0).
+
+Amounts leave the API as fixed-point strings (:func:`money_strings`), as
+serializer ``DecimalField`` values do, never as binary floats.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import BigIntegerField, DecimalField, F, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Round, TruncMonth, TruncWeek
+
+CENT = Decimal("0.01")
+
+# ?by= keys -> TimeEntry expression to group on.
+GROUPS = {
+    "project": F("task__project_id"),
+    "task": F("task_id"),
+    "user": F("user_id"),
+    "date": F("date"),
+    "week": TruncWeek("date"),
+    "month": TruncMonth("date"),
+}
+
+
+def rate_field():
+    """Lookup from a user to their hourly rate: the user model's column or its LaborRate row."""
+    try:
+        get_user_model()._meta.get_field("hourly_rate")
+    except FieldDoesNotExist:
+        return "labor_rate__hourly_rate"
+    return "hourly_rate"
+
+
+def rate_expression(prefix="user__"):
+    """Hourly rate of the entry's user (or the configured default)."""
+    default = Decimal(str(getattr(settings, "ANALYTICS_DEFAULT_HOURLY_RATE", 0)))
+    return Coalesce(
+        F(f"{prefix}{rate_field()}"), Value(default), output_field=DecimalField(max_digits=12, decimal_places=2)
+    )
+
+
+def cost_units(prefix=""):
+    """Integer cent-minutes of one time entry; ``prefix`` reaches TimeEntry from another model."""
+    rate_cents = Cast(Round(rate_expression(f"{prefix}user__") * 100), BigIntegerField())
+    return F(f"{prefix}duration_minutes") * rate_cents
+
+
+def to_money(units):
+    return (Decimal(units or 0) / 6000).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def money_strings(data):
+    """``data`` with every Decimal (all of them amounts) as a fixed-point string, e.g. ``"12.50"``."""
+    if isinstance(data, Decimal):
+        return str(data.quantize(CENT, rounding=ROUND_HALF_UP))
+    if isinstance(data, dict):
+        return {key: money_strings(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [money_strings(value) for value in data]
+    return data
+
+
+def labor_aggregates(prefix=""):
+    """``minutes`` and ``labor_units`` aggregates for ``.aggregate()`` / ``.annotate()``."""
+    return {
+        "minutes": Coalesce(Sum(f"{prefix}duration_minutes"), 0),
+        "labor_units": Coalesce(Sum(cost_units(prefix), output_field=BigIntegerField()), 0),
+    }
+
+
+def labor_cost(entries, by=()):
+    """Minutes and cost of ``entries`` (a TimeEntry queryset), in one query.
+
+    With ``by`` (any of :data:`GROUPS`) returns one row per group, otherwise a
+    single totals dict.
+    """
+    unknown = set(by) - set(GROUPS)
+    if unknown:
+        raise ValueError(f"Unknown grouping: {', '.join(sorted(unknown))}")
+    entries = entries.order_by()
+    if not by:
+        totals = entries.aggregate(**labor_aggregates())
+        return {"minutes": totals["minutes"], "cost": to_money(totals["labor_units"])}
+    rows = (
+        entries.annotate(**{f"by_{key}": GROUPS[key] for key in by})
+        .values(*(f"by_{key}" for key in by))
+        .annotate(**labor_aggregates())
+        .order_by(*(f"by_{key}" for key in by))
+    )
+    return [
+        {**{key: row[f"by_{key}"] for key in by}, "minutes": row["minutes"], "cost": to_money(row["labor_units"])}
+        for row in rows
+    ]
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apps.analytics import partitions
+
+
+class Command(BaseCommand):
+    help = "Create upcoming AnalyticsEvent partitions and archive months older than the retention window."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-months",
+            type=int,
+            default=None,
+            help="Months kept in the hot table (defaults to ANALYTICS_EVENT_RETENTION_MONTHS).",
+        )
+        parser.add_argument("--months-ahead", type=int, default=2, help="Future monthly partitions to pre-create.")
+
+    def handle(self, *args, **options):
+        for name in partitions.ensure_partitions(months_ahead=options["months_ahead"]):
+            self.stdout.write(f"Created partition {name}")
+        for archive in partitions.archive_expired(retention=options["retention_months"]):
+            self.stdout.write(f"Archived {archive.row_count} events for {archive.month:%Y-%m} to {archive.path}")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.analytics import models, sync
+
+
+class Command(BaseCommand):
+    help = "Delete delete-tombstones older than ANALYTICS_TOMBSTONE_RETENTION_DAYS."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - sync.retention()
+        deleted, _ = models.Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(f"Pruned {deleted} tombstones older than {cutoff:%Y-%m-%d %H:%M}")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Round
+
+from apps.analytics import models, resultcache
+
+DOCUMENTS = [
+    (models.SalesOrder, models.SalesOrderLine, "order"),
+    (models.PurchaseOrder, models.PurchaseOrderLine, "order"),
+    (models.Invoice, models.InvoiceLine, "invoice"),
+]
+
+
+class Command(BaseCommand):
+    help = "Recompute line_total on every order/invoice line and total_amount on every header that has lines."
+
+    def handle(self, *args, **options):
+        money = DecimalField(max_digits=14, decimal_places=2)
+        for header_model, line_model, header_field in DOCUMENTS:
+            with transaction.atomic():
+                # ROUND() is half away from zero, the ROUND_HALF_UP of DocumentLine.compute_line_total.
+                lines = line_model.objects.update(
+                    line_total=Round(ExpressionWrapper(F("quantity") * F("unit_price"), output_field=money), 2)
+                )
+                line_sum = (
+                    line_model.objects.filter(**{header_field: OuterRef("pk")})
+                    .order_by()
+                    .values(header_field)
+                    .annotate(total=Sum("line_total"))
+                    .values("total")
+                )
+                headers = header_model.objects.filter(pk__in=line_model.objects.values(header_field)).update(
+                    total_amount=Coalesce(Subquery(line_sum, output_field=money), 0, output_field=money)
+                )
+                resultcache.bump(header_model, line_model)
+            self.stdout.write(f"{header_model.__name__}: {lines} lines, {headers} headers recomputed")
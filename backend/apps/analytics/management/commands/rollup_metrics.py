@@ -0,0 +1,41 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from apps.analytics.rollup import run_until_caught_up
+from apps.analytics.sync import parse_timestamp
+
+
+class Command(BaseCommand):
+    help = "Roll new AnalyticsEvent rows into hourly and daily AggregatedMetric buckets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-hours", type=int, default=24, help="Hours of events folded per transaction.")
+        parser.add_argument(
+            "--since",
+            help="Recount buckets from this ISO date/datetime (for events later than the late-event window).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running and repeat every N seconds (0 runs once and exits).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_timestamp(options["since"], "since")
+        except ValidationError as exc:
+            raise CommandError(f"Invalid --since: {options['since']}") from exc
+        while True:
+            stats = run_until_caught_up(max_span=timedelta(hours=options["max_hours"]), since=since)
+            since = None
+            self.stdout.write(
+                "Rolled up {events} events ({late_events} late): "
+                "{hourly_buckets} hourly / {daily_buckets} daily buckets, checkpoint at {checkpoint}".format(**stats)
+            )
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
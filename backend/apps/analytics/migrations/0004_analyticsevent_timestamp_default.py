@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_rollupcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analyticsevent',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_analyticsevent_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateTimeField(db_index=True)),
+                ('path', models.CharField(max_length=1024, unique=True)),
+                ('row_count', models.BigIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['month'],
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+from django.db import migrations
+
+TABLE = "analytics_analyticsevent"
+LEGACY = f"{TABLE}_legacy"
+SEQUENCE = f"{TABLE}_id_seq"
+
+
+def _add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_events(apps, schema_editor):
+    """Rebuild the event table as a monthly range partition on ``timestamp``.
+
+    PostgreSQL only; other backends keep the plain table and archive by
+    deleting rows (see apps.analytics.partitions).
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [TABLE]
+        )
+        pkey = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s", [TABLE, pkey]
+        )
+        index_defs = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f'SELECT min("timestamp"), max(id) FROM "{TABLE}"')
+        oldest, max_id = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{LEGACY}"')
+        cursor.execute(f'ALTER TABLE "{LEGACY}" RENAME CONSTRAINT "{pkey}" TO "{LEGACY}_pkey"')
+        for name, _ in index_defs:
+            cursor.execute(f'DROP INDEX "{name}"')
+
+        cursor.execute(f'CREATE TABLE "{TABLE}" (LIKE "{LEGACY}" INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")')
+        cursor.execute(f'CREATE SEQUENCE "{TABLE}_part_id_seq" OWNED BY "{TABLE}".id')
+        cursor.execute(f"SELECT setval('\"{TABLE}_part_id_seq\"', %s, false)", [(max_id or 0) + 1])
+        cursor.execute(f"ALTER TABLE \"{TABLE}\" ALTER COLUMN id SET DEFAULT nextval('\"{TABLE}_part_id_seq\"')")
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{pkey}" PRIMARY KEY (id, "timestamp")')
+
+        now = datetime.now(timezone.utc)
+        month = datetime((oldest or now).year, (oldest or now).month, 1, tzinfo=timezone.utc)
+        last = _add_months(datetime(now.year, now.month, 1, tzinfo=timezone.utc), 2)
+        while month <= last:
+            cursor.execute(
+                f'CREATE TABLE "{TABLE}_p{month:%Y%m}" PARTITION OF "{TABLE}" '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+            )
+            month = _add_months(month, 1)
+        cursor.execute(f'CREATE TABLE "{TABLE}_default" PARTITION OF "{TABLE}" DEFAULT')
+
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{LEGACY}"')
+        for _, definition in index_defs:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{name}" {definition}')
+        cursor.execute(f'DROP TABLE "{LEGACY}"')
+        cursor.execute(f'ALTER SEQUENCE "{TABLE}_part_id_seq" RENAME TO "{SEQUENCE}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_eventarchive'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_events, migrations.RunPython.noop),
+    ]
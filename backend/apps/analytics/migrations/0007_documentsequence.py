@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_partition_analyticsevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(max_length=32)),
+                ('year', models.PositiveSmallIntegerField()),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('doc_type', 'year')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:09
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0010_timeentry_user_date_index'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='rollupcheckpoint',
+            name='last_event_id',
+        ),
+    ]
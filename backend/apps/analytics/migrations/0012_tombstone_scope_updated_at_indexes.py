@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:27
+
+import django.core.serializers.json
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0011_rollup_timestamp_mark'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='tombstone',
+            name='analytics_tombstone_sync_idx',
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='audience',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='scope',
+            field=models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder),
+        ),
+        migrations.AddIndex(
+            model_name='aggregatedmetric',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_a_updated_fd2f20_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_c_updated_5fb53c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_e_updated_6b7d81_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_i_updated_a8406c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceline',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_i_updated_903677_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_p_updated_294514_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_p_updated_d1eb3b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_p_updated_0e21ea_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderline',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_p_updated_96dcb1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_s_updated_912e3f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesorderline',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_s_updated_989d9c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_t_updated_79fa2a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timeentry',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_t_updated_8f082e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['model', 'audience', 'deleted_at'], name='analytics_tombstone_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vendor',
+            index=models.Index(fields=['updated_at', 'id'], name='analytics_v_updated_d5a0ca_idx'),
+        ),
+    ]
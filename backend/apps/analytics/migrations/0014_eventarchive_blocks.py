@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0013_laborrate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventarchive',
+            name='blocks',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
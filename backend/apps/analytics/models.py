@@ -1,7 +1,20 @@
-from django.db import models
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils import timezone
 
+from .labor import labor_aggregates, to_money
+
+
+def _money_sum(field, **extra):
+	"""Sum of a money column that yields Decimal('0.00') instead of NULL."""
+	return Coalesce(Sum(field, **extra), Value(Decimal("0.00")), output_field=models.DecimalField(max_digits=14, decimal_places=2))
+
+
 # Core project / task / time tracking
 class Project(models.Model):
 	STATUS_CHOICES = [
@@ -25,11 +38,53 @@ class Project(models.Model):
 
 	class Meta:
 		ordering = ["-created_at"]
-		indexes = [models.Index(fields=["status"]), models.Index(fields=["owner"])]
+		indexes = [models.Index(fields=["status"]), models.Index(fields=["owner"]), models.Index(fields=["updated_at", "id"])]
 
 	def __str__(self):
 		return self.name
 
+	def summary(self):
+		"""Financial and progress summary for this project.
+
+		Runs a fixed number of aggregate queries (invoices, orders, expenses,
+		time entries, tasks) regardless of how many rows the project has.
+		"""
+		billing = Invoice.objects.filter(project=self).exclude(status="cancelled").aggregate(
+			revenue=_money_sum("total_amount", filter=Q(invoice_type="customer")),
+			bills=_money_sum("total_amount", filter=Q(invoice_type="vendor")),
+		)
+		sales = SalesOrder.objects.filter(project=self).exclude(status="cancelled").aggregate(total=_money_sum("total_amount"))
+		purchases = PurchaseOrder.objects.filter(project=self).exclude(status="cancelled").aggregate(total=_money_sum("total_amount"))
+		expenses = Expense.objects.filter(project=self).aggregate(total=_money_sum("amount"))
+		labor = TimeEntry.objects.filter(task__project=self).aggregate(**labor_aggregates())
+		task_counts = dict(self.tasks.order_by().values_list("status").annotate(n=Count("id")))
+
+		spent = billing["bills"] + expenses["total"]
+		labor_cost = to_money(labor["labor_units"])
+		burn = None
+		if self.budget:
+			burn = float(spent / self.budget * 100)
+		return {
+			"project": self.pk,
+			"revenue": billing["revenue"],
+			"bills": billing["bills"],
+			"expenses": expenses["total"],
+			"sales_orders": sales["total"],
+			"purchase_orders": purchases["total"],
+			"profit": billing["revenue"] - spent,
+			"labor_minutes": labor["minutes"],
+			"labor_cost": labor_cost,
+			"margin": billing["revenue"] - spent - labor_cost,
+			"budget": self.budget,
+			"spent": spent,
+			"budget_burn_pct": burn,
+			"tasks": {
+				"total": sum(task_counts.values()),
+				"done": task_counts.get("done", 0),
+				"by_status": task_counts,
+			},
+		}
+
 
 class Task(models.Model):
 	STATUS_CHOICES = [
@@ -52,7 +107,7 @@ class Task(models.Model):
 	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
-		indexes = [models.Index(fields=["project", "status"]), models.Index(fields=["assignee"])]
+		indexes = [models.Index(fields=["project", "status"]), models.Index(fields=["assignee"]), models.Index(fields=["updated_at", "id"])]
 		ordering = ["-created_at"]
 
 	def __str__(self):
@@ -67,15 +122,35 @@ class TimeEntry(models.Model):
 	duration_minutes = models.PositiveIntegerField()  # store minutes for precision
 	description = models.TextField(blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
-		indexes = [models.Index(fields=["user", "task", "date"])]
+		indexes = [
+			models.Index(fields=["user", "task", "date"]),
+			# Timesheet range scans: one user's (or everyone's) entries between two dates.
+			models.Index(fields=["user", "date"], name="analytics_te_user_date_idx"),
+			models.Index(fields=["updated_at", "id"]),
+		]
 		ordering = ["-date"]
 
 	def __str__(self):
 		return f"{self.user_id} - {self.task_id} - {self.duration_minutes}m"
 
 
+class LaborRate(models.Model):
+	"""Hourly rate of a user, for user models without an ``hourly_rate`` column.
+
+	``apps.analytics.labor`` prices time entries with it when the configured
+	user model (e.g. ``auth.User``) cannot hold the rate itself.
+	"""
+	user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="labor_rate")
+	hourly_rate = models.DecimalField(max_digits=12, decimal_places=2)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return f"{self.user_id}: {self.hourly_rate}/h"
+
+
 # Catalog: products, customers, vendors
 class Product(models.Model):
 	PRODUCT_TYPE_CHOICES = [
@@ -92,9 +167,10 @@ class Product(models.Model):
 	unit = models.CharField(max_length=32, default="unit")
 	is_active = models.BooleanField(default=True)
 	notes = models.TextField(blank=True)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
-		indexes = [models.Index(fields=["sku"]), models.Index(fields=["product_type"])]
+		indexes = [models.Index(fields=["sku"]), models.Index(fields=["product_type"]), models.Index(fields=["updated_at", "id"])]
 		ordering = ["name"]
 
 	def __str__(self):
@@ -108,8 +184,10 @@ class Customer(models.Model):
 	phone = models.CharField(max_length=64, blank=True)
 	address = models.TextField(blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
+		indexes = [models.Index(fields=["updated_at", "id"])]
 		ordering = ["name"]
 
 	def __str__(self):
@@ -123,14 +201,110 @@ class Vendor(models.Model):
 	phone = models.CharField(max_length=64, blank=True)
 	address = models.TextField(blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
+		indexes = [models.Index(fields=["updated_at", "id"])]
 		ordering = ["name"]
 
 	def __str__(self):
 		return self.name
 
 
+class DocumentLine(models.Model):
+	"""Line item that keeps ``line_total`` and its header's ``total_amount`` in sync.
+
+	Every save applies the change in ``line_total`` to the header with a single
+	``UPDATE ... SET total_amount = total_amount + delta`` that also touches the
+	header's ``updated_at``. Deletes subtract it again with one such UPDATE per
+	header, skipped for headers removed by the same delete (see
+	``apps.analytics.signals``). Values loaded from the database are remembered
+	so an update never has to re-read the line or its siblings.
+
+	Subclasses name their header foreign key in ``header_field`` and may rename
+	the columns with ``total_field``, ``header_total_field`` and
+	``header_touch_field`` (None when the header has no ``updated_at``).
+	"""
+	header_field = None
+	total_field = "line_total"
+	header_total_field = "total_amount"
+	header_touch_field = "updated_at"
+
+	class Meta:
+		abstract = True
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		attname = cls._meta.get_field(cls.header_field).attname
+		if attname in field_names and cls.total_field in field_names:
+			instance._synced = (getattr(instance, attname), getattr(instance, cls.total_field))
+		return instance
+
+	def compute_line_total(self):
+		# Half up, as SQL ROUND() does in recompute_totals.
+		total = Decimal(str(self.quantity)) * Decimal(str(self.unit_price))
+		return total.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+	@classmethod
+	def header_model(cls):
+		return cls._meta.get_field(cls.header_field).related_model
+
+	@classmethod
+	def synced_values(cls, instance):
+		"""``(header_id, line_total)`` as last stored in the database."""
+		return getattr(instance, "_synced", None) or (
+			getattr(instance, cls._meta.get_field(cls.header_field).attname), getattr(instance, cls.total_field)
+		)
+
+	@classmethod
+	def apply_header_deltas(cls, deltas, using=None):
+		"""Add ``{header_id: delta}`` to the header totals, one UPDATE per header."""
+		header_model = cls.header_model()
+		now = timezone.now()
+		# Zero deltas still run: the header's updated_at moves with its nested lines.
+		deltas = {header_id: delta for header_id, delta in deltas.items() if header_id is not None}
+		for header_id, delta in deltas.items():
+			values = {cls.header_total_field: F(cls.header_total_field) + delta}
+			if cls.header_touch_field:
+				values[cls.header_touch_field] = now
+			elif not delta:
+				continue
+			header_model._base_manager.using(using).filter(pk=header_id).update(**values)
+		if deltas:
+			from .resultcache import bump
+
+			bump(header_model, using=using)
+
+	@classmethod
+	def apply_header_delta(cls, header_id, delta, using=None):
+		cls.apply_header_deltas({header_id: delta}, using)
+
+	def save(self, *args, **kwargs):
+		line_total = self.compute_line_total()
+		setattr(self, self.total_field, line_total)
+		if kwargs.get("update_fields") is not None:
+			kwargs["update_fields"] = set(kwargs["update_fields"]) | {self.total_field}
+		attname = self._meta.get_field(self.header_field).attname
+		using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+		with transaction.atomic(using=using):
+			previous = getattr(self, "_synced", None)
+			if previous is None and not self._state.adding:
+				previous = (
+					type(self)._base_manager.using(using)
+					.filter(pk=self.pk)
+					.values_list(attname, self.total_field)
+					.first()
+				)
+			super().save(*args, **kwargs)
+			header_id = getattr(self, attname)
+			if previous is not None and previous[0] != header_id:
+				self.apply_header_delta(previous[0], -previous[1], using)
+				previous = None
+			self.apply_header_delta(header_id, line_total - (previous[1] if previous else 0), using)
+		self._synced = (header_id, line_total)
+
+
 # Sales / Purchase orders and lines
 class SalesOrder(models.Model):
 	STATUS_CHOICES = [
@@ -150,23 +324,33 @@ class SalesOrder(models.Model):
 	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
-		indexes = [models.Index(fields=["number"]), models.Index(fields=["status"])]
+		indexes = [models.Index(fields=["number"]), models.Index(fields=["status"]), models.Index(fields=["updated_at", "id"])]
 		ordering = ["-date"]
 
 	def __str__(self):
 		return f"SO {self.number} - {self.customer}"
 
+	def save(self, *args, **kwargs):
+		if not self.number:
+			from .numbering import document_year, next_number
+
+			self.number = next_number("sales_order", document_year(self))
+		super().save(*args, **kwargs)
+
+
+class SalesOrderLine(DocumentLine):
+	header_field = "order"
 
-class SalesOrderLine(models.Model):
 	order = models.ForeignKey(SalesOrder, on_delete=models.CASCADE, related_name="lines")
 	product = models.ForeignKey(Product, on_delete=models.PROTECT)
 	description = models.CharField(max_length=512, blank=True)
 	quantity = models.DecimalField(max_digits=10, decimal_places=2, default=1)
 	unit_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 	line_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
-		indexes = [models.Index(fields=["product"])]
+		indexes = [models.Index(fields=["product"]), models.Index(fields=["updated_at", "id"])]
 		ordering = ["id"]
 
 	def __str__(self):
@@ -192,22 +376,33 @@ class PurchaseOrder(models.Model):
 	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
-		indexes = [models.Index(fields=["number"]), models.Index(fields=["status"])]
+		indexes = [models.Index(fields=["number"]), models.Index(fields=["status"]), models.Index(fields=["updated_at", "id"])]
 		ordering = ["-date"]
 
 	def __str__(self):
 		return f"PO {self.number} - {self.vendor}"
 
+	def save(self, *args, **kwargs):
+		if not self.number:
+			from .numbering import document_year, next_number
+
+			self.number = next_number("purchase_order", document_year(self))
+		super().save(*args, **kwargs)
+
+
+class PurchaseOrderLine(DocumentLine):
+	header_field = "order"
 
-class PurchaseOrderLine(models.Model):
 	order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, related_name="lines")
 	product = models.ForeignKey(Product, on_delete=models.PROTECT)
 	description = models.CharField(max_length=512, blank=True)
 	quantity = models.DecimalField(max_digits=10, decimal_places=2, default=1)
 	unit_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 	line_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
+		indexes = [models.Index(fields=["updated_at", "id"])]
 		ordering = ["id"]
 
 	def __str__(self):
@@ -238,23 +433,34 @@ class Invoice(models.Model):
 	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
-		indexes = [models.Index(fields=["number"]), models.Index(fields=["status"])]
+		indexes = [models.Index(fields=["number"]), models.Index(fields=["status"]), models.Index(fields=["updated_at", "id"])]
 		ordering = ["-date"]
 
 	def __str__(self):
 		return f"Invoice {self.number}"
 
+	def save(self, *args, **kwargs):
+		if not self.number:
+			from .numbering import document_year, next_number
 
-class InvoiceLine(models.Model):
+			self.number = next_number("bill" if self.invoice_type == "vendor" else "invoice", document_year(self))
+		super().save(*args, **kwargs)
+
+
+class InvoiceLine(DocumentLine):
 	"""Line items for invoices/bills."""
+	header_field = "invoice"
+
 	invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name="lines")
 	product = models.ForeignKey("Product", null=True, blank=True, on_delete=models.PROTECT)
 	description = models.CharField(max_length=512, blank=True)
 	quantity = models.DecimalField(max_digits=10, decimal_places=2, default=1)
 	unit_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 	line_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
+		indexes = [models.Index(fields=["updated_at", "id"])]
 		ordering = ["id"]
 
 	def __str__(self):
@@ -277,9 +483,10 @@ class Expense(models.Model):
 	description = models.TextField(blank=True)
 	receipt = models.FileField(upload_to="expenses/receipts/", null=True, blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
-		indexes = [models.Index(fields=["project"]), models.Index(fields=["date"])]
+		indexes = [models.Index(fields=["project"]), models.Index(fields=["date"]), models.Index(fields=["updated_at", "id"])]
 		ordering = ["-date"]
 
 	def __str__(self):
@@ -291,7 +498,7 @@ class AnalyticsEvent(models.Model):
 	event_name = models.CharField(max_length=128, db_index=True)
 	user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
 	project = models.ForeignKey(Project, null=True, blank=True, on_delete=models.SET_NULL, related_name="analytics_events")
-	timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+	timestamp = models.DateTimeField(default=timezone.now, db_index=True)
 	path = models.CharField(max_length=1024, null=True, blank=True)
 	properties = models.JSONField(default=dict, blank=True)
 
@@ -309,11 +516,78 @@ class AggregatedMetric(models.Model):
 	period_start = models.DateTimeField(db_index=True)
 	granularity = models.CharField(max_length=8, choices=GRANULARITY_CHOICES, default="day")
 	value = models.BigIntegerField(default=0)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
 		unique_together = ("metric_name", "period_start", "granularity")
-		indexes = [models.Index(fields=["metric_name", "period_start", "granularity"])]
+		indexes = [models.Index(fields=["metric_name", "period_start", "granularity"]), models.Index(fields=["updated_at", "id"])]
 		ordering = ["-period_start"]
 
 	def __str__(self):
-		return f"{self.metric_name} {self.granularity} @ {self.period_start.isoformat()}"
\ No newline at end of file
+		return f"{self.metric_name} {self.granularity} @ {self.period_start.isoformat()}"
+
+class RollupCheckpoint(models.Model):
+	"""High-water mark of the AnalyticsEvent -> AggregatedMetric rollup.
+
+	``last_timestamp`` is the event time up to which events have been folded
+	into the metrics (see ``apps.analytics.rollup`` for the lag and the
+	late-event window behind it).
+	"""
+	name = models.CharField(max_length=64, unique=True)
+	last_timestamp = models.DateTimeField(null=True, blank=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return f"{self.name} @ {self.last_timestamp}"
+
+
+class EventArchive(models.Model):
+	"""A month of AnalyticsEvent rows exported to a compressed file and removed from the hot table."""
+	month = models.DateTimeField(db_index=True)
+	path = models.CharField(max_length=1024, unique=True)
+	row_count = models.BigIntegerField(default=0)
+	# [byte offset, first timestamp] of each gzip member; empty for files written as one member.
+	blocks = models.JSONField(default=list, blank=True)
+	archived_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		ordering = ["month"]
+
+	def __str__(self):
+		return f"{self.month:%Y-%m} ({self.row_count} events)"
+
+
+class DocumentSequence(models.Model):
+	"""Per-type, per-year document counter used when native sequences are unavailable."""
+	doc_type = models.CharField(max_length=32)
+	year = models.PositiveSmallIntegerField()
+	last_value = models.BigIntegerField(default=0)
+
+	class Meta:
+		unique_together = ("doc_type", "year")
+
+	def __str__(self):
+		return f"{self.doc_type} {self.year}: {self.last_value}"
+
+
+class Tombstone(models.Model):
+	"""Record of a deleted row, so delta-sync clients can drop it.
+
+	``model`` is the concrete model's ``app_label.model_name``; rows deleted by
+	a cascade are recorded like direct deletes. ``scope`` keeps the values the
+	list filters match on (e.g. ``{"date": ..., "project": ...}``) as they
+	were when the row went, so a filtered sync only hears of its own rows.
+	``audience`` is set (to a user pk) when the row still exists but left that
+	one user's view, e.g. when they were removed from a project's team.
+	"""
+	model = models.CharField(max_length=100)
+	object_id = models.CharField(max_length=64)
+	deleted_at = models.DateTimeField(default=timezone.now)
+	scope = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+	audience = models.CharField(max_length=64, blank=True, default="")
+
+	class Meta:
+		indexes = [models.Index(fields=["model", "audience", "deleted_at"], name="analytics_tombstone_sync_idx")]
+
+	def __str__(self):
+		return f"{self.model}#{self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,97 @@
+"""Document number allocation for orders, invoices and bills.
+
+Numbers look like ``SO-2026-00042``: a per-document-type prefix, the year
+and a counter that restarts every year. On PostgreSQL each (type, year) pair
+is backed by a native sequence, so ``nextval`` hands out unique values to any
+number of concurrent inserts without row or table locks and without retrying
+on IntegrityError. Like any sequence, a rolled-back transaction leaves a gap.
+
+Other databases fall back to a :class:`~apps.analytics.models.DocumentSequence`
+counter row bumped with a single ``UPDATE ... SET last_value = last_value + n``.
+
+Prefixes can be overridden with ``DOCUMENT_NUMBER_PREFIXES`` in settings.
+"""
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import models
+
+DEFAULT_PREFIXES = {
+    "sales_order": "SO",
+    "purchase_order": "PO",
+    "invoice": "INV",
+    "bill": "BILL",
+    "customer_invoice": "CI",
+}
+WIDTH = 5
+
+_known_sequences = set()
+
+
+def prefix_for(doc_type):
+    prefixes = {**DEFAULT_PREFIXES, **getattr(settings, "DOCUMENT_NUMBER_PREFIXES", {})}
+    return prefixes[doc_type]
+
+
+def format_number(doc_type, year, value):
+    return f"{prefix_for(doc_type)}-{year}-{value:0{WIDTH}d}"
+
+
+def _sequence_name(doc_type, year):
+    return f"docnum_{doc_type}_{year}"
+
+
+def _ensure_sequence(name):
+    if name in _known_sequences:
+        return
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS "{name}"')
+    except DatabaseError:
+        # Lost a CREATE race with another session; the sequence exists now.
+        pass
+    # Remembered only once committed: an outer rollback drops the new sequence again.
+    transaction.on_commit(lambda: _known_sequences.add(name))
+
+
+def _next_values_postgres(doc_type, year, count):
+    name = _sequence_name(doc_type, year)
+    _ensure_sequence(name)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [name, count])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _next_values_counter(doc_type, year, count):
+    with transaction.atomic():
+        models.DocumentSequence.objects.bulk_create(
+            [models.DocumentSequence(doc_type=doc_type, year=year)], ignore_conflicts=True
+        )
+        counter = models.DocumentSequence.objects.filter(doc_type=doc_type, year=year)
+        counter.update(last_value=F("last_value") + count)
+        last = counter.values_list("last_value", flat=True).get()
+    return list(range(last - count + 1, last + 1))
+
+
+def document_year(instance, field="date"):
+    """Year of ``instance``'s date field (a string is parsed), or None when unset."""
+    value = instance._meta.get_field(field).to_python(getattr(instance, field))
+    return value.year if value else None
+
+
+def reserve(doc_type, count=1, year=None):
+    """Reserve ``count`` numbers for ``doc_type`` in ``year`` (default: this year).
+
+    Documents pass the year of their own ``date``, so a back-dated document is
+    numbered in the year it belongs to.
+    """
+    prefix_for(doc_type)  # fail fast on unknown types
+    year = year or timezone.localdate().year
+    allocate = _next_values_postgres if connection.vendor == "postgresql" else _next_values_counter
+    return [format_number(doc_type, year, value) for value in allocate(doc_type, year, count)]
+
+
+def next_number(doc_type, year=None):
+    return reserve(doc_type, 1, year)[0]
@@ -0,0 +1,163 @@
+"""Keyset (cursor) pagination for the analytics API.
+
+Pages are cut with a ``WHERE`` on the ordering columns of the last row seen
+instead of ``OFFSET``, and no ``COUNT(*)`` is issued, so page 1000 costs the
+same as page 1. The ordering is the model's default ordering followed by a
+unique ``id`` tie-breaker (``-date, id`` for time entries, ``-timestamp, id``
+for events, ...). A viewset can override it with ``keyset_ordering`` and
+tune ``page_size`` / ``max_page_size``.
+"""
+import base64
+import json
+from functools import cmp_to_key, reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_ordering(self, view, model):
+        ordering = list(getattr(view, "keyset_ordering", None) or model._meta.ordering)
+        if not any(field.lstrip("-") in ("id", "pk") for field in ordering):
+            ordering.append("id")
+        return [field.replace("pk", "id") if field.lstrip("-") == "pk" else field for field in ordering]
+
+    def get_page_size(self, request, view):
+        default = getattr(view, "page_size", self.page_size)
+        maximum = getattr(view, "max_page_size", self.max_page_size)
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return default
+        return max(1, min(size, maximum))
+
+    # Cursor encoding
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({"v": values, "r": reverse}, separators=(",", ":"), default=str)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, request):
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4)))
+            values, reverse = payload["v"], bool(payload["r"])
+            if len(values) != len(self.ordering):
+                raise ValueError
+            values = [self.fields[i].to_python(value) for i, value in enumerate(values)]
+        except (TypeError, ValueError, KeyError, json.JSONDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def _values(self, obj):
+        return [self.fields[i].value_from_object(obj) for i in range(len(self.ordering))]
+
+    # Query building
+    def _after(self, values, reverse):
+        """Q for rows strictly after ``values`` in the (optionally reversed) ordering."""
+        clauses = []
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            descending = field.startswith("-") != reverse
+            clause = Q(**{f"{name}__{'lt' if descending else 'gt'}": values[i]})
+            for j in range(i):
+                clause &= Q(**{self.ordering[j].lstrip("-"): values[j]})
+            clauses.append(clause)
+        return reduce(or_, clauses)
+
+    def _compare(self, a, b, reverse):
+        for i, field in enumerate(self.ordering):
+            left, right = a[i], b[i]
+            if left == right:
+                continue
+            descending = field.startswith("-") != reverse
+            return (-1 if left > right else 1) if descending else (-1 if left < right else 1)
+        return 0
+
+    def follows(self, values, cursor, reverse):
+        """True if a row with ordering ``values`` comes after ``cursor`` (for rows not read through SQL)."""
+        return cursor is None or self._compare(values, cursor, reverse) > 0
+
+    def _sorted(self, objs, cursor, reverse):
+        keyed = [(self._values(obj), obj) for obj in objs]
+        keyed = [item for item in keyed if self.follows(item[0], cursor, reverse)]
+        keyed.sort(key=cmp_to_key(lambda a, b: self._compare(a[0], b[0], reverse)))
+        return [obj for _, obj in keyed[: self.page_size + 1]]
+
+    def paginate_queryset(self, queryset, request, view=None, extra_rows=None):
+        """Cut one page from ``queryset`` (or an already-materialised list).
+
+        ``extra_rows(cursor, reverse, rows)``, if given, is called with the rows
+        fetched from the database and may return more objects (e.g. read back
+        from archives) to merge into the page under the same ordering.
+        """
+        model = queryset.model if hasattr(queryset, "model") else view.get_queryset().model
+        self.ordering = self.get_ordering(view, model)
+        self.fields = [model._meta.get_field(field.lstrip("-")) for field in self.ordering]
+        self.page_size = self.get_page_size(request, view)
+        self.request = request
+        cursor, reverse = self.decode_cursor(request)
+
+        if hasattr(queryset, "model"):
+            if cursor is not None:
+                queryset = queryset.filter(self._after(cursor, reverse))
+            flipped = [field[1:] if field.startswith("-") else f"-{field}" for field in self.ordering]
+            rows = list(queryset.order_by(*(flipped if reverse else self.ordering))[: self.page_size + 1])
+        else:
+            # Already-materialised lists use the same keys in Python.
+            rows = self._sorted(queryset, cursor, reverse)
+        extra = extra_rows(cursor, reverse, rows) if extra_rows is not None else None
+        if extra:
+            rows = self._sorted([*rows, *extra], cursor, reverse)
+
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+        self.has_next = has_more if not reverse else cursor is not None
+        self.has_previous = cursor is not None if not reverse else has_more
+        self.page = rows
+        return rows
+
+    def _link(self, values, reverse):
+        url = self.request.build_absolute_uri()
+        if values is None:
+            return None
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self._values(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self._link(self._values(self.page[0]), True)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "previous": self.get_previous_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,345 @@
+"""Monthly partitions and cold archival for AnalyticsEvent.
+
+On PostgreSQL the event table is range-partitioned by ``timestamp`` (see
+migration 0006), one partition per calendar month plus a default partition.
+:func:`ensure_partitions` creates upcoming months ahead of time and
+:func:`archive_expired` exports months older than the retention window to
+gzipped NDJSON files, records them as :class:`~apps.analytics.models.EventArchive`
+rows and drops the partition, so the hot table and its indexes stay bounded.
+Files are written in ``(timestamp, id)`` order, so :func:`load_archived` can
+stop reading as soon as it has a page.
+
+Other databases have no partitions; there the same functions export and
+delete the expired rows by time range, which keeps development setups working.
+
+Settings:
+
+* ``ANALYTICS_EVENT_RETENTION_MONTHS`` - months kept in the hot table (default 12).
+* ``ANALYTICS_EVENT_ARCHIVE_DIR`` - where archive files are written
+  (default ``<BASE_DIR>/archive/analytics_events``).
+"""
+import gzip
+import heapq
+import json
+import os
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import models
+
+TABLE = models.AnalyticsEvent._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+ARCHIVE_FIELDS = ["id", "event_name", "user_id", "project_id", "timestamp", "path", "properties"]
+ARCHIVE_BLOCK_ROWS = 1000
+
+
+def month_floor(value):
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def retention_months():
+    return getattr(settings, "ANALYTICS_EVENT_RETENTION_MONTHS", 12)
+
+
+def archive_dir():
+    default = Path(settings.BASE_DIR) / "archive" / "analytics_events"
+    return Path(getattr(settings, "ANALYTICS_EVENT_ARCHIVE_DIR", default))
+
+
+def is_partitioned():
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def existing_partitions():
+    """Names of the partitions currently attached to the event table."""
+    if not is_partitioned():
+        return set()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s",
+            [TABLE],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def _default_has_rows(cursor, month):
+    cursor.execute(
+        f'SELECT 1 FROM "{DEFAULT_PARTITION}" WHERE "timestamp" >= %s AND "timestamp" < %s LIMIT 1',
+        [month, add_months(month, 1)],
+    )
+    return cursor.fetchone() is not None
+
+
+def _create_partition(cursor, month, has_default):
+    name = partition_name(month)
+    end = add_months(month, 1)
+    create = (
+        f'CREATE TABLE "{name}" PARTITION OF "{TABLE}" '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+    )
+    if not has_default or not _default_has_rows(cursor, month):
+        cursor.execute(create)
+        return
+    # PostgreSQL refuses a range the default partition already holds rows for:
+    # detach the default, create the month, move its rows across, re-attach.
+    cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{DEFAULT_PARTITION}"')
+    cursor.execute(create)
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+        f'INSERT INTO "{name}" SELECT * FROM moved',
+        [month, end],
+    )
+    cursor.execute(f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{DEFAULT_PARTITION}" DEFAULT')
+
+
+def ensure_partitions(months_ahead=2, now=None):
+    """Create partitions for the current month and ``months_ahead`` after it."""
+    if not is_partitioned():
+        return []
+    current = month_floor(now or timezone.now())
+    existing = existing_partitions()
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        name = partition_name(month)
+        if name in existing:
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            _create_partition(cursor, month, DEFAULT_PARTITION in existing)
+        created.append(name)
+    return created
+
+
+def _write_archive(rows, month):
+    """Write ``rows`` (in ``(timestamp, id)`` order) as one gzip member per ``ARCHIVE_BLOCK_ROWS``.
+
+    Concatenated members are still one valid ``.gz`` file. Returns the path,
+    the row count and ``[offset, first timestamp]`` of every member.
+    """
+    directory = archive_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = f"events-{month:%Y-%m}"
+    path = directory / f"{stem}.ndjson.gz"
+    part = 1
+    while path.exists():
+        part += 1
+        path = directory / f"{stem}.{part}.ndjson.gz"
+    tmp = path.with_name(path.name + ".tmp")
+    count = 0
+    blocks = []
+    with open(tmp, "wb") as fh:
+        for block in _chunks(rows, ARCHIVE_BLOCK_ROWS):
+            blocks.append([fh.tell(), block[0]["timestamp"].isoformat()])
+            lines = "".join(json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in block)
+            fh.write(gzip.compress(lines.encode("utf-8")))
+            count += len(block)
+    os.replace(tmp, path)
+    return path, count, blocks
+
+
+def _chunks(rows, size):
+    block = []
+    for row in rows:
+        block.append(row)
+        if len(block) == size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def _detached_rows(name):
+    """Rows of a detached partition table, fetched 5000 at a time."""
+    columns = ", ".join(f'"{column}"' for column in ARCHIVE_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {columns} FROM "{name}" ORDER BY "timestamp", "id"')
+        while True:
+            chunk = cursor.fetchmany(5000)
+            if not chunk:
+                return
+            for values in chunk:
+                row = dict(zip(ARCHIVE_FIELDS, values))
+                if isinstance(row["properties"], str):
+                    row["properties"] = json.loads(row["properties"])
+                yield row
+
+
+def archive_month(month):
+    """Export one month of events to disk and remove it from the hot table.
+
+    A partition is detached first, so nothing can be written to it while it is
+    exported; rows for that month inserted afterwards land in the default
+    partition and are picked up by the next run. Without partitions exactly
+    the exported ids are deleted.
+    """
+    name = partition_name(month)
+    if name in existing_partitions():
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+    if name in connection.introspection.table_names():
+        # Detached here or by an earlier run that stopped before dropping it.
+        path, count, blocks = _write_archive(_detached_rows(name), month)
+        with transaction.atomic():
+            archive = models.EventArchive.objects.create(month=month, path=str(path), row_count=count, blocks=blocks)
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE "{name}"')
+        return archive
+
+    end = add_months(month, 1)
+    rows = models.AnalyticsEvent.objects.filter(timestamp__gte=month, timestamp__lt=end).order_by("timestamp", "id")
+    exported = []
+
+    def collect(values):
+        for row in values:
+            exported.append(row["id"])
+            yield row
+
+    path, count, blocks = _write_archive(collect(rows.values(*ARCHIVE_FIELDS).iterator(chunk_size=5000)), month)
+    with transaction.atomic():
+        archive = models.EventArchive.objects.create(month=month, path=str(path), row_count=count, blocks=blocks)
+        for start in range(0, len(exported), 5000):
+            models.AnalyticsEvent.objects.filter(pk__in=exported[start : start + 5000]).delete()
+    return archive
+
+
+def archive_expired(retention=None, now=None):
+    """Archive every month that ended before the retention window."""
+    retention = retention_months() if retention is None else retention
+    cutoff = add_months(month_floor(now or timezone.now()), -retention)
+    oldest = models.AnalyticsEvent.objects.aggregate(m=Min("timestamp"))["m"]
+    archived = []
+    if oldest is None:
+        return archived
+    month = month_floor(oldest)
+    partitions, tables = existing_partitions(), set(connection.introspection.table_names())
+    while month < cutoff:
+        end = add_months(month, 1)
+        has_rows = models.AnalyticsEvent.objects.filter(timestamp__gte=month, timestamp__lt=end).exists()
+        name = partition_name(month)
+        if has_rows or name in partitions or name in tables:
+            archived.append(archive_month(month))
+        month = end
+    return archived
+
+
+def hot_horizon():
+    """Start of the oldest month still fully in the hot table, or None if nothing is archived."""
+    newest = models.EventArchive.objects.order_by("-month").values_list("month", flat=True).first()
+    return add_months(newest, 1) if newest else None
+
+
+def archives_between(start, end=None):
+    archives = models.EventArchive.objects.filter(month__gte=month_floor(start))
+    if end is not None:
+        archives = archives.filter(month__lt=end)
+    return archives
+
+
+def _parse(lines):
+    for line in lines:
+        row = json.loads(line)
+        row["timestamp"] = parse_datetime(row["timestamp"])
+        yield row
+
+
+def _archive_rows(archive, start, end, newest_first):
+    """Rows of one archive file, in ``(timestamp, id)`` order or its reverse.
+
+    Only the gzip members that can hold rows in ``[start, end)`` are read,
+    one at a time from the end the walk starts at. A file without recorded
+    blocks predates them and may be in id order: it is read whole and sorted.
+    """
+    if not archive.blocks:
+        with gzip.open(archive.path, "rt", encoding="utf-8") as fh:
+            yield from sorted(_parse(fh), key=lambda row: (row["timestamp"], row["id"]), reverse=newest_first)
+        return
+    offsets = [offset for offset, _ in archive.blocks]
+    firsts = [parse_datetime(first) for _, first in archive.blocks]
+    # A member may hold rows tied with the next member's first timestamp.
+    low = max(bisect_left(firsts, start) - 1, 0)
+    high = bisect_left(firsts, end) if end is not None else len(firsts)
+    order = range(high - 1, low - 1, -1) if newest_first else range(low, high)
+    with open(archive.path, "rb") as fh:
+        for i in order:
+            fh.seek(offsets[i])
+            size = offsets[i + 1] - offsets[i] if i + 1 < len(offsets) else -1
+            rows = list(_parse(gzip.decompress(fh.read(size)).decode("utf-8").splitlines()))
+            yield from reversed(rows) if newest_first else rows
+
+
+def _in_range(rows, start, end, newest_first):
+    """Rows with ``start <= timestamp < end``, stopping at the bound the walk reaches last."""
+    for row in rows:
+        stamp = row["timestamp"]
+        if newest_first and stamp < start or not newest_first and end is not None and stamp >= end:
+            return
+        if stamp >= start and (end is None or stamp < end):
+            yield row
+
+
+def _take(rows, limit):
+    """The first ``limit`` rows, plus any tied with the last of them on timestamp."""
+    taken = []
+    for row in rows:
+        if len(taken) >= limit and row["timestamp"] != taken[-1]["timestamp"]:
+            break
+        taken.append(row)
+    return taken
+
+
+def load_archived(start, end=None, newest_first=False, limit=None, keep=None):
+    """Unsaved AnalyticsEvent instances read back from archive files for ``[start, end)``.
+
+    Rows are walked oldest first (newest first with ``newest_first``): month
+    by month, each month's files merged, each file block by block from the
+    end the walk starts at. With ``limit`` the walk stops after ``limit`` rows
+    plus those tied with the last of them on timestamp (the caller orders
+    ties by id), so a page costs about one block per file whatever the
+    archived volume. ``keep(row)`` drops raw rows first, e.g. those a keyset
+    cursor has passed. Only the rows returned become instances.
+    """
+    by_month = defaultdict(list)
+    for archive in archives_between(start, end):
+        by_month[archive.month].append(archive)
+    found = []
+    for month in sorted(by_month, reverse=newest_first):
+        streams = [_archive_rows(archive, start, end, newest_first) for archive in by_month[month]]
+        merged = heapq.merge(*streams, key=lambda row: (row["timestamp"], row["id"]), reverse=newest_first)
+        rows = _in_range(merged, start, end, newest_first)
+        if keep is not None:
+            rows = filter(keep, rows)
+        found.extend(rows if limit is None else _take(rows, limit - len(found)))
+        for stream in streams:
+            stream.close()
+        if limit is not None and len(found) >= limit:
+            break
+    return [models.AnalyticsEvent(**row) for row in found]
@@ -0,0 +1,225 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncWeek
+
+from . import models
+from .labor import labor_aggregates, to_money
+
+ZERO = Decimal("0.00")
+
+
+def _grouped(qs, key, **aggregates):
+    """Run one GROUP BY ``key`` query and return ``{key_value: row}``."""
+    rows = qs.order_by().values(key).annotate(**aggregates)
+    return {row[key]: row for row in rows}
+
+
+def portfolio_summary(projects=None):
+    """Per-project revenue, cost, budget and task completion for a set of projects.
+
+    Every figure comes from a grouped aggregate, so the number of queries is
+    fixed (one per source table) no matter how many projects or rows exist.
+    """
+    if projects is None:
+        projects = models.Project.objects.all()
+    project_ids = projects.order_by().values("pk")
+
+    invoices = _grouped(
+        models.Invoice.objects.filter(project__in=project_ids).exclude(status="cancelled"),
+        "project_id",
+        revenue=Sum("total_amount", filter=Q(invoice_type="customer")),
+        bills=Sum("total_amount", filter=Q(invoice_type="vendor")),
+    )
+    purchases = _grouped(
+        models.PurchaseOrder.objects.filter(project__in=project_ids).exclude(status="cancelled"),
+        "project_id",
+        total=Sum("total_amount"),
+    )
+    expenses = _grouped(models.Expense.objects.filter(project__in=project_ids), "project_id", total=Sum("amount"))
+    labor = _grouped(
+        models.TimeEntry.objects.filter(task__project__in=project_ids),
+        "task__project_id",
+        **labor_aggregates(),
+    )
+    tasks = _grouped(
+        models.Task.objects.filter(project__in=project_ids),
+        "project_id",
+        total=Count("id"),
+        done=Count("id", filter=Q(status="done")),
+    )
+
+    rows = []
+    totals = defaultdict(lambda: ZERO)
+    status_counts = defaultdict(int)
+    task_total = task_done = 0
+    for project in projects.order_by().values("id", "name", "status", "budget"):
+        pid = project["id"]
+        inv = invoices.get(pid, {})
+        revenue = inv.get("revenue") or ZERO
+        bills = inv.get("bills") or ZERO
+        expense = (expenses.get(pid) or {}).get("total") or ZERO
+        committed = (purchases.get(pid) or {}).get("total") or ZERO
+        task_row = tasks.get(pid) or {"total": 0, "done": 0}
+        cost = bills + expense
+        budget = project["budget"]
+        labor_row = labor.get(pid) or {"minutes": 0, "labor_units": 0}
+        labor_money = to_money(labor_row["labor_units"])
+
+        rows.append({
+            "id": pid,
+            "name": project["name"],
+            "status": project["status"],
+            "revenue": revenue,
+            "bills": bills,
+            "expenses": expense,
+            "cost": cost,
+            "profit": revenue - cost,
+            "purchase_orders": committed,
+            "budget": budget,
+            "spent": cost,
+            "labor_minutes": labor_row["minutes"],
+            "labor_cost": labor_money,
+            "margin": revenue - cost - labor_money,
+            "tasks_total": task_row["total"],
+            "tasks_done": task_row["done"],
+            "completion_pct": round(task_row["done"] * 100 / task_row["total"], 1) if task_row["total"] else 0,
+        })
+        totals["revenue"] += revenue
+        totals["cost"] += cost
+        totals["budget"] += budget or ZERO
+        totals["labor_cost"] += labor_money
+        status_counts[project["status"]] += 1
+        task_total += task_row["total"]
+        task_done += task_row["done"]
+
+    return {
+        "projects": rows,
+        "totals": {
+            "revenue": totals["revenue"],
+            "cost": totals["cost"],
+            "profit": totals["revenue"] - totals["cost"],
+            "labor_cost": totals["labor_cost"],
+            "margin": totals["revenue"] - totals["cost"] - totals["labor_cost"],
+            "budget": totals["budget"],
+            "spent": totals["cost"],
+            "tasks_total": task_total,
+            "tasks_done": task_done,
+        },
+        "project_status_counts": dict(status_counts),
+    }
+
+
+WORKSPACE_FIELDS = {
+    "sales_orders": ["id", "number", "customer", "project", "date", "status", "total_amount"],
+    "purchase_orders": ["id", "number", "vendor", "project", "date", "status", "total_amount"],
+    "invoices": ["id", "number", "customer", "project", "date", "due_date", "status", "total_amount"],
+    "bills": ["id", "number", "vendor", "project", "date", "due_date", "status", "total_amount"],
+    "expenses": [
+        "id", "name", "category", "project", "vendor", "user", "billable", "date", "amount", "description", "receipt",
+    ],
+}
+
+
+def financial_workspace(project=None, date_from=None, date_to=None, request=None):
+    """Everything the finance screens load at start-up, in four queries.
+
+    Rows are flat dicts of the columns in ``WORKSPACE_FIELDS`` (foreign keys
+    as ids) read with ``values()``, so no model instances or serializers are
+    built. Invoices are fetched once and split into customer ``invoices`` and
+    vendor ``bills``. Expense receipts are URLs, absolute when ``request`` is
+    given, as the expense serializer returns them.
+    """
+    filters = {}
+    if project is not None:
+        filters["project"] = project
+    if date_from is not None:
+        filters["date__gte"] = date_from
+    if date_to is not None:
+        filters["date__lte"] = date_to
+
+    def rows(model, fields):
+        return list(model.objects.filter(**filters).values(*fields))
+
+    data = {
+        "sales_orders": rows(models.SalesOrder, WORKSPACE_FIELDS["sales_orders"]),
+        "purchase_orders": rows(models.PurchaseOrder, WORKSPACE_FIELDS["purchase_orders"]),
+        "invoices": [],
+        "bills": [],
+        "expenses": rows(models.Expense, WORKSPACE_FIELDS["expenses"]),
+    }
+    storage = models.Expense._meta.get_field("receipt").storage
+    for row in data["expenses"]:
+        if row["receipt"]:
+            url = storage.url(row["receipt"])
+            row["receipt"] = request.build_absolute_uri(url) if request is not None else url
+        else:
+            row["receipt"] = None
+    columns = sorted(set(WORKSPACE_FIELDS["invoices"]) | set(WORKSPACE_FIELDS["bills"]))
+    for row in rows(models.Invoice, ["invoice_type", *columns]):
+        group = "bills" if row.pop("invoice_type") == "vendor" else "invoices"
+        data[group].append({field: row[field] for field in WORKSPACE_FIELDS[group]})
+    return data
+
+
+def iso_week(day):
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def timesheet(entries):
+    """Minutes per (user, project, task) per ISO week as a grid.
+
+    ``entries`` is a TimeEntry queryset (already filtered by date, user,
+    project...). The sums come from one GROUP BY user, week, task over the
+    time entry table alone; the query that labels the tasks also supplies
+    their projects, and one more labels the users. ``minutes`` lists line up
+    with ``weeks``. ``user_totals`` and ``users`` are keyed by ``str(pk)``, as
+    JSON object keys must be strings (the user pk may be a UUID).
+    """
+    cells = list(
+        entries.order_by()
+        .annotate(week=TruncWeek("date"))
+        .values_list("user_id", "week", "task_id")
+        .annotate(minutes=Sum("duration_minutes"))
+    )
+    task_ids = {task_id for _, _, task_id, _ in cells}
+    user_ids = {user_id for user_id, _, _, _ in cells}
+    tasks = {
+        row["id"]: {"name": row["name"], "project": row["project_id"], "project_name": row["project__name"]}
+        for row in models.Task.objects.filter(pk__in=task_ids).values("id", "name", "project_id", "project__name")
+    }
+    user_model = get_user_model()
+    users = {
+        str(pk): name
+        for pk, name in user_model._default_manager.filter(pk__in=user_ids).values_list("pk", user_model.USERNAME_FIELD)
+    }
+
+    weeks = sorted({week for _, week, _, _ in cells})
+    column = {week: i for i, week in enumerate(weeks)}
+    rows = {}
+    week_totals = [0] * len(weeks)
+    user_totals = defaultdict(lambda: [0] * len(weeks))
+    for user_id, week, task_id, minutes in cells:
+        key = (user_id, tasks[task_id]["project"], task_id)
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = {"user": user_id, "project": key[1], "task": task_id, "minutes": [0] * len(weeks), "total": 0}
+        i = column[week]
+        row["minutes"][i] += minutes
+        row["total"] += minutes
+        week_totals[i] += minutes
+        user_totals[user_id][i] += minutes
+
+    return {
+        "weeks": [iso_week(week) for week in weeks],
+        "week_starts": weeks,
+        "rows": [rows[key] for key in sorted(rows)],
+        "week_totals": week_totals,
+        "user_totals": {str(user_id): minutes for user_id, minutes in user_totals.items()},
+        "total": sum(week_totals),
+        "tasks": tasks,
+        "users": users,
+    }
@@ -0,0 +1,268 @@
+"""Result cache for read-heavy endpoints, keyed by table versions.
+
+Every watched table has a version counter in the Django cache. A cached
+response is stored under a key built from the normalized request (host,
+path, sorted query string, optionally the user) and the current versions of
+the tables it reads, so any write to one of those tables makes the old
+entries unreachable instead of having to find and delete them.
+
+Versions are bumped by ``post_save`` / ``post_delete`` / ``m2m_changed`` on
+watched models and explicitly by code that writes around the ORM signals
+(``bulk_create``, ``bulk_update``, ``QuerySet.update``), via :func:`bump`.
+Each bump is repeated on commit so a reader that cached rows from before the
+commit cannot keep them alive.
+
+Entries are tracked in a per-process LRU index with a byte budget; the least
+recently used ones are deleted from the cache backend when it is exceeded.
+Entries the backend has already expired (``TIMEOUT``) leave the index first,
+so they never count against the budget or push out live ones.
+Works with any backend, including ``LocMemCache``. Configure with
+``ANALYTICS_RESULT_CACHE`` in settings, e.g.
+``{"ALIAS": "default", "MAX_BYTES": 16 * 1024 * 1024, "TIMEOUT": 300}``.
+"""
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from rest_framework import status
+from rest_framework.response import Response
+
+from .conditional import _matches
+
+DEFAULTS = {"ALIAS": "default", "MAX_BYTES": 16 * 1024 * 1024, "TIMEOUT": 300}
+PREFIX = "analytics:rc"
+
+_lock = threading.Lock()
+_index = OrderedDict()  # key -> size in bytes, least recently used first
+_expiry = OrderedDict()  # key -> monotonic expiry time, soonest first (TIMEOUT is fixed)
+_bytes = 0
+_watched = set()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "bumps": 0}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "ANALYTICS_RESULT_CACHE", {})}
+
+
+def _cache():
+    return caches[_config()["ALIAS"]]
+
+
+def _table(model):
+    return model._meta.concrete_model._meta.db_table
+
+
+def _version_key(table):
+    return f"{PREFIX}:v:{table}"
+
+
+# Versions
+def versions(models):
+    """Current version of each model's table, initialising missing counters."""
+    cache = _cache()
+    keys = sorted({_version_key(_table(model)) for model in models})
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # A fresh, time-based start so a counter lost to cache eviction
+            # never returns to a value an old entry was stored under.
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def _incr(tables):
+    cache = _cache()
+    for table in tables:
+        key = _version_key(table)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+    with _lock:
+        _stats["bumps"] += len(tables)
+
+
+def bump(*models, using=None):
+    """Invalidate cached results that read any of ``models``' tables."""
+    tables = {_table(model) for model in models}
+    _incr(tables)
+    transaction.on_commit(lambda: _incr(tables), using=using)
+
+
+def _changed(sender, using=None, **kwargs):
+    bump(sender, using=using)
+
+
+def _m2m_changed(sender, instance, action, model, using=None, **kwargs):
+    if action.startswith("post_"):
+        bump(sender, type(instance), model, using=using)
+
+
+def watch(*models):
+    """Start versioning ``models`` (and every proxy of them)."""
+    for target in models:
+        table = _table(target)
+        if table in _watched:
+            continue
+        _watched.add(table)
+        for model in apps.get_models():
+            if _table(model) != table:
+                continue
+            uid = f"resultcache.{model._meta.label}"
+            post_save.connect(_changed, sender=model, dispatch_uid=uid)
+            post_delete.connect(_changed, sender=model, dispatch_uid=uid)
+            for field in model._meta.local_many_to_many:
+                through = field.remote_field.through
+                _watched.add(_table(through))
+                m2m_changed.connect(_m2m_changed, sender=through, dispatch_uid=f"{uid}.{field.name}")
+
+
+# Entries
+def key_for(request, models, per_user=False, namespace=""):
+    params = sorted((name, value) for name in request.GET for value in request.GET.getlist(name))
+    user = getattr(request.user, "pk", None) if per_user else None
+    raw = repr((namespace, request.scheme, request.get_host(), request.path, params, user, versions(models)))
+    return f"{PREFIX}:r:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def _forget(key):
+    global _bytes
+    size = _index.pop(key, None)
+    _expiry.pop(key, None)
+    if size is not None:
+        _bytes -= size
+
+
+def _drop_expired(now):
+    while _expiry:
+        key, expires = next(iter(_expiry.items()))
+        if expires > now:
+            return
+        _forget(key)
+
+
+def lookup(key):
+    value = _cache().get(key)
+    with _lock:
+        if value is None:
+            _stats["misses"] += 1
+            _forget(key)
+            return None
+        _stats["hits"] += 1
+        if key in _index:
+            _index.move_to_end(key)
+    return pickle.loads(value)
+
+
+def store(key, value):
+    """Store ``value``; returns False if it is larger than the whole budget."""
+    global _bytes
+    config = _config()
+    payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    size = len(payload)
+    if size > config["MAX_BYTES"]:
+        return False
+    evicted = []
+    now = time.monotonic()
+    with _lock:
+        _forget(key)
+        _drop_expired(now)
+        while _index and _bytes + size > config["MAX_BYTES"]:
+            old, old_size = _index.popitem(last=False)
+            _expiry.pop(old, None)
+            _bytes -= old_size
+            evicted.append(old)
+        _index[key] = size
+        if config["TIMEOUT"] is not None:
+            _expiry[key] = now + config["TIMEOUT"]
+        _bytes += size
+        _stats["stores"] += 1
+        _stats["evictions"] += len(evicted)
+    cache = _cache()
+    if evicted:
+        cache.delete_many(evicted)
+    cache.set(key, payload, timeout=config["TIMEOUT"])
+    return True
+
+
+def stats():
+    with _lock:
+        _drop_expired(time.monotonic())
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else None,
+            "entries": len(_index),
+            "bytes": _bytes,
+            "max_bytes": _config()["MAX_BYTES"],
+            "watched_tables": sorted(_watched),
+        }
+
+
+def clear():
+    global _bytes
+    with _lock:
+        keys = list(_index)
+        _index.clear()
+        _expiry.clear()
+        _bytes = 0
+        for name in _stats:
+            _stats[name] = 0
+    _cache().delete_many(keys)
+
+
+class ResultCacheMixin:
+    """Serve GET ``list``/``retrieve`` (and opted-in actions) from the result cache.
+
+    ``result_cache_models`` lists the models the cached responses read
+    (default: the viewset's model). A custom action wraps its body in
+    :meth:`cached_response` and declares the models it reads in
+    ``result_cache_action_models``; ``result_cache_actions`` can drop
+    list/retrieve. Set ``result_cache_per_user`` when the
+    queryset depends on the requesting user.
+    """
+
+    result_cache_actions = ("list", "retrieve")
+    result_cache_models = None
+    result_cache_action_models = {}
+    result_cache_per_user = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        queryset = getattr(cls, "queryset", None)
+        if cls.result_cache_models is None and queryset is not None:
+            cls.result_cache_models = [queryset.model]
+        for models in [cls.result_cache_models or [], *cls.result_cache_action_models.values()]:
+            watch(*models)
+
+    def cached_response(self, request, render):
+        cacheable = self.action in self.result_cache_actions or self.action in self.result_cache_action_models
+        if request.method != "GET" or not cacheable:
+            return render()
+        models = self.result_cache_action_models.get(self.action) or self.result_cache_models
+        key = key_for(request, models, self.result_cache_per_user, namespace=type(self).__qualname__)
+        entry = lookup(key)
+        if entry is not None:
+            data, etag = entry
+            headers = {"ETag": etag} if etag else None
+            if etag and _matches(request.headers.get("If-None-Match"), etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            return Response(data, headers=headers)
+        response = render()
+        if response.status_code == status.HTTP_200_OK and hasattr(response, "data"):
+            store(key, (response.data, response.get("ETag")))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(ResultCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(ResultCacheMixin, self).retrieve(request, *args, **kwargs))
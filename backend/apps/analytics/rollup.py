@@ -0,0 +1,170 @@
+"""Incremental rollup of AnalyticsEvent rows into AggregatedMetric buckets.
+
+The high-water mark is an ``AnalyticsEvent.timestamp``. Each run counts
+events per ``event_name`` and hour from a little before the mark up to
+``now - ANALYTICS_ROLLUP_LAG`` (seconds, default 300), compares the counts
+with the stored hourly buckets and upserts only the buckets that changed,
+then re-sums the daily buckets of the days those hours fall in.
+
+The lag keeps the window behind rows that are still being written: an event
+stamped before ``now - lag`` has committed unless its transaction ran longer
+than the lag. The window starts ``ANALYTICS_ROLLUP_LATE_WINDOW`` seconds
+(default 6 hours) before the mark, so an event that arrives late (buffered,
+retried, or committed after a run passed its timestamp) still re-opens the
+one bucket it belongs to. Events later than that are only counted by a run
+with ``since=`` (``manage.py rollup_metrics --since``). Buckets are recounted
+from source, so repeated or interrupted runs are idempotent.
+"""
+from datetime import timedelta, timezone as dt_timezone
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from . import models, resultcache
+
+CHECKPOINT_NAME = "analytics_events"
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+def lag():
+    return timedelta(seconds=getattr(settings, "ANALYTICS_ROLLUP_LAG", 300))
+
+
+def late_window():
+    return max(HOUR, timedelta(seconds=getattr(settings, "ANALYTICS_ROLLUP_LATE_WINDOW", 6 * 3600)))
+
+
+def hour_floor(value):
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _ranges(starts, step):
+    """Collapse sorted bucket starts into contiguous ``(start, end)`` ranges."""
+    ranges = []
+    for start in starts:
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = start + step
+        else:
+            ranges.append([start, start + step])
+    return ranges
+
+
+def _range_filter(field, starts, step):
+    return reduce(or_, (Q(**{f"{field}__gte": lo, f"{field}__lt": hi}) for lo, hi in _ranges(sorted(starts), step)))
+
+
+def _upsert(granularity, values):
+    rows = [
+        models.AggregatedMetric(metric_name=name, period_start=start, granularity=granularity, value=value)
+        for (name, start), value in values.items()
+    ]
+    models.AggregatedMetric.objects.bulk_create(
+        rows,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["metric_name", "period_start", "granularity"],
+        update_fields=["value", "updated_at"],
+    )
+    resultcache.bump(models.AggregatedMetric)
+    return len(rows)
+
+
+def run_rollup(max_span=DAY, since=None, now=None):
+    """Fold events up to ``now - lag`` (at most ``max_span`` at a time) into the metric tables.
+
+    ``since`` recounts from that time instead of from the late window; when
+    the span ends before the mark the stats carry ``resume_from``.
+    Returns a dict of counters describing the run.
+    """
+    utc = dt_timezone.utc
+    horizon = (now or timezone.now()) - lag()
+    events = models.AnalyticsEvent.objects.order_by()
+
+    with transaction.atomic():
+        checkpoint, _ = models.RollupCheckpoint.objects.select_for_update().get_or_create(name=CHECKPOINT_NAME)
+        mark = checkpoint.last_timestamp
+        if since is not None:
+            start = hour_floor(since)
+            end = min(horizon, start + max_span)
+        elif mark is not None:
+            start = hour_floor(mark - late_window())
+            end = min(horizon, mark + max_span)
+        else:
+            oldest = events.filter(timestamp__lt=horizon).aggregate(m=Min("timestamp"))["m"]
+            start = hour_floor(oldest) if oldest is not None else horizon
+            end = min(horizon, start + max_span)
+        stats = {
+            "events": 0,
+            "late_events": 0,
+            "hourly_buckets": 0,
+            "daily_buckets": 0,
+            "checkpoint": max(end, mark) if mark else end,
+            "caught_up": end >= horizon,
+        }
+        if since is not None and mark is not None and end < mark:
+            stats["resume_from"] = end
+            stats["caught_up"] = False
+        if end <= start:
+            return stats
+
+        counted = {
+            (name, hour): n
+            for name, hour, n in events.filter(timestamp__gte=start, timestamp__lt=end)
+            .annotate(hour=TruncHour("timestamp", tzinfo=utc))
+            .values_list("event_name", "hour")
+            .annotate(n=Count("id"))
+        }
+        stored = {
+            (name, hour): value
+            for name, hour, value in models.AggregatedMetric.objects.order_by()
+            .filter(granularity="hour", period_start__gte=start, period_start__lt=end)
+            .values_list("metric_name", "period_start", "value")
+        }
+        # Only buckets whose count moved are written; emptied ones drop to 0.
+        changed = {key: n for key, n in counted.items() if stored.get(key) != n}
+        changed.update({key: 0 for key, value in stored.items() if key not in counted and value})
+        for key, n in changed.items():
+            delta = n - stored.get(key, 0)
+            stats["events"] += delta
+            if mark is not None and key[1] < hour_floor(mark):
+                stats["late_events"] += delta
+
+        if changed:
+            stats["hourly_buckets"] = _upsert("hour", changed)
+            touched_days = {(name, hour.replace(hour=0)) for name, hour in changed}
+            daily = {
+                (row["metric_name"], row["day"]): row["total"]
+                for row in models.AggregatedMetric.objects.order_by()
+                .filter(granularity="hour", metric_name__in={name for name, _ in touched_days})
+                .filter(_range_filter("period_start", {d for _, d in touched_days}, DAY))
+                .annotate(day=TruncDay("period_start", tzinfo=utc))
+                .values("metric_name", "day")
+                .annotate(total=Sum("value"))
+                if (row["metric_name"], row["day"]) in touched_days
+            }
+            stats["daily_buckets"] = _upsert("day", daily)
+
+        if mark is None or end > mark:
+            checkpoint.last_timestamp = end
+            checkpoint.save()
+    return stats
+
+
+def run_until_caught_up(max_span=DAY, since=None, now=None):
+    """Repeat :func:`run_rollup` until the mark reaches ``now - lag``; returns summed counters."""
+    counters = ("events", "late_events", "hourly_buckets", "daily_buckets")
+    totals = dict.fromkeys(counters, 0)
+    while True:
+        stats = run_rollup(max_span=max_span, since=since, now=now)
+        since = stats.get("resume_from")
+        for key in counters:
+            totals[key] += stats[key]
+        totals["checkpoint"] = stats["checkpoint"]
+        if stats["caught_up"]:
+            return totals
@@ -1,97 +1,155 @@
-from rest_framework import serializers
+from rest_framework import permissions, serializers
 from . import models
 
-class ProjectSerializer(serializers.ModelSerializer):
+
+def field_selection(request):
+    """``(fields, exclude)`` name lists from the query string, or None when neither is given.
+
+    Only read requests are narrowed; writes always see the full serializer.
+    """
+    if request is None or request.method not in permissions.SAFE_METHODS:
+        return None
+    only = request.query_params.get("fields")
+    exclude = request.query_params.get("exclude")
+    if not only and not exclude:
+        return None
+    return (only.split(",") if only else None), (exclude.split(",") if exclude else [])
+
+
+def requested_fields(request, field_names):
+    """Subset of ``field_names`` selected by ``?fields=`` / ``?exclude=``, or None for all."""
+    selection = field_selection(request)
+    if selection is None:
+        return None
+    only, exclude = selection
+    return [name for name in field_names if (only is None or name in only) and name not in exclude]
+
+
+class SparseFieldsetMixin:
+    """Drop fields not asked for via ``?fields=a,b`` or ``?exclude=c`` on reads."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Checked before touching self.fields, which builds every field on first access.
+        if field_selection(self._context.get("request")) is None:
+            return
+        selected = requested_fields(self._context.get("request"), list(self.fields))
+        for name in set(self.fields) - set(selected):
+            self.fields.pop(name)
+
+
+class ProjectSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Project
         fields = "__all__"
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Task
         fields = "__all__"
 
 
-class TimeEntrySerializer(serializers.ModelSerializer):
+class TimeEntrySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.TimeEntry
         fields = "__all__"
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Product
         fields = "__all__"
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Customer
         fields = "__all__"
 
 
-class VendorSerializer(serializers.ModelSerializer):
+class VendorSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Vendor
         fields = "__all__"
 
 
-class SalesOrderLineSerializer(serializers.ModelSerializer):
+class SalesOrderLineSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.SalesOrderLine
         fields = "__all__"
+        read_only_fields = ["line_total"]
 
 
-class SalesOrderSerializer(serializers.ModelSerializer):
+class SalesOrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     lines = SalesOrderLineSerializer(many=True, read_only=True)
 
     class Meta:
         model = models.SalesOrder
         fields = "__all__"
+        extra_kwargs = {"number": {"required": False}}
 
 
-class PurchaseOrderLineSerializer(serializers.ModelSerializer):
+class PurchaseOrderLineSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.PurchaseOrderLine
         fields = "__all__"
+        read_only_fields = ["line_total"]
 
 
-class PurchaseOrderSerializer(serializers.ModelSerializer):
+class PurchaseOrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     lines = PurchaseOrderLineSerializer(many=True, read_only=True)
 
     class Meta:
         model = models.PurchaseOrder
         fields = "__all__"
+        extra_kwargs = {"number": {"required": False}}
 
 
-class InvoiceLineSerializer(serializers.ModelSerializer):
+class InvoiceLineSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.InvoiceLine
         fields = "__all__"
+        read_only_fields = ["line_total"]
 
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class InvoiceSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     lines = InvoiceLineSerializer(many=True, read_only=True)
 
     class Meta:
         model = models.Invoice
         fields = "__all__"
+        extra_kwargs = {"number": {"required": False}}
 
 
-class ExpenseSerializer(serializers.ModelSerializer):
+class ExpenseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Expense
         fields = "__all__"
 
 
-class AnalyticsEventSerializer(serializers.ModelSerializer):
+class AnalyticsEventSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.AnalyticsEvent
         fields = "__all__"
+        read_only_fields = ["timestamp"]
+
+
+class AnalyticsEventIngestSerializer(serializers.ModelSerializer):
+    """Per-row validation for batch ingestion.
+
+    ``user`` and ``project`` are accepted as raw primary keys; their existence
+    is checked once per chunk instead of once per row.
+    """
+    user = serializers.CharField(required=False, allow_null=True)
+    project = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = models.AnalyticsEvent
+        fields = ["event_name", "user", "project", "path", "properties"]
 
 
-class AggregatedMetricSerializer(serializers.ModelSerializer):
+class AggregatedMetricSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = models.AggregatedMetric
         fields = "__all__"
\ No newline at end of file
@@ -0,0 +1,49 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.apps import apps
+
+from . import changes, deletion, models, sync
+from .models import DocumentLine
+
+# Models served through delta-sync list endpoints; their deletes leave tombstones.
+SYNCED_MODELS = [
+    models.Project, models.Task, models.TimeEntry, models.Product, models.Customer, models.Vendor,
+    models.SalesOrder, models.SalesOrderLine, models.PurchaseOrder, models.PurchaseOrderLine,
+    models.Invoice, models.InvoiceLine, models.Expense, models.AggregatedMetric,
+]
+# The ?date_from= / ?date_to= / ?project= lookups of the filtered list endpoints
+# (AnalyticsModelViewSet.date_filter_field / project_filter_field), kept on tombstones.
+SYNC_SCOPES = {
+    models.TimeEntry: {"date": "date", "project": "task__project"},
+    models.InvoiceLine: {"date": "invoice__date", "project": "invoice__project"},
+    models.Expense: {"date": "date", "project": "project"},
+}
+
+
+def lines_deleted(sender, instances, batch):
+    """Subtract deleted lines from their headers, skipping headers removed by the same delete."""
+    header_model = sender.header_model()
+    deltas = defaultdict(Decimal)
+    for line in instances:
+        header_id, line_total = sender.synced_values(line)
+        if header_id is not None and not batch.contains(header_model, header_id):
+            deltas[header_id] -= line_total
+    sender.apply_header_deltas(deltas, batch.using)
+
+
+def connect():
+    # Connected per line model (proxies included) rather than globally, so
+    # bulk deletes of unrelated models keep Django's fast-delete path.
+    lines = [model for model in apps.get_models() if issubclass(model, DocumentLine)]
+    headers = {line.header_model()._meta.concrete_model for line in lines}
+    for model in lines:
+        deletion.register(model, lines_deleted, "lines_deleted")
+    # Headers are watched so a line knows when its header goes in the same delete.
+    for model in apps.get_models():
+        if model._meta.concrete_model in headers:
+            deletion.watch(model)
+    sync.track(*SYNCED_MODELS)
+    for model, scope in SYNC_SCOPES.items():
+        sync.track(model, scope=scope)
+    changes.connect()
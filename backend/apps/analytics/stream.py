@@ -0,0 +1,163 @@
+"""Server-sent-events endpoint for the change broadcast, served at the ASGI layer.
+
+Django's ASGI handler runs every request inside a ``ThreadSensitiveContext``,
+so a long-lived streaming response keeps a thread parked for as long as the
+connection is open. :func:`with_change_stream` answers the URL named
+``CHANGE_STREAM_URL_NAME`` (wherever the URLconf mounts the analytics API,
+e.g. ``/api/changes/stream/``) before the request reaches Django instead:
+the session cookie is resolved on the shared executor, after which each
+connection is just a coroutine waiting on its
+:class:`~apps.analytics.changes.Subscription` queue, and a worker can hold
+thousands of idle clients. A stream carries the changes of the projects its
+user can see (see :mod:`apps.analytics.changes`); ``?project=<id>`` limits it
+to one analytics project's rows, as on the list endpoints, and is answered
+with 404 unless the user can see that project.
+
+Events look like::
+
+    id: 42
+    event: change
+    data: {"model":"analytics.task","op":"upsert","id":7,"project":3}
+
+``event: resync`` means notifications were dropped for this client and it
+should refetch (e.g. with ``?updated_since=``). The stream ends when the
+user's access does (see :meth:`~apps.analytics.changes.Broadcast.revoke`).
+A comment line is sent every ``HEARTBEAT`` seconds to keep proxies from
+closing idle connections.
+"""
+import asyncio
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http import QueryDict
+from django.urls import reverse
+from rest_framework.exceptions import ValidationError
+
+from . import changes, models
+
+CHANGE_STREAM_URL_NAME = "change-stream"
+HEARTBEAT = 15
+
+_encoder = DjangoJSONEncoder(separators=(",", ":"))
+
+
+def _run_sync(func, *args):
+    """Run a short ORM call on the shared executor rather than a per-request thread."""
+
+    def call():
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+def _authenticate(cookie_header):
+    from django.contrib.auth import get_user
+
+    cookies = SimpleCookie()
+    cookies.load(cookie_header)
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+    engine = import_module(settings.SESSION_ENGINE)
+    request = SimpleNamespace(session=engine.SessionStore(morsel.value if morsel else None))
+    user = get_user(request)
+    if not user.is_authenticated:
+        return None, None
+    return user, request.session.session_key
+
+
+def _project(query_string):
+    from .views import parse_project_param
+
+    return parse_project_param(QueryDict(query_string))
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _respond(send, status, content_type, body=b"", more_body=False, headers=()):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type), *headers],
+        }
+    )
+    await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+
+async def change_stream(scope, receive, send):
+    headers = dict(scope.get("headers") or [])
+    user, session_key = await _run_sync(_authenticate, headers.get(b"cookie", b"").decode("latin-1"))
+    if user is None:
+        body = b'{"detail":"Authentication credentials were not provided."}'
+        return await _respond(send, 401, b"application/json", body)
+    try:
+        project = _project(scope.get("query_string", b""))
+    except ValidationError as exc:
+        return await _respond(send, 400, b"application/json", _encoder.encode(exc.detail).encode())
+    if project is not None:
+        if not await _run_sync(changes.can_see, models.Project, project, user.pk):
+            return await _respond(send, 404, b"application/json", b'{"detail":"Not found."}')
+        project = (models.Project, project)
+
+    subscription = changes.broadcast.subscribe(user.pk, session_key, project)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await _respond(
+            send,
+            200,
+            b"text/event-stream",
+            f"retry: {HEARTBEAT * 1000}\n\n".encode(),
+            more_body=True,
+            headers=[(b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")],
+        )
+        while not subscription.revoked:
+            if subscription.overflowed:
+                subscription.overflowed = False
+                await send({"type": "http.response.body", "body": b"event: resync\ndata: {}\n\n", "more_body": True})
+            next_item = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait({next_item, disconnected}, timeout=HEARTBEAT, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                next_item.cancel()
+                return
+            if next_item not in done:
+                next_item.cancel()
+                await send({"type": "http.response.body", "body": b": keep-alive\n\n", "more_body": True})
+                continue
+            item = next_item.result()
+            if item is None:
+                break
+            seq, event = item
+            message = f"id: {seq}\nevent: change\ndata: {_encoder.encode(event)}\n\n"
+            await send({"type": "http.response.body", "body": message.encode(), "more_body": True})
+    finally:
+        changes.broadcast.unsubscribe(subscription)
+        disconnected.cancel()
+    # Access ended (logout, deactivation): close the response instead of idling.
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def with_change_stream(app, path=None):
+    """Wrap an ASGI app so GET ``path`` (by default the reversed stream URL) is served by :func:`change_stream`."""
+    paths = []
+
+    async def application(scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET":
+            if not paths:
+                # Reversed on first use, once the URLconf can be loaded.
+                paths.append(path or reverse(CHANGE_STREAM_URL_NAME))
+            if scope["path"].removeprefix(scope.get("root_path", "")) == paths[0]:
+                return await change_stream(scope, receive, send)
+        return await app(scope, receive, send)
+
+    return application
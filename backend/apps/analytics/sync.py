@@ -0,0 +1,196 @@
+"""Delta sync: ``?updated_since=`` on list endpoints plus delete tombstones.
+
+A list request with ``updated_since=<ISO timestamp>`` returns::
+
+    {"upserts": [...rows changed since then...],
+     "next": <cursor URL or null>,
+     "deleted": [ids removed since then],   # last page only
+     "watermark": "<timestamp to send next time>"}  # last page only
+
+Upserts are ordered by ``(updated_at, id)`` and keyset-paginated where the
+viewset paginates, so a row modified while a client is paging moves to the
+end and is still delivered. The window is widened by ``ANALYTICS_SYNC_OVERLAP``
+seconds (default 5) to cover transactions that committed after the previous
+watermark was taken; clients apply upserts and deletes idempotently.
+
+Deletes are recorded as :class:`~apps.analytics.models.Tombstone` rows, one
+bulk INSERT per model and delete (see :mod:`apps.analytics.deletion`), which
+also covers rows removed by a cascade (``Task`` -> ``TimeEntry``). Rows whose foreign key is
+nulled by a ``SET_NULL`` cascade get their ``updated_at`` bumped so they show
+up as upserts. ``deleted`` goes through the same scope as the upserts: a
+tombstone keeps the values the list filters match on (``track(scope=...)``)
+and the viewset narrows the log with ``filter_tombstones``; rows that left one
+user's view without being deleted get tombstones addressed to that user
+(:func:`revoke`). Ids the request can see again are left out. Tombstones older than ``ANALYTICS_TOMBSTONE_RETENTION_DAYS``
+(default 30) are pruned by ``manage.py prune_tombstones``; a watermark older
+than that gets 410 and the client must resync from scratch.
+"""
+from datetime import datetime, time, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models as db_models
+from django.db.models.signals import pre_delete
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from . import deletion, resultcache
+from .models import Tombstone
+
+_KEEP_ROWS = (db_models.CASCADE, db_models.PROTECT, db_models.RESTRICT, db_models.DO_NOTHING)
+_tracked = set()
+_scopes = {}
+
+
+def overlap():
+    return timedelta(seconds=getattr(settings, "ANALYTICS_SYNC_OVERLAP", 5))
+
+
+def retention():
+    return timedelta(days=getattr(settings, "ANALYTICS_TOMBSTONE_RETENTION_DAYS", 30))
+
+
+def parse_timestamp(raw, name):
+    """Aware datetime from an ISO 8601 date or datetime query value (None if empty)."""
+    if not raw:
+        return None
+    value = parse_datetime(raw)
+    if value is None:
+        day = parse_date(raw)
+        if day is None:
+            raise ValidationError({name: "Expected an ISO 8601 date or datetime."})
+        value = datetime.combine(day, time.min)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def _label(model):
+    return model._meta.concrete_model._meta.label_lower
+
+
+def record_deletes(sender, instances, batch):
+    """One INSERT for the tombstones of every ``sender`` row a delete removed."""
+    label = _label(sender)
+    paths = _scopes.get(label, {})
+    columns = {name: deletion.follow(sender, instances, path, batch) for name, path in paths.items()}
+    Tombstone.objects.using(batch.using).bulk_create(
+        [
+            Tombstone(
+                model=label,
+                object_id=str(instance.pk),
+                scope={name: values[i] for name, values in columns.items()},
+            )
+            for i, instance in enumerate(instances)
+        ]
+    )
+
+
+def revoke(model, pairs, using=DEFAULT_DB_ALIAS):
+    """Tombstones telling each user that a ``model`` row left their view; ``pairs`` are (row pk, user pk)."""
+    label = _label(model)
+    Tombstone.objects.using(using).bulk_create(
+        [Tombstone(model=label, object_id=str(pk), audience=str(user)) for pk, user in pairs]
+    )
+
+
+def touch_nulled_references(sender, instance, using, **kwargs):
+    """Bump ``updated_at`` on tracked rows whose FK to ``instance`` is about to be reset."""
+    now = timezone.now()
+    for relation in sender._meta.concrete_model._meta.related_objects:
+        model = relation.related_model
+        if (
+            not relation.field.many_to_one
+            or _label(model) not in _tracked
+            or relation.on_delete in _KEEP_ROWS
+        ):
+            continue
+        if model._base_manager.using(using).filter(**{relation.field.name: instance}).update(updated_at=now):
+            # QuerySet.update() and the cascade's own UPDATE send no signals.
+            resultcache.bump(model, using=using)
+
+
+def _each_proxy(model):
+    concrete = model._meta.concrete_model
+    return [candidate for candidate in apps.get_models() if candidate._meta.concrete_model is concrete]
+
+
+def track(*models, scope=None):
+    """Record tombstones for ``models`` (and their proxies).
+
+    ``scope`` maps names to lookups (``{"project": "task__project"}``) whose
+    values are kept on each tombstone for :meth:`DeltaSyncMixin.filter_tombstones`.
+    """
+    for model in models:
+        _tracked.add(_label(model))
+        if scope:
+            _scopes[_label(model)] = dict(scope)
+    for model in models:
+        for sender in _each_proxy(model):
+            deletion.register(sender, record_deletes, "sync.record_deletes")
+        for field in model._meta.concrete_fields:
+            if field.many_to_one and field.remote_field.on_delete not in _KEEP_ROWS:
+                for sender in _each_proxy(field.related_model):
+                    label = sender._meta.label
+                    pre_delete.connect(
+                        touch_nulled_references, sender=sender, dispatch_uid=f"sync.touch_nulled.{label}"
+                    )
+
+
+class DeltaSyncMixin:
+    """Answer ``list`` with an incremental feed when ``?updated_since=`` is given."""
+
+    sync_query_param = "updated_since"
+    # Timestamp column bumped on every write; None disables delta sync on the endpoint.
+    sync_field = "updated_at"
+
+    def filter_tombstones(self, tombstones):
+        """Narrow the tombstone log to the rows this request could have seen.
+
+        The default keeps tombstones meant for everyone; viewsets that filter
+        or restrict their rows apply the same rule to ``Tombstone.scope`` or
+        ``Tombstone.audience``.
+        """
+        return tombstones.filter(audience="")
+
+    def deleted_ids(self, queryset, since):
+        """Ids removed from ``queryset``'s scope since ``since``, minus those it holds again."""
+        model = queryset.model
+        tombstones = Tombstone.objects.filter(model=_label(model), deleted_at__gte=since)
+        ids = self.filter_tombstones(tombstones).order_by("deleted_at", "id").values_list("object_id", flat=True)
+        ids = list(dict.fromkeys(model._meta.pk.to_python(value) for value in ids))
+        if not ids:
+            return ids
+        # E.g. a user removed from a team and added back: the row is an upsert, not a delete.
+        present = set(queryset.filter(pk__in=ids).values_list("pk", flat=True))
+        return [pk for pk in ids if pk not in present]
+
+    def list(self, request, *args, **kwargs):
+        since = parse_timestamp(request.query_params.get(self.sync_query_param), self.sync_query_param)
+        if since is None:
+            return super().list(request, *args, **kwargs)
+        if self.sync_field is None:
+            raise ValidationError({self.sync_query_param: "Delta sync is not supported on this endpoint."})
+        watermark = timezone.now()
+        if since < watermark - retention():
+            return Response(
+                {"detail": "Watermark is older than the tombstone log; fetch the full list again."},
+                status=status.HTTP_410_GONE,
+            )
+        floor = since - overlap()
+        self.keyset_ordering = [self.sync_field, "id"]
+        scoped = self.filter_queryset(self.get_queryset())
+        queryset = scoped.filter(**{f"{self.sync_field}__gte": floor})
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            page = queryset.order_by(self.sync_field, "pk")
+        data = {"upserts": self.get_serializer(page, many=True).data}
+        next_link = self.paginator.get_next_link() if self.paginator is not None else None
+        if next_link:
+            data["next"] = next_link
+        else:
+            data.update(next=None, deleted=self.deleted_ids(scoped, floor), watermark=watermark)
+        return Response(data)
@@ -0,0 +1,120 @@
+"""Task hierarchies loaded with one recursive query.
+
+``WITH RECURSIVE`` walks ``Task.parent`` downwards from a task (or from a
+project's top-level tasks) and the same statement sums each task's own
+logged minutes, so a tree of any depth costs one query. Subtree totals
+(descendant estimates and minutes) are then folded bottom-up in Python over
+the rows already fetched.
+
+The recursive step is a ``UNION``, not ``UNION ALL``: a task already reached
+is not walked again, so a corrupt parent cycle ends the recursion instead of
+repeating rows. Nesting starts from the seed tasks and visits every task
+once, so a cycle cannot make a task its own descendant either. Tasks more
+than ``MAX_DEPTH`` levels down are left out to bound the response's nesting.
+"""
+from decimal import Decimal
+
+from django.db import connection
+
+from . import models
+
+MAX_DEPTH = 64
+ZERO_HOURS = Decimal("0.00")
+
+_SQL = """
+WITH RECURSIVE subtree (id) AS (
+    SELECT id FROM {task} WHERE {seed}
+    UNION
+    SELECT child.id
+    FROM {task} child JOIN subtree ON child.parent_id = subtree.id
+),
+logged (task_id, minutes) AS (
+    SELECT task_id, SUM(duration_minutes) FROM {entry}
+    WHERE task_id IN (SELECT id FROM subtree)
+    GROUP BY task_id
+)
+SELECT task.*, COALESCE(logged.minutes, 0) AS tree_logged_minutes
+FROM subtree
+JOIN {task} task ON task.id = subtree.id
+LEFT JOIN logged ON logged.task_id = task.id
+ORDER BY task.id
+"""
+
+
+def _query(seed, params):
+    qn = connection.ops.quote_name
+    sql = _SQL.format(task=qn(models.Task._meta.db_table), entry=qn(models.TimeEntry._meta.db_table), seed=seed)
+    return list(models.Task.objects.raw(sql, params))
+
+
+def _node(task):
+    return {
+        "id": task.pk,
+        "parent": task.parent_id,
+        "depth": 0,
+        "name": task.name,
+        "status": task.status,
+        "priority": task.priority,
+        "assignee": task.assignee_id,
+        "due_date": task.due_date,
+        "estimate_hours": task.estimate_hours,
+        "logged_minutes": task.tree_logged_minutes,
+        "subtree_estimate_hours": task.estimate_hours or ZERO_HOURS,
+        "subtree_logged_minutes": task.tree_logged_minutes,
+        "descendants": 0,
+        "children": [],
+    }
+
+
+def _build(tasks, is_root):
+    """Nest the flat rows under those ``is_root`` accepts and roll totals up; returns the roots.
+
+    Every task is placed once, under the first parent that reaches it, so
+    duplicate rows and parent cycles can neither repeat a task nor loop.
+    """
+    nodes, children, roots = {}, {}, []
+    for task in tasks:
+        if task.pk in nodes:
+            continue
+        node = nodes[task.pk] = _node(task)
+        if is_root(task):
+            roots.append(node)
+        else:
+            children.setdefault(task.parent_id, []).append(node)
+    # Breadth first, so ``order`` lists every parent before its children.
+    order = list(roots)
+    placed = {node["id"] for node in roots}
+    for node in order:
+        if node["depth"] >= MAX_DEPTH:
+            continue
+        for child in children.get(node["id"], ()):
+            if child["id"] not in placed:
+                placed.add(child["id"])
+                child["depth"] = node["depth"] + 1
+                node["children"].append(child)
+                order.append(child)
+    # Deepest first, so every child is complete before it is added to its parent.
+    for node in reversed(order):
+        for child in node["children"]:
+            node["subtree_estimate_hours"] += child["subtree_estimate_hours"]
+            node["subtree_logged_minutes"] += child["subtree_logged_minutes"]
+            node["descendants"] += child["descendants"] + 1
+    return roots
+
+
+def subtree(task_id):
+    """The task ``task_id`` with all its descendants nested under ``children``; None if missing."""
+    roots = _build(_query("id = %s", [task_id]), lambda task: task.pk == task_id)
+    return roots[0] if roots else None
+
+
+def project_tree(project_id):
+    """Every top-level task of a project with its descendants, plus project totals."""
+    roots = _build(_query("project_id = %s AND parent_id IS NULL", [project_id]), lambda task: task.parent_id is None)
+    return {
+        "project": project_id,
+        "tasks": roots,
+        "estimate_hours": sum((root["subtree_estimate_hours"] for root in roots), ZERO_HOURS),
+        "logged_minutes": sum(root["subtree_logged_minutes"] for root in roots),
+        "task_count": sum(root["descendants"] + 1 for root in roots),
+    }
@@ -1,3 +1,1098 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from apps.users.testing import make_user
+from . import buffer, changes, ingest, labor, models, numbering, partitions, reports, resultcache, rollup, stream
+
+API = "/analytics/api"
+
+
+class AnalyticsTestCase(APITestCase):
+    """Authenticated client and an empty result cache for every test."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("analyst@example.com")
+        cls.customer = models.Customer.objects.create(name="Acme")
+        cls.vendor = models.Vendor.objects.create(name="Supplies Ltd")
+
+    def setUp(self):
+        cache.clear()
+        resultcache.clear()
+        self.client.force_authenticate(self.user)
+
+    def make_project(self, name="Project", rows=1, budget=Decimal("1000.00")):
+        """A project with ``rows`` of each financial document, task and time entry."""
+        project = models.Project.objects.create(name=name, customer=self.customer, budget=budget)
+        for i in range(rows):
+            task = models.Task.objects.create(project=project, name=f"Task {i}", status="done" if i % 2 else "new")
+            models.TimeEntry.objects.create(user=self.user, task=task, duration_minutes=30)
+            models.Invoice.objects.create(project=project, customer=self.customer, total_amount=Decimal("100.00"))
+            models.Invoice.objects.create(
+                project=project, vendor=self.vendor, invoice_type="vendor", total_amount=Decimal("40.00")
+            )
+            models.SalesOrder.objects.create(project=project, customer=self.customer, total_amount=Decimal("70.00"))
+            models.PurchaseOrder.objects.create(project=project, vendor=self.vendor, total_amount=Decimal("20.00"))
+            models.Expense.objects.create(project=project, name=f"Expense {i}", amount=Decimal("10.00"))
+        return project
+
+
+class ProjectSummaryTests(AnalyticsTestCase):
+    def test_summary_figures(self):
+        project = self.make_project(rows=2)
+        models.Invoice.objects.create(
+            project=project, customer=self.customer, status="cancelled", total_amount=Decimal("999.00")
+        )
+        summary = project.summary()
+        self.assertEqual(summary["revenue"], Decimal("200.00"))
+        self.assertEqual(summary["bills"], Decimal("80.00"))
+        self.assertEqual(summary["expenses"], Decimal("20.00"))
+        self.assertEqual(summary["sales_orders"], Decimal("140.00"))
+        self.assertEqual(summary["purchase_orders"], Decimal("40.00"))
+        self.assertEqual(summary["spent"], Decimal("100.00"))
+        self.assertEqual(summary["profit"], Decimal("100.00"))
+        self.assertEqual(summary["budget_burn_pct"], 10.0)
+        self.assertEqual(summary["labor_minutes"], 60)
+        self.assertEqual(summary["tasks"], {"total": 2, "done": 1, "by_status": {"new": 1, "done": 1}})
+
+    def test_empty_project(self):
+        summary = models.Project.objects.create(name="Empty").summary()
+        self.assertEqual(summary["revenue"], Decimal("0.00"))
+        self.assertEqual(summary["tasks"]["total"], 0)
+        self.assertIsNone(summary["budget_burn_pct"])
+
+    def test_summary_query_count_is_fixed(self):
+        small = self.make_project("Small", rows=1)
+        large = self.make_project("Large", rows=15)
+        for project in (small, large):
+            with self.assertNumQueries(7):
+                response = self.client.get(f"{API}/projects/{project.pk}/summary/")
+            self.assertEqual(response.status_code, 200)
+
+    def test_summary_is_served_from_the_result_cache(self):
+        project = self.make_project()
+        url = f"{API}/projects/{project.pk}/summary/"
+        first = self.client.get(url).json()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json(), first)
+        models.Expense.objects.create(project=project, name="Late", amount=Decimal("5.00"))
+        self.assertEqual(self.client.get(url).json()["expenses"], "15.00")
+
+
+class PortfolioTests(AnalyticsTestCase):
+    def test_portfolio_figures(self):
+        first = self.make_project("First", rows=2)
+        self.make_project("Second", rows=1, budget=None)
+        data = self.client.get(f"{API}/projects/portfolio/").json()
+        rows = {row["name"]: row for row in data["projects"]}
+        self.assertEqual(rows["First"]["id"], first.pk)
+        self.assertEqual(rows["First"]["revenue"], "200.00")
+        self.assertEqual(rows["First"]["cost"], "100.00")
+        self.assertEqual(rows["First"]["tasks_total"], 2)
+        self.assertEqual(rows["First"]["completion_pct"], 50.0)
+        self.assertEqual(rows["Second"]["budget"], None)
+        self.assertEqual(data["totals"]["revenue"], "300.00")
+        self.assertEqual(data["totals"]["budget"], "1000.00")
+        self.assertEqual(data["totals"]["tasks_total"], 3)
+
+    def test_portfolio_query_count_is_fixed(self):
+        self.make_project("One", rows=1)
+        with self.assertNumQueries(6):
+            self.client.get(f"{API}/projects/portfolio/")
+        for i in range(10):
+            self.make_project(f"More {i}", rows=3)
+        resultcache.clear()
+        with self.assertNumQueries(6):
+            response = self.client.get(f"{API}/projects/portfolio/")
+        self.assertEqual(len(response.json()["projects"]), 11)
+
+
+class RollupTests(AnalyticsTestCase):
+    T0 = datetime(2026, 3, 2, 10, 0, tzinfo=dt_timezone.utc)
+
+    def event(self, minutes, name="page_view"):
+        return models.AnalyticsEvent.objects.create(event_name=name, timestamp=self.T0 + timedelta(minutes=minutes))
+
+    def metric(self, name, start, granularity="hour"):
+        row = models.AggregatedMetric.objects.filter(metric_name=name, period_start=start, granularity=granularity)
+        return row.values_list("value", flat=True).first()
+
+    def run_at(self, minutes, **kwargs):
+        return rollup.run_until_caught_up(now=self.T0 + timedelta(minutes=minutes) + rollup.lag(), **kwargs)
+
+    def test_hourly_and_daily_buckets(self):
+        for minutes in (5, 10, 70):
+            self.event(minutes)
+        self.event(15, name="signup")
+        stats = self.run_at(120)
+        self.assertEqual(stats["events"], 4)
+        self.assertEqual(self.metric("page_view", self.T0), 2)
+        self.assertEqual(self.metric("page_view", self.T0 + rollup.HOUR), 1)
+        self.assertEqual(self.metric("signup", self.T0), 1)
+        self.assertEqual(self.metric("page_view", self.T0.replace(hour=0), "day"), 3)
+
+    def test_incremental_run_only_writes_changed_buckets(self):
+        self.event(5)
+        self.event(70)
+        self.run_at(120)
+        untouched = models.AggregatedMetric.objects.get(metric_name="page_view", period_start=self.T0)
+        self.event(130)
+        stats = self.run_at(180)
+        self.assertEqual(stats["events"], 1)
+        self.assertEqual(stats["hourly_buckets"], 1)
+        self.assertEqual(self.metric("page_view", self.T0 + 2 * rollup.HOUR), 1)
+        self.assertEqual(self.metric("page_view", self.T0.replace(hour=0), "day"), 3)
+        untouched.refresh_from_db()
+        self.assertEqual(untouched.value, 1)
+
+    def test_events_inside_the_lag_wait_for_a_later_run(self):
+        self.event(5)
+        self.event(50)
+        self.run_at(30)
+        self.assertEqual(self.metric("page_view", self.T0), 1)
+        stats = self.run_at(60)
+        self.assertEqual(stats["events"], 1)
+        self.assertEqual(self.metric("page_view", self.T0), 2)
+
+    def test_late_event_reopens_only_its_bucket(self):
+        self.event(5)
+        self.event(130)
+        self.run_at(180)
+        checkpoint = models.RollupCheckpoint.objects.get(name=rollup.CHECKPOINT_NAME).last_timestamp
+        # Stamped before the mark, committed after the run that passed it.
+        self.event(20)
+        stats = self.run_at(185)
+        self.assertEqual((stats["events"], stats["late_events"], stats["hourly_buckets"]), (1, 1, 1))
+        self.assertEqual(self.metric("page_view", self.T0), 2)
+        self.assertEqual(self.metric("page_view", self.T0 + 2 * rollup.HOUR), 1)
+        self.assertEqual(self.metric("page_view", self.T0.replace(hour=0), "day"), 3)
+        self.assertGreater(
+            models.RollupCheckpoint.objects.get(name=rollup.CHECKPOINT_NAME).last_timestamp, checkpoint
+        )
+
+    def test_rerun_is_idempotent(self):
+        self.event(5)
+        self.run_at(60)
+        stats = self.run_at(60)
+        self.assertEqual((stats["events"], stats["hourly_buckets"]), (0, 0))
+        self.assertEqual(self.metric("page_view", self.T0), 1)
+
+    def test_since_recounts_events_older_than_the_late_window(self):
+        self.event(5)
+        self.run_at(24 * 60)
+        self.event(10)
+        self.assertEqual(self.run_at(24 * 60 + 5)["events"], 0)
+        stats = self.run_at(24 * 60 + 5, since=self.T0, max_span=rollup.HOUR)
+        self.assertEqual(stats["events"], 1)
+        self.assertEqual(self.metric("page_view", self.T0), 2)
+
+
+class IngestTests(AnalyticsTestCase):
+    url = f"{API}/events/batch/"
+
+    def post(self, body, content_type="application/json"):
+        return self.client.generic("POST", self.url, body, content_type=content_type)
+
+    def test_json_array_batch(self):
+        project = models.Project.objects.create(name="Tracked")
+        records = [
+            {"event_name": "page_view", "user": str(self.user.pk), "project": project.pk},
+            {"event_name": "signup"},
+        ]
+        response = self.post(json.dumps(records))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"received": 2, "created": 2, "errors": []})
+        event = models.AnalyticsEvent.objects.get(event_name="page_view")
+        self.assertEqual((event.user_id, event.project_id), (self.user.pk, project.pk))
+
+    def test_bad_keys_are_per_row_errors(self):
+        lines = [
+            {"event_name": "ok"},
+            {"event_name": "bad_user", "user": "abc"},
+            {"event_name": "missing_project", "project": 999999},
+            {"event_name": "ok_too", "user": str(self.user.pk)},
+        ]
+        body = "\n".join(json.dumps(line) for line in lines) + "\nnot json\n"
+        response = self.post(body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 207)
+        report = response.json()
+        self.assertEqual((report["received"], report["created"]), (5, 2))
+        self.assertEqual([error["line"] for error in report["errors"]], [2, 3, 5])
+        self.assertIn("user", report["errors"][0]["errors"])
+        self.assertIn("project", report["errors"][1]["errors"])
+        self.assertEqual(
+            set(models.AnalyticsEvent.objects.values_list("event_name", flat=True)), {"ok", "ok_too"}
+        )
+
+    def test_json_array_is_decoded_incrementally(self):
+        body = ' [ {"a": 1} , {"b": [1, 2, "]"]}, 123, "x\\u00e9y", 4.5e3, "\u00e9" ] '.encode()
+        expected = [(1, {"a": 1}), (2, {"b": [1, 2, "]"]}), (3, 123), (4, "x\u00e9y"), (5, 4500.0), (6, "\u00e9")]
+        for read_size in (1, 2, 3, 7, 1024):
+            with self.subTest(read_size=read_size):
+                self.assertEqual(list(ingest.iter_json_array(BytesIO(body), read_size=read_size)), expected)
+
+    def test_json_array_syntax_errors(self):
+        for body, index in (("[1 2]", 1), ("[{},]", 2), ('{"a": 1}', 1), ("[1, 2", 2), ("", 1)):
+            with self.subTest(body=body):
+                items = list(ingest.iter_json_array(BytesIO(body.encode()), read_size=2))
+                self.assertEqual(items[-1][0], index)
+                self.assertIsInstance(items[-1][1], ValueError)
+
+
+class EventBufferTests(AnalyticsTestCase):
+    def make_buffer(self, **options):
+        events = buffer.EventBuffer(**options)
+        # Flushed explicitly on the test thread rather than by the writer thread.
+        events.start = lambda: None
+        return events
+
+    def test_flush_writes_queued_events_in_batches(self):
+        events = self.make_buffer(batch_size=2)
+        for i in range(5):
+            self.assertTrue(events.track(f"event {i}", user=self.user, properties={"i": i}))
+        self.assertEqual(models.AnalyticsEvent.objects.count(), 0)
+        with self.assertNumQueries(3):
+            events.flush()
+        self.assertEqual(models.AnalyticsEvent.objects.filter(user=self.user).count(), 5)
+        self.assertEqual((events.stats["written"], events.stats["flushes"], events.pending()), (5, 3, 0))
+
+    def test_full_queue_blocks_then_drops(self):
+        events = self.make_buffer(max_size=1, block_timeout=0.01)
+        self.assertTrue(events.track("first"))
+        self.assertFalse(events.track("second"))
+        self.assertEqual((events.stats["blocked"], events.stats["dropped"]), (1, 1))
+
+    def test_zero_block_timeout_drops_without_waiting(self):
+        events = self.make_buffer(max_size=1, block_timeout=0)
+        events.track("first")
+        self.assertFalse(events.track("second"))
+        self.assertEqual((events.stats["blocked"], events.stats["dropped"]), (0, 1))
+
+    def test_blocked_track_succeeds_once_the_writer_makes_room(self):
+        events = self.make_buffer(max_size=1, block_timeout=5)
+        events.track("first")
+        # Stands in for the writer thread draining the queue when woken.
+        drain = mock.patch.object(events._wake, "set", side_effect=lambda: events._queue.get_nowait())
+        with drain:
+            self.assertTrue(events.track("second"))
+        self.assertEqual((events.stats["blocked"], events.stats["dropped"], events.pending()), (1, 0, 1))
+
+    def test_create_queues_the_event(self):
+        events = self.make_buffer()
+        with mock.patch.object(buffer, "get_buffer", return_value=events):
+            response = self.client.post(f"{API}/events/", {"event_name": "clicked", "user": self.user.pk}, format="json")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["event_name"], "clicked")
+        self.assertFalse(models.AnalyticsEvent.objects.exists())
+        events.flush()
+        self.assertEqual(models.AnalyticsEvent.objects.get().user_id, self.user.pk)
+
+    def test_create_reports_a_full_buffer(self):
+        events = self.make_buffer(max_size=1, block_timeout=0)
+        events.track("filler")
+        with mock.patch.object(buffer, "get_buffer", return_value=events):
+            response = self.client.post(f"{API}/events/", {"event_name": "clicked"}, format="json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+
+class EventArchiveTests(AnalyticsTestCase):
+    JAN = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(ANALYTICS_EVENT_ARCHIVE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def add_events(self, month, count):
+        return [
+            models.AnalyticsEvent.objects.create(event_name="view", timestamp=month + timedelta(days=i, hours=1))
+            for i in range(count)
+        ]
+
+    def test_archive_month_keeps_rows_written_during_the_export(self):
+        self.add_events(self.JAN, 3)
+        write = partitions._write_archive
+
+        def write_then_insert(rows, month):
+            result = write(rows, month)
+            self.add_events(self.JAN + timedelta(days=20), 1)
+            return result
+
+        with mock.patch.object(partitions, "_write_archive", side_effect=write_then_insert):
+            archive = partitions.archive_month(self.JAN)
+        self.assertEqual(archive.row_count, 3)
+        self.assertEqual(models.AnalyticsEvent.objects.count(), 1)
+        self.assertEqual(len(partitions.load_archived(self.JAN)), 3)
+
+    def test_list_pages_from_the_hot_table_into_archives(self):
+        self.add_events(self.JAN, 5)
+        partitions.archive_month(self.JAN)
+        hot = self.add_events(partitions.add_months(self.JAN, 1), 4)
+        self.assertEqual(partitions.hot_horizon(), partitions.add_months(self.JAN, 1))
+
+        url = f"{API}/events/?since=2025-12-01T00:00:00Z&page_size=3"
+        pages, loads = [], []
+        load = partitions.load_archived
+        with mock.patch.object(
+            partitions, "load_archived", side_effect=lambda *a, **kw: loads.append(a) or load(*a, **kw)
+        ):
+            while url:
+                data = self.client.get(url).json()
+                pages.append([row["timestamp"] for row in data["results"]])
+                url = data["next"]
+            self.assertEqual(len(loads), 2)
+            first_previous = self.client.get(data["previous"]).json()
+        timestamps = [stamp for page in pages for stamp in page]
+        self.assertEqual(len(timestamps), 9)
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+        self.assertEqual(pages[0], [row.timestamp.isoformat().replace("+00:00", "Z") for row in reversed(hot[1:])])
+        self.assertEqual([row["timestamp"] for row in first_previous["results"]], pages[-2])
+
+
+    def test_archived_pages_read_only_the_blocks_they_need(self):
+        blocks = mock.patch.object(partitions, "ARCHIVE_BLOCK_ROWS", 3)
+        blocks.start()
+        self.addCleanup(blocks.stop)
+        events = self.add_events(self.JAN, 3) + self.add_events(partitions.add_months(self.JAN, 1), 20)
+        # Same timestamp as the newest January event: ties are paged by id.
+        events.append(models.AnalyticsEvent.objects.create(event_name="view", timestamp=events[2].timestamp))
+        partitions.archive_month(self.JAN)
+        partitions.archive_month(partitions.add_months(self.JAN, 1))
+        self.assertEqual(len(models.EventArchive.objects.get(month=self.JAN).blocks), 2)
+        hot = models.AnalyticsEvent.objects.create(event_name="view", timestamp=partitions.add_months(self.JAN, 3))
+        expected = [hot, *sorted(events, key=lambda event: (-event.timestamp.timestamp(), event.pk))]
+
+        read = []
+        parse = partitions._parse
+
+        def counting(lines):
+            for row in parse(lines):
+                read.append(row["id"])
+                yield row
+
+        url = f"{API}/events/?since=2025-12-01T00:00:00Z&page_size=4"
+        with mock.patch.object(partitions, "_parse", side_effect=counting):
+            pages = [self.client.get(url).json()]
+            # February's newest blocks hold 2 + 3 rows; a third shows the fifth row has no ties.
+            self.assertEqual(len(read), 8)
+            while pages[-1]["next"]:
+                read.clear()
+                pages.append(self.client.get(pages[-1]["next"]).json())
+                self.assertLessEqual(len(read), 9)
+            read.clear()
+            back = self.client.get(pages[-1]["previous"]).json()
+            self.assertLessEqual(len(read), 9)
+        self.assertEqual([row["id"] for page in pages for row in page["results"]], [e.pk for e in expected])
+        self.assertEqual([row["id"] for row in back["results"]], [row["id"] for row in pages[-2]["results"]])
+
+    def test_load_archived_limits_and_keeps_ties(self):
+        events = self.add_events(self.JAN, 6)
+        tied = models.AnalyticsEvent.objects.create(event_name="view", timestamp=events[3].timestamp)
+        partitions.archive_month(self.JAN)
+        oldest = partitions.load_archived(self.JAN, limit=4)
+        self.assertEqual([event.pk for event in oldest], [e.pk for e in events[:4]] + [tied.pk])
+        newest = partitions.load_archived(self.JAN, newest_first=True, limit=2)
+        self.assertEqual([event.pk for event in newest], [events[5].pk, events[4].pk])
+        self.assertEqual(len(partitions.load_archived(self.JAN)), 7)
+        # Files from before blocks were recorded are read whole.
+        models.EventArchive.objects.update(blocks=[])
+        self.assertEqual([event.pk for event in partitions.load_archived(self.JAN, limit=4)], [e.pk for e in oldest])
+
+
+class KeysetPaginationTests(AnalyticsTestCase):
+    url = f"{API}/expenses/?page_size=2"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Three rows share each date, so pages split ties and rely on the id tie-breaker.
+        cls.expenses = [
+            models.Expense.objects.create(name=f"E{i}", amount=Decimal("1.00"), date=date(2026, 1, 1 + i // 3))
+            for i in range(7)
+        ]
+        cls.expected = [e.pk for e in sorted(cls.expenses, key=lambda e: (-e.date.toordinal(), e.pk))]
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([row["id"] for row in data["results"]])
+            url = data[link]
+        return pages
+
+    def test_forward_pages_follow_date_then_id(self):
+        pages = self.walk(self.url, "next")
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+
+    def test_previous_links_round_trip(self):
+        last = self.client.get(self.url).json()
+        while last["next"]:
+            last = self.client.get(last["next"]).json()
+        backwards = self.walk(last["previous"], "previous")
+        self.assertEqual([pk for page in reversed(backwards) for pk in page], self.expected[:-1])
+        self.assertEqual(backwards[-1], self.expected[:2])
+        first = self.client.get(self.url).json()
+        self.assertIsNone(first["previous"])
+        self.assertIsNotNone(self.client.get(first["next"]).json()["previous"])
+
+    def test_rows_inserted_between_pages_are_not_repeated(self):
+        first = self.client.get(self.url).json()
+        models.Expense.objects.create(name="New", amount=Decimal("1.00"), date=date(2026, 2, 1))
+        pages = self.walk(first["next"], "next")
+        self.assertEqual([pk for page in pages for pk in page], self.expected[2:])
+
+    def test_invalid_cursor_is_404(self):
+        for cursor in ("garbage", "eyJ2IjpbMV0sInIiOmZhbHNlfQ"):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f"{self.url}&cursor={cursor}").status_code, 404)
+
+
+class SparseFieldsetTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = models.Project.objects.create(name="Fields")
+        models.Expense.objects.create(project=self.project, name="Taxi", amount=Decimal("12.50"))
+
+    def test_list_fields_and_exclude(self):
+        row = self.client.get(f"{API}/expenses/?fields=project,name").json()["results"][0]
+        self.assertEqual(row, {"project": self.project.pk, "name": "Taxi"})
+        row = self.client.get(f"{API}/expenses/?exclude=receipt,description").json()["results"][0]
+        self.assertNotIn("receipt", row)
+        self.assertIn("amount", row)
+
+    def test_export_uses_the_list_field_names(self):
+        body = b"".join(self.client.get(f"{API}/expenses/export/csv/?fields=project,name").streaming_content)
+        self.assertEqual(body.decode().splitlines(), ["project,name", f"{self.project.pk},Taxi"])
+        full = b"".join(self.client.get(f"{API}/expenses/export/csv/").streaming_content).decode()
+        header = full.splitlines()[0].split(",")
+        list_row = self.client.get(f"{API}/expenses/").json()["results"][0]
+        self.assertEqual(set(header), set(list_row))
+
+
+class FilterParamTests(AnalyticsTestCase):
+    def test_project_filter(self):
+        project = self.make_project()
+        models.Expense.objects.create(name="Elsewhere", amount=Decimal("1.00"))
+        rows = self.client.get(f"{API}/expenses/?project={project.pk}").json()["results"]
+        self.assertEqual([row["project"] for row in rows], [project.pk])
+
+    def test_bad_project_or_date_is_400(self):
+        for query in ("project=abc", "project=1.5", "date_from=yesterday"):
+            with self.subTest(query=query):
+                response = self.client.get(f"{API}/expenses/?{query}")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(query.split("=")[0], response.json())
+
+
+class LineTotalTests(AnalyticsTestCase):
+    def make_invoice(self, lines, price="10.00"):
+        invoice = models.Invoice.objects.create(customer=self.customer)
+        for _ in range(lines):
+            models.InvoiceLine.objects.create(invoice=invoice, quantity=Decimal("2"), unit_price=Decimal(price))
+        return invoice
+
+    def header_updates(self, queries):
+        table = models.Invoice._meta.db_table
+        return [q["sql"] for q in queries if q["sql"].startswith(f'UPDATE "{table}"')]
+
+    def test_save_and_edit_keep_the_total(self):
+        invoice = self.make_invoice(3)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_amount, Decimal("60.00"))
+        line = invoice.lines.first()
+        line.quantity = Decimal("5")
+        line.save()
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_amount, Decimal("90.00"))
+
+    def test_deleting_lines_applies_one_delta_per_header(self):
+        first, second = self.make_invoice(3), self.make_invoice(2, price="1.00")
+        with CaptureQueriesContext(connection) as queries:
+            models.InvoiceLine.objects.filter(invoice__in=[first, second]).exclude(pk=first.lines.last().pk).delete()
+        self.assertEqual(len(self.header_updates(queries)), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.total_amount, second.total_amount), (Decimal("20.00"), Decimal("0.00")))
+
+    def test_single_line_delete(self):
+        invoice = self.make_invoice(2)
+        invoice.lines.first().delete()
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_amount, Decimal("20.00"))
+
+    def test_half_cent_lines_match_recompute_totals(self):
+        invoice = models.Invoice.objects.create(customer=self.customer)
+        # 0.5 x 1.25 = 0.625 and 2.5 x 0.25 = 0.625: half-even would give 0.62 each.
+        models.InvoiceLine.objects.create(invoice=invoice, quantity=Decimal("0.5"), unit_price=Decimal("1.25"))
+        models.InvoiceLine.objects.create(invoice=invoice, quantity=Decimal("2.5"), unit_price=Decimal("0.25"))
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_amount, Decimal("1.26"))
+        call_command("recompute_totals", stdout=StringIO())
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_amount, Decimal("1.26"))
+        self.assertEqual(sorted(invoice.lines.values_list("line_total", flat=True)), [Decimal("0.63")] * 2)
+
+    def test_deleting_the_header_skips_its_updates(self):
+        for lines in (1, 5):
+            invoice = self.make_invoice(lines)
+            with CaptureQueriesContext(connection) as queries:
+                invoice.delete()
+            self.assertEqual(self.header_updates(queries), [])
+            self.assertFalse(models.InvoiceLine.objects.filter(invoice_id=invoice.pk).exists())
+
+
+class NumberingTests(AnalyticsTestCase):
+    def test_numbers_use_the_document_year(self):
+        first = models.SalesOrder.objects.create(customer=self.customer, date=date(2025, 12, 31))
+        second = models.SalesOrder.objects.create(customer=self.customer, date="2025-06-01")
+        new_year = models.SalesOrder.objects.create(customer=self.customer, date=date(2026, 1, 1))
+        self.assertEqual([first.number, second.number], ["SO-2025-00001", "SO-2025-00002"])
+        self.assertEqual(new_year.number, "SO-2026-00001")
+        bill = models.Invoice.objects.create(vendor=self.vendor, invoice_type="vendor", date=date(2024, 3, 1))
+        self.assertEqual(bill.number, "BILL-2024-00001")
+
+    def test_reserve_many(self):
+        self.assertEqual(numbering.reserve("invoice", 3, year=2026), [f"INV-2026-0000{i}" for i in (1, 2, 3)])
+        self.assertEqual(numbering.next_number("invoice", 2026), "INV-2026-00004")
+
+    def test_sequence_is_remembered_only_after_commit(self):
+        name = "docnum_test_2026"
+        self.addCleanup(numbering._known_sequences.discard, name)
+        cursor = mock.MagicMock()
+        with mock.patch.object(numbering.connection, "cursor", return_value=cursor):
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                try:
+                    with transaction.atomic():
+                        numbering._ensure_sequence(name)
+                        raise RuntimeError("rolled back")
+                except RuntimeError:
+                    pass
+            self.assertEqual(callbacks, [])
+            self.assertNotIn(name, numbering._known_sequences)
+            with self.captureOnCommitCallbacks(execute=True):
+                numbering._ensure_sequence(name)
+        self.assertIn(name, numbering._known_sequences)
+        cursor.__enter__.return_value.execute.assert_any_call(f'CREATE SEQUENCE IF NOT EXISTS "{name}"')
+
+
+class BatchTests(AnalyticsTestCase):
+    url = f"{API}/expenses/bulk/"
+
+    def expenses(self, count):
+        return [models.Expense.objects.create(name=f"E{i}", amount=Decimal("1.00")) for i in range(count)]
+
+    def post(self, body):
+        return self.client.post(self.url, body, format="json")
+
+    def queries_for(self, body):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(body)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+    def test_create_update_delete(self):
+        old, kept = self.expenses(2)
+        response = self.post({
+            "create": [{"name": "New", "amount": "3.00"}],
+            "update": [{"id": kept.pk, "amount": "9.00"}],
+            "delete": [old.pk],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(models.Expense.objects.values_list("name", "amount")), {("New", Decimal("3.00")), ("E1", Decimal("9.00"))})
+        self.assertTrue(models.Tombstone.objects.filter(model="analytics.expense", object_id=str(old.pk)).exists())
+
+    def test_delete_query_count_is_fixed(self):
+        counts = [self.queries_for({"delete": [e.pk for e in self.expenses(n)]}) for n in (5, 50)]
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(models.Tombstone.objects.filter(model="analytics.expense").count(), 55)
+
+    def test_create_and_update_query_count_is_fixed(self):
+        for group in ("create", "update"):
+            counts = []
+            for n in (5, 50):
+                if group == "create":
+                    items = [{"name": f"N{i}", "amount": "1.00"} for i in range(n)]
+                else:
+                    items = [{"id": e.pk, "amount": "2.00"} for e in self.expenses(n)]
+                counts.append(self.queries_for({group: items}))
+            with self.subTest(group=group):
+                self.assertEqual(counts[0], counts[1])
+
+    def test_delete_notifications_are_resolved_per_batch(self):
+        published = []
+        stream = mock.MagicMock(
+            __bool__=lambda _: True,
+            user_ids=lambda: {self.user.pk},
+            publish=lambda event, project, users: published.append((event, users)),
+        )
+        project = self.make_project(rows=0)
+        models.Project.objects.filter(pk=project.pk).update(owner=self.user)
+        task = models.Task.objects.create(project=project, name="Timed")
+        counts = []
+        with mock.patch.object(changes, "broadcast", stream):
+            for n in (5, 50):
+                entries = [
+                    models.TimeEntry.objects.create(user=self.user, task=task, duration_minutes=1) for _ in range(n)
+                ]
+                with self.captureOnCommitCallbacks(execute=True):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.post(
+                            f"{API}/time-entries/bulk/", {"delete": [e.pk for e in entries]}, format="json"
+                        )
+                self.assertEqual(response.status_code, 200)
+                counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        deletes = [(event, users) for event, users in published if event["op"] == "delete"]
+        self.assertEqual(len(deletes), 55)
+        self.assertEqual({event["project"] for event, _ in deletes}, {project.pk})
+        self.assertTrue(all(users == {self.user.pk} for _, users in deletes))
+
+    def test_malformed_bodies_are_400(self):
+        expense = self.expenses(1)[0]
+        for body in (
+            [1, 2],
+            {"update": [{"id": "abc", "amount": "1.00"}]},
+            {"delete": ["abc", {"id": 1}]},
+            {"update": {"id": expense.pk}},
+            {"mode": "sometimes"},
+        ):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+        response = self.post({"mode": "best_effort", "update": [{"id": "abc"}, {"id": expense.pk, "name": "Renamed"}]})
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()["update"][0]["errors"], {"id": ["Invalid id."]})
+        expense.refresh_from_db()
+        self.assertEqual(expense.name, "Renamed")
+
+
+class ConditionalGetTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.expense = models.Expense.objects.create(name="Taxi", amount=Decimal("12.50"))
+
+    def test_list_costs_one_query_and_no_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"{API}/expenses/")
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("COUNT(", queries[0]["sql"])
+        self.assertIn("ETag", response)
+
+    def test_if_none_match_returns_304_without_querying_until_the_data_changes(self):
+        for url in (f"{API}/expenses/", f"{API}/expenses/{self.expense.pk}/"):
+            with self.subTest(url=url):
+                etag = self.client.get(url)["ETag"]
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+                self.expense.name = f"Taxi {url}"
+                self.expense.save()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response["ETag"], etag)
+
+    def test_writes_around_the_orm_signals_bump_the_etag(self):
+        url = f"{API}/expenses/"
+        etag = self.client.get(url)["ETag"]
+        models.Expense.objects.filter(pk=self.expense.pk).update(name="Cab")
+        resultcache.bump(models.Expense)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_nested_lines_change_the_header_etag(self):
+        invoice = models.Invoice.objects.create(customer=self.customer)
+        url = f"{API}/invoices/{invoice.pk}/"
+        etag = self.client.get(url)["ETag"]
+        models.InvoiceLine.objects.create(invoice=invoice, quantity=Decimal("1"), unit_price=Decimal("5.00"))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_is_per_user(self):
+        url = f"{API}/expenses/"
+        etag = self.client.get(url)["ETag"]
+        self.client.force_authenticate(make_user("other@example.com"))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_deleted_row_changes_the_list_etag(self):
+        other = models.Expense.objects.create(name="Bus", amount=Decimal("2.00"))
+        etag = self.client.get(f"{API}/expenses/")["ETag"]
+        other.delete()
+        self.assertEqual(self.client.get(f"{API}/expenses/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_malformed_or_unknown_id_is_404(self):
+        for pk in ("abc", "999999"):
+            with self.subTest(pk=pk):
+                self.assertEqual(self.client.get(f"{API}/products/{pk}/").status_code, 404)
+
+
+class ResultCacheTests(AnalyticsTestCase):
+    url = f"{API}/products/"
+
+    def test_hit_path_skips_the_database(self):
+        models.Product.objects.create(name="Widget", sales_price=Decimal("3.00"))
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["ETag"], first["ETag"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+        self.assertEqual(resultcache.stats()["hits"], 2)
+
+    def test_writes_bump_the_table_version(self):
+        product = models.Product.objects.create(name="Widget", sales_price=Decimal("3.00"))
+        before = resultcache.versions([models.Product])
+        self.client.get(self.url)
+        product.name = "Gadget"
+        product.save()
+        self.assertNotEqual(resultcache.versions([models.Product]), before)
+        self.assertEqual(self.client.get(self.url).json()["results"][0]["name"], "Gadget")
+        models.Product.objects.bulk_create([models.Product(name="Bulk")])
+        self.assertEqual(len(self.client.get(self.url).json()["results"]), 1)
+        resultcache.bump(models.Product)
+        self.assertEqual(len(self.client.get(self.url).json()["results"]), 2)
+
+    def test_expired_entries_do_not_evict_live_ones(self):
+        clock = [1000.0]
+        with override_settings(ANALYTICS_RESULT_CACHE={"MAX_BYTES": 200, "TIMEOUT": 10}), mock.patch.object(
+            resultcache.time, "monotonic", lambda: clock[0]
+        ):
+            resultcache.store("a", "x" * 120)
+            clock[0] += 11
+            resultcache.store("b", "y" * 120)
+            self.assertEqual(resultcache.stats()["evictions"], 0)
+            self.assertEqual(resultcache.stats()["entries"], 1)
+            resultcache.store("c", "z" * 120)
+            self.assertEqual(resultcache.stats()["evictions"], 1)
+            self.assertIsNone(resultcache.lookup("b"))
+            self.assertEqual(resultcache.lookup("c"), "z" * 120)
+
+
+class FinancialWorkspaceTests(AnalyticsTestCase):
+    url = f"{API}/finance/bootstrap/"
+
+    def test_malformed_project_is_rejected(self):
+        response = self.client.get(self.url, {"project": "abc"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("project", response.json())
+
+    def test_receipts_are_absolute_urls(self):
+        project = self.make_project()
+        models.Expense.objects.create(
+            project=project, name="Taxi", amount=Decimal("12.00"), receipt="expenses/receipts/taxi.pdf"
+        )
+        expenses = self.client.get(self.url, {"project": project.pk}).json()["expenses"]
+        receipts = {row["name"]: row["receipt"] for row in expenses}
+        listed = self.client.get(f"{API}/expenses/", {"project": project.pk}).json()["results"]
+        self.assertEqual(receipts, {row["name"]: row["receipt"] for row in listed})
+        self.assertTrue(receipts["Taxi"].startswith("http://testserver/"))
+        self.assertIsNone(receipts["Expense 0"])
+
+
+class DeltaSyncTests(AnalyticsTestCase):
+    def sync(self, path, **params):
+        since = (datetime.now(dt_timezone.utc) - timedelta(minutes=1)).isoformat()
+        response = self.client.get(f"{API}/{path}/", {"updated_since": since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_deleted_follows_the_list_filters(self):
+        first, second = self.make_project("First"), self.make_project("Second")
+        old = models.Expense.objects.create(project=first, name="Old", amount=Decimal("1.00"), date=date(2024, 1, 5))
+        gone = [old.pk] + [expense.pk for expense in first.expenses.exclude(pk=old.pk)]
+        other = list(second.expenses.values_list("pk", flat=True))
+        models.Expense.objects.filter(project__in=[first, second]).delete()
+        self.assertEqual(sorted(self.sync("expenses", project=first.pk)["deleted"]), sorted(gone))
+        self.assertEqual(self.sync("expenses", project=second.pk)["deleted"], other)
+        self.assertEqual(self.sync("expenses", project=first.pk, date_to="2024-01-31")["deleted"], [old.pk])
+        self.assertEqual(len(self.sync("expenses")["deleted"]), len(gone) + len(other))
+
+    def test_cascaded_rows_keep_their_project(self):
+        first, second = self.make_project("First", rows=2), self.make_project("Second")
+        entries = sorted(models.TimeEntry.objects.filter(task__project=first).values_list("pk", flat=True))
+        with self.assertNumQueries(7):
+            # SELECT tasks, subtasks and entries, DELETE entries and tasks, one tombstone INSERT
+            # per model; the entries' project comes from the tasks removed alongside them.
+            first.tasks.all().delete()
+        self.assertEqual(sorted(self.sync("time-entries", project=first.pk)["deleted"]), entries)
+        self.assertEqual(self.sync("time-entries", project=second.pk)["deleted"], [])
+
+
+class ChangeStreamTests(AnalyticsTestCase):
+    def event(self, project):
+        return {"model": "analytics.task", "op": "upsert", "id": 1, "project": project}
+
+    def key(self, project):
+        return (models.Project, project)
+
+    def test_events_fan_out_by_project(self):
+        async def run():
+            hub = changes.Broadcast()
+            first = hub.subscribe(1, project=self.key(10))
+            second = hub.subscribe(2, project=self.key(20))
+            everything = hub.subscribe(3)
+            hidden = hub.subscribe(4)
+            hub.publish(self.event(10), self.key(10), {1, 2, 3})
+            hub.publish(self.event(None), self.key(None), {3})
+            await asyncio.sleep(0)
+            return hub, [sub.queue.qsize() for sub in (first, second, everything, hidden)]
+
+        hub, sizes = asyncio.run(run())
+        self.assertEqual(sizes, [1, 0, 2, 0])
+        self.assertEqual(hub.stats, {"published": 2, "delivered": 3})
+
+    def test_streams_only_get_changes_of_visible_projects(self):
+        from apps.projects.models import Project as TeamProject
+        from apps.tasks.models import Task as TeamTask
+
+        member = make_user("member@example.com")
+        stranger = make_user("stranger@example.com")
+        owned = models.Project.objects.create(name="Owned", owner=self.user)
+        team = TeamProject.objects.create(name="Team")
+        team.team.add(member)
+        self.assertTrue(changes.can_see(models.Project, owned.pk, self.user.pk))
+        self.assertFalse(changes.can_see(models.Project, owned.pk, stranger.pk))
+        self.assertTrue(changes.can_see(TeamProject, team.pk, member.pk))
+        loop = asyncio.new_event_loop()
+
+        async def subscribe():
+            return [
+                changes.broadcast.subscribe(self.user.pk),
+                changes.broadcast.subscribe(member.pk),
+                changes.broadcast.subscribe(stranger.pk),
+                # Not offered by the endpoint, which checks ?project= first.
+                changes.broadcast.subscribe(stranger.pk, project=self.key(owned.pk)),
+            ]
+
+        subscriptions = loop.run_until_complete(subscribe())
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                models.Task.objects.create(project=owned, name="Analytics")
+                TeamTask.objects.create(project=team, name="Team")
+            with self.captureOnCommitCallbacks(execute=True):
+                team.delete()
+            loop.run_until_complete(asyncio.sleep(0))
+            received = [
+                [sub.queue.get_nowait()[1]["model"] for _ in range(sub.queue.qsize())] for sub in subscriptions
+            ]
+        finally:
+            for subscription in subscriptions:
+                changes.broadcast.unsubscribe(subscription)
+            loop.close()
+        self.assertEqual(received[0], ["analytics.task"])
+        # The project's delete still reaches the member whose membership it removed.
+        self.assertEqual(sorted(received[1]), ["projects.project", "tasks.task", "tasks.task"])
+        self.assertEqual(received[2:], [[], []])
+
+    def test_revoke_closes_the_users_streams(self):
+        async def run():
+            hub = changes.Broadcast()
+            kept = hub.subscribe(1, "other-session")
+            closed = hub.subscribe(1, "session", project=self.key(10))
+            stranger = hub.subscribe(2, "session")
+            hub.revoke(1, "session")
+            await asyncio.sleep(0)
+            hub.publish(self.event(10), self.key(10), {1, 2})
+            await asyncio.sleep(0)
+            return [(sub.revoked, sub.queue.qsize()) for sub in (kept, closed, stranger)]
+
+        # The revoked stream holds only the wake-up sentinel and gets no further events.
+        self.assertEqual(asyncio.run(run()), [(False, 1), (True, 1), (False, 1)])
+
+    def test_logout_and_deactivation_revoke(self):
+        with mock.patch.object(changes.broadcast, "revoke") as revoke:
+            self.client.force_authenticate(None)
+            self.client.force_login(self.user)
+            self.client.logout()
+            revoke.assert_called_once_with(self.user.pk, mock.ANY)
+            revoke.reset_mock()
+            self.user.is_active = False
+            self.user.save()
+            revoke.assert_called_once_with(self.user.pk)
+
+    def stream(self, path, query_string=b"", events=()):
+        sent = []
+
+        async def run():
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                sent.append(message)
+
+            app = stream.with_change_stream(mock.AsyncMock())
+            scope = {"type": "http", "method": "GET", "path": path, "query_string": query_string, "headers": []}
+            task = asyncio.ensure_future(app(scope, receive, send))
+            for _ in range(20):
+                await asyncio.sleep(0.01)
+                if changes.broadcast:
+                    break
+            for event in events:
+                changes.broadcast.publish(event, self.key(event["project"]), {self.user.pk})
+            await asyncio.sleep(0.01)
+            changes.broadcast.revoke(self.user.pk)
+            await asyncio.wait_for(task, 1)
+
+        with mock.patch.object(stream, "_authenticate", return_value=(self.user, "session")):
+            asyncio.run(run())
+        return sent
+
+    def test_stream_is_served_at_the_reversed_url(self):
+        path = reverse("change-stream")
+        self.assertEqual(path, f"{API}/changes/stream/")
+        with mock.patch.object(changes, "can_see", return_value=True) as can_see:
+            sent = self.stream(path, b"project=10", [self.event(20), self.event(10)])
+        # The stream's own database connection cannot see the test transaction.
+        can_see.assert_called_once_with(models.Project, 10, self.user.pk)
+        self.assertEqual(sent[0]["status"], 200)
+        body = b"".join(message.get("body", b"") for message in sent[1:]).decode()
+        self.assertEqual(body.count("event: change"), 1)
+        self.assertIn('"project":10', body)
+        self.assertFalse(sent[-1]["more_body"])
+
+    def test_project_the_user_cannot_see_is_not_found(self):
+        with mock.patch.object(changes, "can_see", return_value=False):
+            sent = self.stream(reverse("change-stream"), b"project=10")
+        self.assertEqual(sent[0]["status"], 404)
+
+    def test_malformed_project_is_rejected(self):
+        sent = self.stream(reverse("change-stream"), b"project=abc")
+        self.assertEqual(sent[0]["status"], 400)
+
+
+class TimesheetTests(AnalyticsTestCase):
+    url = f"{API}/time-entries/timesheet/"
+
+    def test_user_filter(self):
+        other = make_user("other@example.com")
+        project = self.make_project(rows=2)
+        models.TimeEntry.objects.create(user=other, task=project.tasks.first(), duration_minutes=45)
+        rows = self.client.get(self.url, {"user": f"{other.pk}"}).json()["rows"]
+        self.assertEqual([(str(row["user"]), row["total"]) for row in rows], [(str(other.pk), 45)])
+        both = self.client.get(self.url, {"user": f"{self.user.pk},{other.pk}"}).json()["rows"]
+        self.assertEqual(sum(row["total"] for row in both), 105)
+
+    def test_users_are_keyed_by_string_pk(self):
+        # JSON object keys must be strings, which a UUID pk (apps.users.User) is not.
+        other = make_user("other@example.com")
+        project = self.make_project(rows=1)
+        models.TimeEntry.objects.create(user=other, task=project.tasks.first(), duration_minutes=45)
+        data = reports.timesheet(models.TimeEntry.objects.all())
+        self.assertEqual(set(data["users"]), {str(self.user.pk), str(other.pk)})
+        self.assertEqual(set(data["user_totals"]), set(data["users"]))
+        body = self.client.get(self.url).json()
+        self.assertEqual(body["users"][str(other.pk)], getattr(other, other.USERNAME_FIELD))
+        self.assertEqual(sum(body["user_totals"][str(other.pk)]), 45)
+
+    def test_malformed_user_is_rejected(self):
+        for value in ("abc", "1,", "1,x"):
+            with self.subTest(value=value):
+                response = self.client.get(self.url, {"user": value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("user", response.json())
+
+
+class LaborCostTests(AnalyticsTestCase):
+    url = f"{API}/time-entries/labor-cost/"
+
+    def set_rate(self, user, rate):
+        """Price ``user``'s time at ``rate``: their ``hourly_rate`` column, else a LaborRate row."""
+        if labor.rate_field() == "hourly_rate":
+            user.hourly_rate = rate
+            user.save(update_fields=["hourly_rate"])
+        else:
+            models.LaborRate.objects.update_or_create(user=user, defaults={"hourly_rate": rate})
+
+    def test_rates_price_time_under_any_user_model(self):
+        project = self.make_project(rows=2)
+        self.set_rate(self.user, Decimal("45.50"))
+        other = make_user("other@example.com")
+        models.TimeEntry.objects.create(user=other, task=project.tasks.first(), duration_minutes=20)
+        with self.assertNumQueries(1):
+            totals = self.client.get(self.url).json()
+        # 60 minutes at 45.50; the other user has no rate.
+        self.assertEqual(totals, {"minutes": 80, "cost": "45.50"})
+        by_user = {str(row["user"]): row["cost"] for row in self.client.get(self.url, {"by": "user"}).json()}
+        self.assertEqual(by_user, {str(self.user.pk): "45.50", str(other.pk): "0.00"})
+        if labor.rate_field() != "hourly_rate":
+            # Only LaborRate leaves users without a rate; the hourly_rate column defaults to 0.
+            with override_settings(ANALYTICS_DEFAULT_HOURLY_RATE=30):
+                self.assertEqual(self.client.get(self.url).json()["cost"], "55.50")
+
+    def test_reports_send_money_as_strings(self):
+        project = self.make_project(rows=2)
+        self.set_rate(self.user, Decimal("10.00"))
+        summary = self.client.get(f"{API}/projects/{project.pk}/summary/").json()
+        self.assertEqual((summary["labor_cost"], summary["margin"]), ("10.00", "90.00"))
+        totals = self.client.get(f"{API}/projects/portfolio/").json()["totals"]
+        self.assertEqual((totals["labor_cost"], totals["margin"]), ("10.00", "90.00"))
+
+    def test_rate_changes_reach_the_cached_summary(self):
+        project = self.make_project()
+        url = f"{API}/projects/{project.pk}/summary/"
+        self.assertEqual(self.client.get(url).json()["labor_cost"], "0.00")
+        self.set_rate(self.user, Decimal("60.00"))
+        self.assertEqual(self.client.get(url).json()["labor_cost"], "30.00")
+
+
+class TaskTreeTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = self.make_project(rows=0)
+
+    def task(self, name, parent=None, hours="1.00"):
+        return models.Task.objects.create(project=self.project, name=name, parent=parent, estimate_hours=Decimal(hours))
+
+    def test_tree_rolls_totals_up(self):
+        root = self.task("Root")
+        child = self.task("Child", root)
+        leaf = self.task("Leaf", child, "2.50")
+        models.TimeEntry.objects.create(user=self.user, task=leaf, duration_minutes=30)
+        with self.assertNumQueries(1):
+            response = self.client.get(f"{API}/tasks/tree/", {"project": self.project.pk})
+        data = response.json()
+        self.assertEqual((data["task_count"], data["estimate_hours"], data["logged_minutes"]), (3, 4.5, 30))
+        [top] = data["tasks"]
+        self.assertEqual((top["id"], top["descendants"], top["subtree_logged_minutes"]), (root.pk, 2, 30))
+        self.assertEqual(top["children"][0]["children"][0]["depth"], 2)
+        node = self.client.get(f"{API}/tasks/{child.pk}/subtree/").json()
+        self.assertEqual((node["depth"], node["descendants"], node["subtree_estimate_hours"]), (0, 1, 3.5))
+
+    def test_parent_cycle_ends(self):
+        first = self.task("First")
+        second = self.task("Second", first)
+        third = self.task("Third", second)
+        models.Task.objects.filter(pk=first.pk).update(parent=third)
+        for task in (first, second, third):
+            with self.subTest(task=task.name):
+                response = self.client.get(f"{API}/tasks/{task.pk}/subtree/")
+                self.assertEqual(response.status_code, 200)
+                node = response.json()
+                self.assertEqual((node["id"], node["descendants"]), (task.pk, 2))
+                self.assertEqual(len(node["children"]), 1)
+                self.assertEqual(node["children"][0]["children"][0]["children"], [])
+
+    def test_bad_ids(self):
+        self.assertEqual(self.client.get(f"{API}/tasks/abc/subtree/").status_code, 404)
+        self.assertEqual(self.client.get(f"{API}/tasks/999/subtree/").status_code, 404)
+        self.assertEqual(self.client.get(f"{API}/tasks/tree/", {"project": "abc"}).status_code, 400)
+        self.assertEqual(self.client.get(f"{API}/tasks/tree/").status_code, 400)
@@ -38,6 +38,10 @@ _register("analytics", r"events", views.AnalyticsEventViewSet, "analyticsevent")
 _register("aggregated_metrics", r"aggregated-metrics", views.AggregatedMetricViewSet, "aggregatedmetric")
 
 urlpatterns = [
+    path("api/finance/bootstrap/", views.FinancialWorkspaceView.as_view(), name="finance-bootstrap"),
+    path("api/cache-stats/", views.ResultCacheStatsView.as_view(), name="result-cache-stats"),
+    # Answered by apps.analytics.stream in front of Django; routed here so its URL can be reversed.
+    path("api/changes/stream/", views.ChangeStreamView.as_view(), name="change-stream"),
     path("api/", include(router.urls)),
 ]
 
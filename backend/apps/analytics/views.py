@@ -1,8 +1,21 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
 from django.shortcuts import render
-from rest_framework import viewsets, permissions
+from django.utils.dateparse import parse_date
+from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from . import models, serializers
+from rest_framework.views import APIView
+
+from apps.users.permissions import HasRole
+from . import batch, buffer, exports, ingest, labor, models, partitions, reports, resultcache, serializers, sync, tasktree
+from .conditional import ConditionalGetMixin
+from .pagination import KeysetPagination
+from .resultcache import ResultCacheMixin
+from .sync import DeltaSyncMixin
 
 # Create your views here.
 
@@ -10,97 +23,419 @@ class IsAuthenticated(permissions.IsAuthenticated):
     pass
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+def parse_project_param(params):
+    """The ``?project=`` id as a Project pk value, None when absent; 400 when malformed."""
+    if not params.get("project"):
+        return None
+    try:
+        return models.Project._meta.pk.to_python(params["project"])
+    except DjangoValidationError:
+        raise ValidationError({"project": "Expected a project id."})
+
+
+class AnalyticsModelViewSet(ConditionalGetMixin, DeltaSyncMixin, viewsets.ModelViewSet):
+    """Base for the analytics router: authenticated, keyset-paginated, sparse-fieldset aware,
+    ETag-validated and delta-syncable with ?updated_since=."""
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    # Lookups behind ?date_from= / ?date_to= / ?project=; None disables the filter.
+    date_filter_field = None
+    project_filter_field = None
+
+    def filter_by_date_and_project(self, queryset, date_field=None, project_field=None):
+        """Apply ?date_from= / ?date_to= / ?project= to ``date_field`` / ``project_field``
+        (by default the viewset's own lookups)."""
+        params = self.request.query_params
+        date_field = date_field or self.date_filter_field
+        project_field = project_field or self.project_filter_field
+        if date_field:
+            for param, lookup in (("date_from", "gte"), ("date_to", "lte")):
+                if params.get(param):
+                    value = parse_date(params[param])
+                    if value is None:
+                        raise ValidationError({param: "Expected an ISO 8601 date."})
+                    queryset = queryset.filter(**{f"{date_field}__{lookup}": value})
+        project = parse_project_param(params) if project_field else None
+        if project is not None:
+            queryset = queryset.filter(**{project_field: project})
+        return queryset
+
+    def filter_tombstones(self, tombstones):
+        # Tombstones carry the filtered values under these keys (signals.SYNC_SCOPES).
+        return self.filter_by_date_and_project(
+            super().filter_tombstones(tombstones),
+            date_field=self.date_filter_field and "scope__date",
+            project_field=self.project_filter_field and "scope__project",
+        )
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request is not None:
+            queryset = self.filter_by_date_and_project(queryset)
+        if serializers.field_selection(self.request) is None:
+            return queryset
+        serializer_fields = self.get_serializer_class()().fields
+        selected = serializers.requested_fields(self.request, list(serializer_fields))
+        return self.narrow_queryset(queryset, selected, serializer_fields)
+
+    def narrow_queryset(self, queryset, selected, serializer_fields):
+        """Load only the columns (and prefetches) behind the selected serializer fields.
+
+        Ordering columns stay loaded so keyset cursors never trigger deferred loads.
+        """
+        model = queryset.model
+        columns = {"id"} | {name.lstrip("-") for name in KeysetPagination().get_ordering(self, model)}
+        relations = set()
+        for name in selected:
+            source = serializer_fields[name].source
+            try:
+                field = model._meta.get_field(source.split(".")[0])
+            except FieldDoesNotExist:
+                return queryset
+            if field.concrete and not field.many_to_many:
+                columns.add(field.name)
+            else:
+                relations.add(field.name)
+        prefetches = [lookup for lookup in queryset._prefetch_related_lookups if str(lookup).split("__")[0] in relations]
+        return queryset.select_related(None).prefetch_related(None).prefetch_related(*prefetches).only(*columns)
+
+
+class ExportMixin:
+    """Adds ``export/csv/`` and ``export/ndjson/`` list routes that stream the filtered rows."""
+    export_filename = "export"
+
+    @action(detail=False, methods=["get"], url_path=r"export/(?P<fmt>csv|ndjson)")
+    def export(self, request, fmt=None):
+        queryset = self.filter_queryset(self.get_queryset())
+        columns = exports.export_columns(queryset.model)
+        columns = serializers.requested_fields(request, columns) or columns
+        return exports.stream_export(queryset, columns, fmt, self.export_filename)
+
+
+class BatchMixin:
+    """Adds a ``bulk/`` list route applying many creates, updates and deletes at once."""
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        results, ok = batch.run_batch(self, request.data)
+        if ok:
+            return Response(results)
+        mode = request.data.get("mode", "atomic")
+        return Response(results, status=status.HTTP_400_BAD_REQUEST if mode == "atomic" else status.HTTP_207_MULTI_STATUS)
+
+
+_PROJECT_FINANCIALS = [
+    models.Project, models.Task, models.TimeEntry, models.Invoice,
+    models.Expense, models.SalesOrder, models.PurchaseOrder,
+    get_user_model(), models.LaborRate,  # hourly rates price the labor cost
+]
+
+
+class ProjectViewSet(ResultCacheMixin, BatchMixin, AnalyticsModelViewSet):
     queryset = models.Project.objects.all().select_related("owner", "customer")
     serializer_class = serializers.ProjectSerializer
     permission_classes = [IsAuthenticated]
+    # Only the aggregate actions are cached; plain reads go through the ETag path.
+    result_cache_actions = ()
+    result_cache_action_models = {"summary": _PROJECT_FINANCIALS, "portfolio": _PROJECT_FINANCIALS}
 
     @action(detail=True, methods=["get"])
     def summary(self, request, pk=None):
-        proj = self.get_object()
-        data = proj.summary()
-        return Response(data)
+        return self.cached_response(request, lambda: Response(labor.money_strings(self.get_object().summary())))
+
+    @action(detail=False, methods=["get"])
+    def portfolio(self, request):
+        return self.cached_response(
+            request,
+            lambda: Response(labor.money_strings(reports.portfolio_summary(self.filter_queryset(self.get_queryset())))),
+        )
 
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(BatchMixin, AnalyticsModelViewSet):
     queryset = models.Task.objects.all().select_related("project", "assignee")
     serializer_class = serializers.TaskSerializer
     permission_classes = [IsAuthenticated]
 
-
-class TimeEntryViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=["get"])
+    def subtree(self, request, pk=None):
+        """This task and all its descendants, each with rolled-up estimates and logged minutes."""
+        try:
+            node = tasktree.subtree(models.Task._meta.pk.to_python(pk))
+        except DjangoValidationError:
+            node = None
+        if node is None:
+            raise NotFound()
+        return Response(node)
+
+    @action(detail=False, methods=["get"])
+    def tree(self, request):
+        """All tasks of ?project= as a forest, with subtree and project totals."""
+        project = parse_project_param(request.query_params)
+        if project is None:
+            raise ValidationError({"project": "A project id is required."})
+        return Response(tasktree.project_tree(project))
+
+
+class TimeEntryViewSet(ExportMixin, BatchMixin, AnalyticsModelViewSet):
     queryset = models.TimeEntry.objects.all().select_related("task", "user")
     serializer_class = serializers.TimeEntrySerializer
     permission_classes = [IsAuthenticated]
-
-
-class ProductViewSet(viewsets.ModelViewSet):
+    date_filter_field = "date"
+    project_filter_field = "task__project"
+    export_filename = "time-entries"
+    page_size = 100
+    max_page_size = 1000
+
+    @action(detail=False, methods=["get"])
+    def timesheet(self, request):
+        """Minutes per user / ISO week / project / task, summed in SQL.
+
+        Takes the list filters (?date_from=, ?date_to=, ?project=) plus
+        ?user=<id>[,<id>...].
+        """
+        entries = self.filter_queryset(self.get_queryset())
+        if request.query_params.get("user"):
+            to_pk = get_user_model()._meta.pk.to_python
+            try:
+                users = [to_pk(value) for value in request.query_params["user"].split(",")]
+            except DjangoValidationError:
+                raise ValidationError({"user": "Expected a comma-separated list of user ids."})
+            entries = entries.filter(user__in=users)
+        return Response(reports.timesheet(entries))
+
+    @action(detail=False, methods=["get"], url_path="labor-cost")
+    def labor_cost(self, request):
+        """Minutes and cost (minutes x user hourly_rate) in one aggregate query.
+
+        ?by= groups by any of project, task, user, date, week, month
+        (comma-separated); without it the totals are returned. Takes the list
+        filters (?date_from=, ?date_to=, ?project=).
+        """
+        by = [key for key in request.query_params.get("by", "").split(",") if key]
+        unknown = set(by) - set(labor.GROUPS)
+        if unknown:
+            raise ValidationError({"by": f"Expected any of {', '.join(labor.GROUPS)}."})
+        return Response(labor.money_strings(labor.labor_cost(self.filter_queryset(self.get_queryset()), by)))
+
+
+class ProductViewSet(ResultCacheMixin, BatchMixin, AnalyticsModelViewSet):
     queryset = models.Product.objects.all()
     serializer_class = serializers.ProductSerializer
     permission_classes = [IsAuthenticated]
 
 
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(ResultCacheMixin, BatchMixin, AnalyticsModelViewSet):
     queryset = models.Customer.objects.all()
     serializer_class = serializers.CustomerSerializer
     permission_classes = [IsAuthenticated]
 
 
-class VendorViewSet(viewsets.ModelViewSet):
+class VendorViewSet(ResultCacheMixin, BatchMixin, AnalyticsModelViewSet):
     queryset = models.Vendor.objects.all()
     serializer_class = serializers.VendorSerializer
     permission_classes = [IsAuthenticated]
 
 
-class SalesOrderViewSet(viewsets.ModelViewSet):
+class SalesOrderViewSet(AnalyticsModelViewSet):
     queryset = models.SalesOrder.objects.all().prefetch_related("lines")
     serializer_class = serializers.SalesOrderSerializer
+    conditional_models = [models.SalesOrder, models.SalesOrderLine]
     permission_classes = [IsAuthenticated]
 
 
-class SalesOrderLineViewSet(viewsets.ModelViewSet):
+class SalesOrderLineViewSet(AnalyticsModelViewSet):
     queryset = models.SalesOrderLine.objects.all()
     serializer_class = serializers.SalesOrderLineSerializer
     permission_classes = [IsAuthenticated]
 
 
-class PurchaseOrderViewSet(viewsets.ModelViewSet):
+class PurchaseOrderViewSet(AnalyticsModelViewSet):
     queryset = models.PurchaseOrder.objects.all().prefetch_related("lines")
     serializer_class = serializers.PurchaseOrderSerializer
+    conditional_models = [models.PurchaseOrder, models.PurchaseOrderLine]
     permission_classes = [IsAuthenticated]
 
 
-class PurchaseOrderLineViewSet(viewsets.ModelViewSet):
+class PurchaseOrderLineViewSet(AnalyticsModelViewSet):
     queryset = models.PurchaseOrderLine.objects.all()
     serializer_class = serializers.PurchaseOrderLineSerializer
     permission_classes = [IsAuthenticated]
 
 
-class InvoiceViewSet(viewsets.ModelViewSet):
+class InvoiceViewSet(AnalyticsModelViewSet):
     queryset = models.Invoice.objects.all().prefetch_related("lines")
     serializer_class = serializers.InvoiceSerializer
+    conditional_models = [models.Invoice, models.InvoiceLine]
     permission_classes = [IsAuthenticated]
 
 
-class InvoiceLineViewSet(viewsets.ModelViewSet):
+class InvoiceLineViewSet(ExportMixin, AnalyticsModelViewSet):
     queryset = models.InvoiceLine.objects.all()
     serializer_class = serializers.InvoiceLineSerializer
     permission_classes = [IsAuthenticated]
+    date_filter_field = "invoice__date"
+    project_filter_field = "invoice__project"
+    export_filename = "invoice-lines"
 
 
-class ExpenseViewSet(viewsets.ModelViewSet):
+class ExpenseViewSet(ExportMixin, BatchMixin, AnalyticsModelViewSet):
     queryset = models.Expense.objects.all()
     serializer_class = serializers.ExpenseSerializer
     permission_classes = [IsAuthenticated]
+    date_filter_field = "date"
+    project_filter_field = "project"
+    export_filename = "expenses"
 
 
-class AnalyticsEventViewSet(viewsets.ModelViewSet):
+class AnalyticsEventViewSet(AnalyticsModelViewSet):
     queryset = models.AnalyticsEvent.objects.all()
     serializer_class = serializers.AnalyticsEventSerializer
+    # Pages past the hot horizon are read back from the archives.
+    conditional_models = [models.AnalyticsEvent, models.EventArchive]
     permission_classes = [IsAuthenticated]
-
-
-class AggregatedMetricViewSet(viewsets.ModelViewSet):
+    page_size = 200
+    max_page_size = 2000
+    # Nothing is updated or deleted through the API; clients page forward with ?since=.
+    sync_field = None
+    # list() relies on the timestamp leading the cursor.
+    keyset_ordering = ["-timestamp", "id"]
+
+    def _time_param(self, name):
+        return sync.parse_timestamp(self.request.query_params.get(name), name)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        since, until = self._time_param("since"), self._time_param("until")
+        if since is not None:
+            queryset = queryset.filter(timestamp__gte=since)
+        if until is not None:
+            queryset = queryset.filter(timestamp__lt=until)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """List events; a ``since`` older than the hot table also pages into archived months.
+
+        The hot table is always paged in SQL. Archive files are read only for a
+        page that reaches past the hot horizon (every archived event is older
+        than it), from the cursor onwards in page order, and only until the
+        page is full.
+        """
+        since, until = self._time_param("since"), self._time_param("until")
+        horizon = partitions.hot_horizon()
+        if since is None or horizon is None or since >= horizon:
+            return super().list(request, *args, **kwargs)
+        paginator = self.paginator
+
+        def archived_rows(cursor, reverse, rows):
+            limit = paginator.page_size + 1
+
+            def keep(row):
+                return paginator.follows([row["timestamp"], row["id"]], cursor, reverse)
+
+            if reverse:
+                # Walking back towards newer events: archives only precede a cursor below the horizon.
+                if cursor[0] >= horizon:
+                    return None
+                return partitions.load_archived(max(since, cursor[0]), until, limit=limit, keep=keep)
+            if len(rows) > paginator.page_size and rows[-1].timestamp >= horizon:
+                return None
+            # A forward cursor bounds the newest archived event still to come.
+            end = cursor[0] + timedelta(microseconds=1) if cursor is not None else None
+            end = min(filter(None, (until, end)), default=None)
+            return partitions.load_archived(since, end, newest_first=True, limit=limit, keep=keep)
+
+        def render():
+            queryset = self.filter_queryset(self.get_queryset())
+            page = paginator.paginate_queryset(queryset, request, view=self, extra_rows=archived_rows)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        return self.conditional_response(request, render)
+
+    def create(self, request, *args, **kwargs):
+        """Queue one event on the in-process buffer instead of inserting it in the request.
+
+        Responds 202 once the event is queued and 503 when the buffer stayed
+        full for its backpressure timeout.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not buffer.track(**serializer.validated_data):
+            return Response(
+                {"detail": "Event buffer is full; retry later."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """Ingest many events from an NDJSON (application/x-ndjson) or JSON-array body.
+
+        Responds 201 when every record was stored and 207 with per-line
+        errors when some were rejected.
+        """
+        stream = request.stream
+        if stream is None:
+            records = iter(())
+        elif request.content_type.startswith(("application/x-ndjson", "application/jsonl")):
+            records = ingest.iter_ndjson(stream)
+        else:
+            records = ingest.iter_json_array(stream)
+        report = ingest.ingest_events(records)
+        return Response(report, status=status.HTTP_207_MULTI_STATUS if report["errors"] else status.HTTP_201_CREATED)
+
+
+class AggregatedMetricViewSet(ResultCacheMixin, AnalyticsModelViewSet):
     queryset = models.AggregatedMetric.objects.all()
     serializer_class = serializers.AggregatedMetricSerializer
     permission_classes = [IsAuthenticated]
+    page_size = 500
+    max_page_size = 5000
+
+
+class FinancialWorkspaceView(ResultCacheMixin, APIView):
+    """Sales orders, purchase orders, invoices, bills and expenses in one response.
+
+    Accepts the same ?project= / ?date_from= / ?date_to= filters as the list
+    endpoints.
+    """
+    permission_classes = [IsAuthenticated]
+    action = "bootstrap"
+    result_cache_actions = ()
+    result_cache_action_models = {
+        "bootstrap": [models.SalesOrder, models.PurchaseOrder, models.Invoice, models.Expense],
+    }
+
+    def get(self, request):
+        params = request.query_params
+        project = parse_project_param(params)
+        dates = {}
+        for param in ("date_from", "date_to"):
+            if params.get(param):
+                dates[param] = parse_date(params[param])
+                if dates[param] is None:
+                    raise ValidationError({param: "Expected an ISO 8601 date."})
+        return self.cached_response(
+            request,
+            lambda: Response(reports.financial_workspace(project=project, request=request, **dates)),
+        )
+
+
+class ChangeStreamView(APIView):
+    """The change stream's route when served without the ASGI wrapper (``apps.analytics.stream``)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(
+            {"detail": "The change stream is served by the ASGI application."},
+            status=status.HTTP_501_NOT_IMPLEMENTED,
+        )
+
+
+class ResultCacheStatsView(APIView):
+    """Hit/miss/eviction counters of this worker's result cache (admin role or superuser)."""
+    permission_classes = [HasRole]
+    required_roles = ("admin",)
+
+    def get(self, request):
+        return Response(resultcache.stats())
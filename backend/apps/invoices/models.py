@@ -1,8 +1,12 @@
-from django.db import models
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import models, transaction
+from django.db.models import F
 from apps.projects.models import Project
 from apps.orders.models import SalesOrder, SalesOrderLine
 from apps.products.models import Product
 from apps.analytics import models as analytics_models
+from apps.analytics.numbering import next_number
 import uuid
 
 class CustomerInvoice(models.Model):
@@ -16,7 +20,47 @@ class CustomerInvoice(models.Model):
     status = models.CharField(max_length=20, choices=STATUS, default="draft")
     created_at = models.DateTimeField(auto_now_add=True)
 
-class CustomerInvoiceLine(models.Model):
+    def save(self, *args, **kwargs):
+        if not self.invoice_number:
+            self.invoice_number = next_number("customer_invoice")
+        super().save(*args, **kwargs)
+
+    def _build_lines(self, lines):
+        built = []
+        for line in lines:
+            if not isinstance(line, CustomerInvoiceLine):
+                line = CustomerInvoiceLine(**line)
+            line.invoice = self
+            line.amount = line.compute_line_total()
+            built.append(line)
+        return built
+
+    def add_lines(self, lines):
+        """Insert many lines and bump the total in one transaction (fixed query count)."""
+        built = self._build_lines(lines)
+        with transaction.atomic():
+            CustomerInvoiceLine.objects.bulk_create(built)
+            delta = sum((line.amount for line in built), Decimal("0.00"))
+            CustomerInvoice.objects.filter(pk=self.pk).update(total_amount=F("total_amount") + delta)
+        self.refresh_from_db(fields=["total_amount"])
+        return built
+
+    def replace_lines(self, lines):
+        """Swap all lines for ``lines`` and set the total, in one transaction (fixed query count)."""
+        built = self._build_lines(lines)
+        with transaction.atomic():
+            self.lines.all().delete()
+            CustomerInvoiceLine.objects.bulk_create(built)
+            self.total_amount = sum((line.amount for line in built), Decimal("0.00"))
+            CustomerInvoice.objects.filter(pk=self.pk).update(total_amount=self.total_amount)
+        return built
+
+class CustomerInvoiceLine(analytics_models.DocumentLine):
+    """Keeps ``amount`` and the invoice's ``total_amount`` in sync like the analytics lines."""
+    header_field = "invoice"
+    total_field = "amount"
+    header_touch_field = None
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     invoice = models.ForeignKey(CustomerInvoice, on_delete=models.CASCADE, related_name="lines")
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
@@ -25,12 +69,8 @@ class CustomerInvoiceLine(models.Model):
     unit_price = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
     amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
 
-    def save(self, *args, **kwargs):
-        self.amount = self.qty * self.unit_price
-        super().save(*args, **kwargs)
-        total = sum([l.amount for l in self.invoice.lines.all()])
-        self.invoice.total_amount = total
-        self.invoice.save(update_fields=["total_amount"])
+    def compute_line_total(self):
+        return (self.qty * Decimal(str(self.unit_price))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
 # Proxy classes pointing to analytics' Invoice models (no new DB tables)
 class Invoice(analytics_models.Invoice):
@@ -1,3 +1,70 @@
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .models import CustomerInvoice, CustomerInvoiceLine
+
+
+class CustomerInvoiceTotalTests(TestCase):
+    def setUp(self):
+        self.invoice = CustomerInvoice.objects.create(customer_name="Acme")
+
+    def add(self, qty, price="10.00", invoice=None):
+        return CustomerInvoiceLine.objects.create(invoice=invoice or self.invoice, qty=qty, unit_price=Decimal(price))
+
+    def total(self, invoice=None):
+        invoice = invoice or self.invoice
+        invoice.refresh_from_db(fields=["total_amount"])
+        return invoice.total_amount
+
+    def test_save_applies_the_change(self):
+        line = self.add(2)
+        self.add(1)
+        self.assertEqual(self.total(), Decimal("30.00"))
+        line = CustomerInvoiceLine.objects.get(pk=line.pk)
+        line.qty = 5
+        line.save()
+        self.assertEqual(self.total(), Decimal("60.00"))
+
+    def test_moving_a_line_between_invoices(self):
+        other = CustomerInvoice.objects.create(customer_name="Other")
+        line = self.add(3)
+        line.invoice = other
+        line.save()
+        self.assertEqual((self.total(), self.total(other)), (Decimal("0.00"), Decimal("30.00")))
+
+    def test_delete_uses_the_stored_invoice(self):
+        other = CustomerInvoice.objects.create(customer_name="Other")
+        line = self.add(2)
+        # Reassigned in memory but never saved: the stored invoice loses the amount.
+        line.invoice = other
+        line.delete()
+        self.assertEqual((self.total(), self.total(other)), (Decimal("0.00"), Decimal("0.00")))
+
+    def test_queryset_delete_updates_each_invoice_once(self):
+        other = CustomerInvoice.objects.create(customer_name="Other")
+        for _ in range(4):
+            self.add(1)
+            self.add(1, invoice=other)
+        with CaptureQueriesContext(connection) as queries:
+            CustomerInvoiceLine.objects.filter(qty=1).delete()
+        table = CustomerInvoice._meta.db_table
+        self.assertEqual(sum(q["sql"].startswith(f'UPDATE "{table}"') for q in queries), 2)
+        self.assertEqual((self.total(), self.total(other)), (Decimal("0.00"), Decimal("0.00")))
+
+    def test_deleting_the_invoice_skips_its_total(self):
+        for _ in range(3):
+            self.add(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.invoice.delete()
+        table = CustomerInvoice._meta.db_table
+        self.assertFalse(any(q["sql"].startswith(f'UPDATE "{table}"') for q in queries))
+        self.assertFalse(CustomerInvoiceLine.objects.exists())
 
-# Create your tests here.
+    def test_add_and_replace_lines(self):
+        self.invoice.add_lines([{"qty": 2, "unit_price": Decimal("5.00")}, {"qty": 1, "unit_price": Decimal("1.00")}])
+        self.assertEqual(self.total(), Decimal("11.00"))
+        self.invoice.replace_lines([{"qty": 1, "unit_price": Decimal("7.00")}])
+        self.assertEqual(self.total(), Decimal("7.00"))
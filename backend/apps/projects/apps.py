@@ -5,3 +5,13 @@ class ProjectsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.projects"
     verbose_name = "Projects"
+
+    def ready(self):
+        from apps.analytics import changes, deletion, sync
+
+        from . import signals
+        from .models import Project, ProjectMembership
+
+        sync.track(Project)
+        deletion.register(ProjectMembership, signals.membership_deleted, "projects.membership_deleted")
+        changes.register(Project, access=ProjectMembership.pairs)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.projects.models import Project, ProjectMembership
+
+
+class Command(BaseCommand):
+    help = "Rebuild the project membership index from every project's manager and team."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ids = list(Project.objects.order_by("pk").values_list("pk", flat=True))
+        size = options["batch_size"]
+        for start in range(0, len(ids), size):
+            ProjectMembership.sync(ids[start:start + size])
+        self.stdout.write(f"Synced memberships for {len(ids)} projects ({ProjectMembership.objects.count()} rows)")
@@ -1,5 +1,9 @@
 # backend/apps/projects/models.py
+from functools import reduce
+from operator import or_
+
 from django.db import models
+from django.db.models import Exists, OuterRef, Q
 from django.conf import settings
 
 class Project(models.Model):
@@ -29,5 +33,80 @@ class Project(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Delta sync (?updated_since=) pages by (updated_at, id).
+        indexes = [models.Index(fields=['updated_at', 'id'])]
+
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+class ProjectMembership(models.Model):
+    """Denormalized visibility index: one row per (user, project) the user can see.
+
+    A project is visible to its manager and its team. Rather than filtering
+    ``Q(manager=user) | Q(team=user)`` (a join that needs DISTINCT), visibility
+    checks test ``EXISTS`` against this table, which the unique (user, project)
+    index answers on its own. Rows are kept in sync by the signals in
+    ``apps.projects.signals``.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='project_memberships')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'project'], name='projects_membership_user_project_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.project_id}"
+
+    @classmethod
+    def visible(cls, user, project_ref='pk'):
+        """``EXISTS`` filter for rows whose ``project_ref`` is a project ``user`` can see."""
+        return Exists(cls.objects.filter(user=user, project=OuterRef(project_ref)))
+
+    @classmethod
+    def pairs(cls, project_ids, user_ids, batch=None):
+        """The visible ``(project, user)`` pairs among ``project_ids`` x ``user_ids``.
+
+        Rows removed by ``batch`` (a delete still in progress, e.g. of the
+        project itself) still count, so the delete reaches the project's
+        members.
+        """
+        manager = cls._base_manager.using(batch.using) if batch is not None else cls._base_manager
+        pairs = set(
+            manager.filter(project_id__in=project_ids, user_id__in=user_ids).values_list('project_id', 'user_id')
+        )
+        if batch is not None:
+            pairs.update(
+                (row.project_id, row.user_id) for row in batch.rows.get(cls, ())
+                if row.project_id in project_ids and row.user_id in user_ids
+            )
+        return pairs
+
+    @classmethod
+    def sync(cls, project_ids):
+        """Make the index rows of ``project_ids`` match their current manager and team."""
+        project_ids = set(project_ids)
+        if not project_ids:
+            return
+        wanted = set(
+            Project.team.through.objects.filter(project_id__in=project_ids).values_list('project_id', 'user_id')
+        )
+        wanted |= set(
+            Project.objects.filter(pk__in=project_ids, manager__isnull=False).values_list('pk', 'manager_id')
+        )
+        existing = set(cls.objects.filter(project_id__in=project_ids).values_list('project_id', 'user_id'))
+        stale = existing - wanted
+        if stale:
+            cls.objects.filter(reduce(or_, (Q(project_id=p, user_id=u) for p, u in stale))).delete()
+        missing = wanted - existing
+        if missing:
+            from apps.analytics.resultcache import bump
+
+            cls.objects.bulk_create(
+                [cls(project_id=p, user_id=u) for p, u in missing], ignore_conflicts=True
+            )
+            # bulk_create sends no post_save for the list ETags to see.
+            bump(cls)
@@ -1,6 +1,8 @@
 # backend/apps/projects/serializers.py
+from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from .models import Project
+from apps.users import access
 from apps.users.serializers import UserSerializer  # We'll use this for nested data
 
 class ProjectSerializer(serializers.ModelSerializer):
@@ -10,14 +12,14 @@ class ProjectSerializer(serializers.ModelSerializer):
     
     # Allow setting manager/team by their ID during create/update
     manager_id = serializers.PrimaryKeyRelatedField(
-        queryset=serializers.get_user_model().objects.all(), 
+        queryset=get_user_model().objects.all(), 
         source='manager', 
         write_only=True, 
         allow_null=True,
         required=False
     )
     team_ids = serializers.PrimaryKeyRelatedField(
-        queryset=serializers.get_user_model().objects.all(), 
+        queryset=get_user_model().objects.all(), 
         source='team', 
         write_only=True, 
         many=True,
@@ -39,4 +41,29 @@ class ProjectSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         # DRF handles manager_id and team_ids automatically
-        return super().update(instance, validated_data)
\ No newline at end of file
+        return super().update(instance, validated_data)
+
+
+class ProjectRefSerializer(ProjectSerializer):
+    """
+    Project with ``manager`` and ``team`` as user IDs; the users themselves are
+    side-loaded once per response (see ``side_load_users``).
+    """
+    manager = serializers.PrimaryKeyRelatedField(read_only=True)
+    team = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+
+def side_load_users(projects):
+    """
+    Serialize every user referenced by ``projects`` (ProjectRefSerializer rows)
+    into a map keyed by ID. Each person appears once however many projects
+    they are on; roles come from a single query.
+    """
+    user_ids = set()
+    for project in projects:
+        if project['manager'] is not None:
+            user_ids.add(project['manager'])
+        user_ids.update(project['team'])
+    users = list(get_user_model().objects.filter(pk__in=user_ids))
+    access.load_roles(users)
+    return {str(user['id']): user for user in UserSerializer(users, many=True).data}
\ No newline at end of file
@@ -0,0 +1,39 @@
+# backend/apps/projects/signals.py
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.analytics import sync
+
+from .models import Project, ProjectMembership
+
+
+@receiver(post_save, sender=Project)
+def sync_membership_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """Keep the manager's membership row in step with ``Project.manager``."""
+    if created or update_fields is None or "manager" in update_fields:
+        ProjectMembership.sync([instance.pk])
+
+
+@receiver(m2m_changed, sender=Project.team.through)
+def touch_project_on_team_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Bump ``updated_at`` and resync the membership index when a team changes."""
+    if action == "pre_clear" and reverse:
+        # After the clear the user's projects can no longer be looked up.
+        instance._cleared_project_ids = list(Project.objects.filter(team=instance).values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        project_ids = [instance.pk]
+    elif action == "post_clear":
+        project_ids = instance.__dict__.pop("_cleared_project_ids", [])
+    else:
+        project_ids = list(pk_set)
+    Project.objects.filter(pk__in=project_ids).update(updated_at=timezone.now())
+    ProjectMembership.sync(project_ids)
+
+
+def membership_deleted(sender, instances, batch):
+    """Tell users who lost a project (team or manager change, project deleted) to drop it on their next sync."""
+    sync.revoke(Project, [(membership.project_id, membership.user_id) for membership in instances], batch.using)
@@ -1,3 +1,106 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.analytics.models import Tombstone
+from apps.users.testing import make_role, make_user, user_roles
+from .models import Project, ProjectMembership
+from .views import ProjectViewSet
+
+
+class ProjectSyncTombstoneTests(TestCase):
+    """Projects leave a user's delta sync when they lose access, and only theirs."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = make_user('manager@example.com')
+        cls.member = make_user('member@example.com')
+
+    def deleted_for(self, user):
+        request = APIRequestFactory().get('/projects/')
+        force_authenticate(request, user)
+        view = ProjectViewSet(request=Request(request), format_kwarg=None, action='list')
+        since = timezone.now() - timedelta(minutes=1)
+        return view.deleted_ids(Project.objects.filter(ProjectMembership.visible(user)), since)
+
+    def test_removed_member_gets_a_tombstone(self):
+        project = Project.objects.create(name='Apollo', manager=self.manager)
+        project.team.add(self.member)
+        project.team.remove(self.member)
+        self.assertEqual(self.deleted_for(self.member), [project.pk])
+        self.assertEqual(self.deleted_for(self.manager), [])
+
+    def test_readded_member_is_not_told_to_delete(self):
+        project = Project.objects.create(name='Apollo', manager=self.manager)
+        project.team.add(self.member)
+        project.team.remove(self.member)
+        project.team.add(self.member)
+        self.assertEqual(self.deleted_for(self.member), [])
+
+    def test_deleted_project_reaches_its_members_only(self):
+        project = Project.objects.create(name='Apollo', manager=self.manager)
+        project.team.add(self.member)
+        hidden = Project.objects.create(name='Hidden', manager=self.manager)
+        pks = [project.pk, hidden.pk]
+        with self.assertNumQueries(9):
+            # SELECT projects and memberships, cascades, DELETEs, one tombstone INSERT for
+            # the members and one for everyone.
+            Project.objects.filter(pk__in=pks).delete()
+        self.assertEqual(self.deleted_for(self.member), [project.pk])
+        self.assertEqual(sorted(self.deleted_for(self.manager)), sorted(pks))
+        self.assertEqual(Tombstone.objects.filter(audience=str(self.member.pk)).count(), 1)
+
+
+class ProjectListTests(TestCase):
+    """The project list costs the same few queries at any size, and its ETag covers nested users."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = make_user('manager@example.com', first_name='Ada', last_name='Lovelace')
+        cls.team = [make_user(f'dev{i}@example.com') for i in range(4)]
+
+    def add_projects(self, count):
+        for i in range(count):
+            project = Project.objects.create(name=f'Project {i}', manager=self.manager)
+            project.team.set(self.team[: i % len(self.team) + 1])
+
+    def list_projects(self, **params):
+        request = APIRequestFactory().get('/projects/', params)
+        force_authenticate(request, self.manager)
+        response = ProjectViewSet.as_view({'get': 'list'})(request)
+        response.render()
+        return response
+
+    def test_query_count_is_fixed(self):
+        user_roles(self.manager).add(make_role('project_manager'))
+        for count in (1, 10):
+            Project.objects.all().delete()
+            self.add_projects(count)
+            # Projects with their managers, teams, and every nested user's roles.
+            with self.assertNumQueries(3):
+                response = self.list_projects()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data), count)
+            self.assertEqual(response.data[0]['manager']['name'], 'Ada Lovelace')
+            self.assertEqual(response.data[0]['manager']['roles'], [{'name': 'project_manager'}])
+            # Side-loading reads the users once more, however many projects name them.
+            with self.assertNumQueries(4):
+                response = self.list_projects(users='sideload')
+            self.assertEqual(len(response.data['users']), 1 + min(count, len(self.team)))
 
-# Create your tests here.
+    def test_etag_follows_nested_users(self):
+        self.add_projects(2)
+        etag = self.list_projects()['ETag']
+        request = APIRequestFactory().get('/projects/', HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(request, self.manager)
+        self.assertEqual(ProjectViewSet.as_view({'get': 'list'})(request).status_code, 304)
+        self.manager.first_name = 'Grace'
+        self.manager.save()
+        self.assertNotEqual(self.list_projects()['ETag'], etag)
+        etag = self.list_projects()['ETag']
+        self.team[0].email = 'lead@example.com'
+        self.team[0].save()
+        self.assertNotEqual(self.list_projects()['ETag'], etag)
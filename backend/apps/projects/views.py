@@ -1,25 +1,75 @@
 # backend/apps/projects/views.py
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
 from rest_framework import viewsets
-from .models import Project
-from .serializers import ProjectSerializer
+from apps.analytics.conditional import ConditionalGetMixin
+from apps.analytics.sync import DeltaSyncMixin
+from apps.users import access
+from .models import Project, ProjectMembership
+from .serializers import ProjectRefSerializer, ProjectSerializer, side_load_users
 from rest_framework.permissions import IsAuthenticated
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class ProjectViewSet(ConditionalGetMixin, DeltaSyncMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows projects to be viewed or edited.
     """
     queryset = Project.objects.all().order_by('-created_at')
     serializer_class = ProjectSerializer
     permission_classes = [IsAuthenticated] # Ensures only logged-in users can access
+    # Visibility comes from the membership index; nested users carry their roles.
+    conditional_models = [Project, ProjectMembership, get_user_model(), access.role_field().related_model]
+
+    def side_loading(self):
+        """
+        ``?users=sideload`` on the list: projects carry user IDs only and the
+        referenced users are returned once, in a top-level ``users`` map.
+        """
+        return self.action == 'list' and self.request.query_params.get('users') == 'sideload'
 
     def get_queryset(self):
         """
         Only show projects that the user is a part of (manager or team member).
         """
-        user = self.request.user
-        return Project.objects.filter(
-            models.Q(manager=user) | models.Q(team=user)
-        ).distinct()
+        queryset = Project.objects.filter(ProjectMembership.visible(self.request.user))
+        if self.side_loading():
+            return queryset.prefetch_related(Prefetch('team', queryset=get_user_model().objects.only('pk')))
+        return queryset.select_related('manager').prefetch_related('team')
+
+    def filter_tombstones(self, tombstones):
+        """
+        Projects are deleted per member: the membership rows go with the
+        project, and each removed membership leaves a tombstone for its user.
+        """
+        return tombstones.filter(audience=str(self.request.user.pk))
+
+    def get_serializer_class(self):
+        if self.side_loading():
+            return ProjectRefSerializer
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        """
+        Nested users get their roles from one query for all the projects
+        being serialized (see ``access.load_roles``).
+        """
+        if args and args[0] is not None and 'data' not in kwargs and not self.side_loading():
+            projects = args[0] if kwargs.get('many') else [args[0]]
+            access.load_roles(
+                [user for project in projects for user in (project.manager, *project.team.all())]
+            )
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not self.side_loading() or response.status_code != 200:
+            return response
+        if isinstance(response.data, dict):
+            # Delta sync (``upserts``) or paginated (``results``) envelope.
+            rows = response.data.get('upserts', response.data.get('results', []))
+            response.data['users'] = side_load_users(rows)
+        else:
+            response.data = {'results': response.data, 'users': side_load_users(response.data)}
+        return response
 
     def perform_create(self, serializer):
         """
@@ -5,3 +5,10 @@ class TasksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.tasks"
     verbose_name = "Tasks"
+
+    def ready(self):
+        from apps.analytics import changes
+
+        from .models import Task
+
+        changes.register(Task, "project")
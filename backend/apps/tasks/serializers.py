@@ -1,26 +1,51 @@
+from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from apps.projects.models import Project
 from .models import Task
 
+
+class TaskProjectSerializer(serializers.ModelSerializer):
+    """The project fields a task row needs; everything else is one request away."""
+    class Meta:
+        model = Project
+        fields = ['id', 'name', 'status']
+
+
+class TaskAssigneeSerializer(serializers.ModelSerializer):
+    """Assignee fields read straight off the joined user row (no roles, no extra queries)."""
+    name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = get_user_model()
+        fields = ['id', 'email', 'name']
+
+    def get_name(self, obj):
+        return f"{obj.first_name} {obj.last_name}".strip()
+
+
 class TaskSerializer(serializers.ModelSerializer):
+    # Nested on read; the viewset joins both with select_related.
+    project = TaskProjectSerializer(read_only=True)
+    assignee = TaskAssigneeSerializer(read_only=True)
+
     assignee_id = serializers.PrimaryKeyRelatedField(
-        queryset=serializers.get_user_model().objects.all(), 
-        source='assignee', 
-        write_only=True, 
+        queryset=get_user_model().objects.all(),
+        source='assignee',
+        write_only=True,
         allow_null=True,
         required=False
     )
     project_id = serializers.PrimaryKeyRelatedField(
-        queryset=serializers.get_user_model().Project.objects.all(), 
-        source='project', 
+        queryset=Project.objects.all(),
+        source='project',
         write_only=True
     )
 
     class Meta:
         model = Task
         fields = [
-            'id', 'name', 'description', 'status', 'priority', 'project', 
+            'id', 'name', 'description', 'status', 'priority', 'project',
             'assignee', 'due_date', 'created_at', 'updated_at',
             'assignee_id', 'project_id'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'project', 'assignee']
-        depth = 1 # Show nested project/assignee data on read
\ No newline at end of file
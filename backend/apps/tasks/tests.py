@@ -1,3 +1,65 @@
 from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
 
-# Create your tests here.
+from apps.projects.models import Project
+from apps.users.testing import make_user
+from .models import Task
+from .views import TaskViewSet
+
+
+class TaskListQueryCountTests(TestCase):
+    """The task list joins project and assignee, so its cost does not grow with the page."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = make_user('manager@example.com', first_name='Ada', last_name='Lovelace')
+        cls.assignees = [make_user(f'dev{i}@example.com') for i in range(5)]
+        cls.projects = [Project.objects.create(name=f'Project {i}', manager=cls.manager) for i in range(4)]
+
+    def add_tasks(self, count):
+        Task.objects.bulk_create(
+            Task(
+                name=f'Task {i}',
+                project=self.projects[i % len(self.projects)],
+                assignee=self.assignees[i % len(self.assignees)] if i % 3 else None,
+            )
+            for i in range(count)
+        )
+
+    def list_tasks(self):
+        request = APIRequestFactory().get('/tasks/')
+        force_authenticate(request, self.manager)
+        response = TaskViewSet.as_view({'get': 'list'})(request)
+        response.render()
+        return response
+
+    def test_query_count_is_fixed(self):
+        for count in (1, 10, 50):
+            Task.objects.all().delete()
+            self.add_tasks(count)
+            with self.assertNumQueries(1):
+                response = self.list_tasks()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data), count)
+
+    def test_nested_fields(self):
+        self.add_tasks(2)
+        first, second = sorted(self.list_tasks().data, key=lambda task: task['name'])
+        self.assertEqual(first['project'], {'id': self.projects[0].pk, 'name': 'Project 0', 'status': 'planning'})
+        self.assertIsNone(first['assignee'])
+        self.assertEqual(set(second['assignee']), {'id', 'email', 'name'})
+        self.assertEqual(str(second['assignee']['id']), str(self.assignees[1].pk))
+
+    def test_create_with_ids(self):
+        request = APIRequestFactory().post(
+            '/tasks/',
+            {'name': 'Write docs', 'project_id': self.projects[1].pk, 'assignee_id': str(self.assignees[0].pk)},
+            format='json',
+        )
+        force_authenticate(request, self.manager)
+        response = TaskViewSet.as_view({'post': 'create'})(request)
+        self.assertEqual(response.status_code, 201, response.data)
+        task = Task.objects.get(pk=response.data['id'])
+        self.assertEqual(task.project_id, self.projects[1].pk)
+        self.assertEqual(task.assignee_id, self.assignees[0].pk)
+        self.assertEqual(response.data['project']['name'], 'Project 1')
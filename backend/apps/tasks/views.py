@@ -1,4 +1,5 @@
 from rest_framework import viewsets
+from apps.projects.models import ProjectMembership
 from .models import Task
 from .serializers import TaskSerializer
 from rest_framework.permissions import IsAuthenticated
@@ -13,7 +14,11 @@ class TaskViewSet(viewsets.ModelViewSet):
         Only show tasks for projects the user is a part of.
         """
         user = self.request.user
-        return Task.objects.filter(project__team=user).order_by('due_date')
+        return (
+            Task.objects.filter(ProjectMembership.visible(user, 'project'))
+            .select_related('project', 'assignee')
+            .order_by('due_date')
+        )
 
     def perform_create(self, serializer):
         # You could add logic here to ensure user can only add tasks to their own projects
@@ -0,0 +1,259 @@
+"""A user's roles and permissions, resolved once per request and cached across requests.
+
+:func:`resolve` returns an :class:`Access` holding the user's role names and
+``PermissionsMixin`` permissions (``"app_label.codename"``). Roles are the
+user model's ``roles`` (``apps.users.User``) or, on a user model without
+them such as ``auth.User``, the names of the user's groups
+(:func:`role_field`). The result is
+memoized on the user object, which lives as long as the request, and it is
+also written where readers look for it: ModelBackend's ``_perm_cache`` (so
+``user.has_perm()`` does not query) and the user's loaded roles (so
+``UserSerializer`` does not query, see :func:`load_roles`).
+
+Across requests the result is kept in the Django cache for ``TIMEOUT``
+seconds. Saving or deleting a user, or changing their roles, groups or direct
+permissions, deletes that user's entry. Changes that can affect many users
+(editing or deleting a role or group, changing a group's permissions,
+membership edited from the role/group side) bump a generation stored with
+every entry, which makes all of them stale at once. Both happen again on
+commit so a request that read the old rows mid-transaction cannot keep them
+cached. Configure with ``USERS_ACCESS_CACHE`` in settings, e.g.
+``{"ALIAS": "default", "TIMEOUT": 60}``.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+DEFAULTS = {"ALIAS": "default", "TIMEOUT": 60}
+PREFIX = "users:access"
+GENERATION_KEY = f"{PREFIX}:gen"
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "USERS_ACCESS_CACHE", {})}
+
+
+def _cache():
+    return caches[_config()["ALIAS"]]
+
+
+def _key(user_pk):
+    return f"{PREFIX}:{user_pk}"
+
+
+def _roles_field():
+    """The user model's ``roles`` many-to-many, or None when it has none."""
+    try:
+        return get_user_model()._meta.get_field("roles")
+    except FieldDoesNotExist:
+        return None
+
+
+def role_field():
+    """The many-to-many holding a user's roles: ``roles``, else Django's ``groups``."""
+    return _roles_field() or get_user_model()._meta.get_field("groups")
+
+
+class Access:
+    def __init__(self, roles=(), permissions=()):
+        self.roles = frozenset(roles)
+        self.permissions = frozenset(permissions)
+
+    def has_role(self, *names):
+        """True if the user holds any of ``names``."""
+        return not self.roles.isdisjoint(names)
+
+    def has_perms(self, perms):
+        return self.permissions.issuperset(perms)
+
+
+ANONYMOUS = Access()
+
+
+def _through_columns(model, name):
+    """The through model of ``model.name`` and its (source, target) FK columns."""
+    field = model._meta.get_field(name)
+    through = field.remote_field.through
+    return through, through._meta.get_field(field.m2m_field_name()).attname, field.m2m_reverse_field_name()
+
+
+def load_roles(users):
+    """Set ``_roles`` on each of ``users`` that has none yet, in one query for all of them.
+
+    Reads :func:`role_field`'s through table rather than prefetching: on
+    ``auth.User``, Group's ``user`` lookup resolves to ``apps.users.User``
+    (both models' ``groups`` use that name), so ``prefetch_related("groups")``
+    cannot be used.
+    """
+    pending = defaultdict(list)
+    for user in users:
+        if user is not None and not hasattr(user, "_roles"):
+            pending[user.pk].append(user)
+    if not pending:
+        return
+    field = role_field()
+    through, source, target = _through_columns(field.model, field.name)
+    found = defaultdict(list)
+    rows = through.objects.filter(**{f"{source}__in": list(pending)}).select_related(target).order_by(f"{target}__name")
+    for row in rows:
+        found[getattr(row, source)].append(getattr(row, target))
+    for pk, instances in pending.items():
+        for user in instances:
+            user._roles = found[pk]
+
+
+def roles_of(user):
+    """``user``'s role (or group) rows; loaded once per instance."""
+    load_roles([user])
+    return user._roles
+
+
+def _perm_names(permissions):
+    rows = permissions.values_list("content_type__app_label", "codename")
+    return {f"{app_label}.{codename}" for app_label, codename in rows}
+
+
+def _prime_model_backend(user):
+    """Fill ModelBackend's user and group permission caches from the through tables.
+
+    Its own queries go through Permission's ``user`` lookup, which has the
+    same clash as Group's (see :func:`load_roles`).
+    """
+    if not user.is_active or not hasattr(user, "user_permissions"):
+        return
+    if user.is_superuser:
+        user._user_perm_cache = user._group_perm_cache = _perm_names(Permission.objects.all())
+        return
+    through, source, target = _through_columns(type(user), "user_permissions")
+    direct = through.objects.filter(**{source: user.pk}).values(f"{target}_id")
+    user._user_perm_cache = _perm_names(Permission.objects.filter(pk__in=direct))
+    through, source, target = _through_columns(type(user), "groups")
+    groups = through.objects.filter(**{source: user.pk}).values(f"{target}_id")
+    user._group_perm_cache = _perm_names(Permission.objects.filter(group__in=groups))
+
+
+def _load(user):
+    """Read roles and permissions from the database (at most three queries)."""
+    roles = roles_of(user)
+    _prime_model_backend(user)
+    # Goes through the auth backends; ModelBackend fills its _perm_cache.
+    permissions = user.get_all_permissions()
+    return roles, permissions
+
+
+def _seed(user, roles, permissions):
+    """Prime the per-instance caches from a cached result."""
+    user._perm_cache = set(permissions)
+    user._roles = roles
+
+
+def _role_columns():
+    return [field.attname for field in role_field().related_model._meta.concrete_fields]
+
+
+def _freeze_roles(roles):
+    columns = _role_columns() if roles else ()
+    return [tuple(getattr(role, column) for column in columns) for role in roles]
+
+
+def _thaw_roles(rows):
+    if not rows:
+        return []
+    role_model, columns = role_field().related_model, _role_columns()
+    return [role_model.from_db(None, columns, row) for row in rows]
+
+
+def _generation(cache, found):
+    generation = found.get(GENERATION_KEY)
+    if generation is None:
+        # Time-based so a generation lost to eviction never repeats an old one.
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def resolve(user):
+    """The :class:`Access` of ``user``; costs no query once resolved or cached."""
+    if not getattr(user, "is_authenticated", False):
+        return ANONYMOUS
+    access = getattr(user, "_access", None)
+    if access is not None:
+        return access
+
+    cache = _cache()
+    key = _key(user.pk)
+    found = cache.get_many([GENERATION_KEY, key])
+    generation = _generation(cache, found)
+    entry = found.get(key)
+    if entry is not None and entry[0] == generation:
+        roles, permissions = _thaw_roles(entry[1]), entry[2]
+        _seed(user, roles, permissions)
+    else:
+        roles, permissions = _load(user)
+        cache.set(key, (generation, _freeze_roles(roles), frozenset(permissions)), _config()["TIMEOUT"])
+
+    access = Access((role.name for role in roles), permissions)
+    user._access = access
+    return access
+
+
+# Invalidation
+def invalidate(user_pks):
+    """Drop the cached access of ``user_pks`` now and again on commit."""
+    keys = [_key(pk) for pk in user_pks]
+    if not keys:
+        return
+    _cache().delete_many(keys)
+    transaction.on_commit(lambda: _cache().delete_many(keys))
+
+
+def invalidate_all():
+    """Make every cached entry stale by moving to a new generation."""
+
+    def bump():
+        _cache().set(GENERATION_KEY, time.time_ns(), timeout=None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def _user_changed(sender, instance, **kwargs):
+    invalidate([instance.pk])
+
+
+def _membership_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        # Edited from the role/group/permission side: any number of users.
+        invalidate_all()
+    else:
+        invalidate([instance.pk])
+
+
+def _shared_changed(sender, **kwargs):
+    if kwargs.get("action", "post_").startswith("post_"):
+        invalidate_all()
+
+
+def connect():
+    User = get_user_model()
+    post_save.connect(_user_changed, sender=User, dispatch_uid="access.user_saved")
+    post_delete.connect(_user_changed, sender=User, dispatch_uid="access.user_deleted")
+    field = role_field()
+    through_models = {User.groups.through, User.user_permissions.through, field.remote_field.through}
+    # A renamed or deleted role (or group) changes every holder's role names.
+    post_save.connect(_shared_changed, sender=field.related_model, dispatch_uid="access.role_saved")
+    post_delete.connect(_shared_changed, sender=field.related_model, dispatch_uid="access.role_deleted")
+    for through in through_models:
+        m2m_changed.connect(_membership_changed, sender=through, dispatch_uid=f"access.m2m.{through._meta.label}")
+    m2m_changed.connect(_shared_changed, sender=Group.permissions.through, dispatch_uid="access.group_permissions")
+    post_delete.connect(_shared_changed, sender=Group, dispatch_uid="access.group_deleted")
+    post_delete.connect(_shared_changed, sender=Permission, dispatch_uid="access.permission_deleted")
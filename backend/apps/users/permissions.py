@@ -0,0 +1,23 @@
+# apps/users/permissions.py
+
+from rest_framework.permissions import BasePermission
+from . import access
+
+
+class HasRole(BasePermission):
+    """
+    Allows users holding any of ``view.required_roles`` and all of
+    ``view.required_permissions`` (``"app_label.codename"``); superusers always
+    pass. Checks read the request's resolved access, so they add no queries.
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not (user and user.is_authenticated):
+            return False
+        if user.is_superuser:
+            return True
+        resolved = access.resolve(user)
+        roles = getattr(view, 'required_roles', ())
+        permissions = getattr(view, 'required_permissions', ())
+        return (not roles or resolved.has_role(*roles)) and resolved.has_perms(permissions)
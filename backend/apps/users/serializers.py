@@ -1,6 +1,7 @@
 # apps/users/serializers.py
 
 from rest_framework import serializers
+from . import access
 from .models import User, Role
 
 class RoleSerializer(serializers.ModelSerializer):
@@ -9,12 +10,16 @@ class RoleSerializer(serializers.ModelSerializer):
         fields = ['name']
 
 class UserSerializer(serializers.ModelSerializer):
-    roles = RoleSerializer(many=True, read_only=True)
+    # ``User.roles``, or the group names on a user model without roles (see ``access.role_field``).
+    roles = serializers.SerializerMethodField()
     name = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ['id', 'email', 'first_name', 'last_name', 'name', 'roles']
 
+    def get_roles(self, obj):
+        return [{'name': role.name} for role in access.roles_of(obj)]
+
     def get_name(self, obj):
         return f"{obj.first_name} {obj.last_name}".strip()
\ No newline at end of file
@@ -0,0 +1,24 @@
+"""Test helpers that work under either user model (``auth.User`` or ``apps.users.User``)."""
+from django.contrib.auth import get_user_model
+
+from . import access
+
+
+def make_user(username, **extra):
+    User = get_user_model()
+    return User.objects.create_user(**{User.USERNAME_FIELD: username}, password='x', **extra)
+
+
+def make_role(name):
+    """A role (``apps.users.Role``, or a ``Group`` on a user model without roles)."""
+    return access.role_field().related_model.objects.create(name=name)
+
+
+def user_roles(user):
+    """``user``'s role manager: ``roles`` or ``groups``."""
+    return getattr(user, access.role_field().name)
+
+
+def role_users(role):
+    """The reverse manager from ``role`` to its holders (``users`` or ``user_set``)."""
+    return getattr(role, access.role_field().remote_field.get_accessor_name())
@@ -1,3 +1,93 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
 
-# Create your tests here.
+from apps.analytics.views import ResultCacheStatsView
+from . import access
+from .serializers import UserSerializer
+from .testing import make_role, make_user, role_users, user_roles
+
+
+def fresh(user):
+    """The user as a new request would load it: no memoized access."""
+    return get_user_model().objects.get(pk=user.pk)
+
+
+class AccessTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('ada@example.com')
+        cls.admins = make_role('admin')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_roles_are_resolved_once_and_cached(self):
+        user_roles(self.user).add(self.admins)
+        user = fresh(self.user)
+        with self.assertNumQueries(3):
+            self.assertTrue(access.resolve(user).has_role('admin'))
+        with self.assertNumQueries(0):
+            access.resolve(user)
+            self.assertEqual(UserSerializer(user).data['roles'], [{'name': 'admin'}])
+        user = fresh(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(access.resolve(user).roles, {'admin'})
+
+    def test_user_save_drops_the_entry(self):
+        access.resolve(fresh(self.user))
+        self.user.user_permissions.add(Permission.objects.get(codename='view_group'))
+        self.assertTrue(access.resolve(fresh(self.user)).has_perms(['auth.view_group']))
+        self.user.is_superuser = True
+        self.user.save()
+        with self.assertNumQueries(3):
+            access.resolve(fresh(self.user))
+
+    def test_membership_changes_from_either_side(self):
+        self.assertFalse(access.resolve(fresh(self.user)).has_role('admin'))
+        user_roles(self.user).add(self.admins)
+        self.assertTrue(access.resolve(fresh(self.user)).has_role('admin'))
+        role_users(self.admins).remove(self.user)
+        self.assertFalse(access.resolve(fresh(self.user)).has_role('admin'))
+        role_users(self.admins).add(self.user)
+        self.assertTrue(access.resolve(fresh(self.user)).has_role('admin'))
+        self.admins.name = 'owner'
+        self.admins.save()
+        self.assertEqual(access.resolve(fresh(self.user)).roles, {'owner'})
+
+    def test_generation_bumps_again_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            role_users(self.admins).add(self.user)
+            # A concurrent request that read the old membership caches it under the new generation.
+            generation = cache.get(access.GENERATION_KEY)
+            cache.set(access._key(self.user.pk), (generation, [], frozenset()))
+        self.assertFalse(access.resolve(fresh(self.user)).has_role('admin'))
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get(access.GENERATION_KEY), generation)
+        self.assertTrue(access.resolve(fresh(self.user)).has_role('admin'))
+
+
+class HasRoleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('ada@example.com')
+
+    def setUp(self):
+        cache.clear()
+
+    def get_stats(self, user):
+        request = APIRequestFactory().get('/cache-stats/')
+        force_authenticate(request, user)
+        return ResultCacheStatsView.as_view()(request)
+
+    def test_cache_stats_need_the_admin_role(self):
+        self.assertEqual(self.get_stats(fresh(self.user)).status_code, 403)
+        user_roles(self.user).add(make_role('admin'))
+        self.assertEqual(self.get_stats(fresh(self.user)).status_code, 200)
+        user = fresh(self.user)
+        # Served from the access cache: the role check adds no queries.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_stats(user).status_code, 200)
@@ -4,6 +4,7 @@ from django.contrib.auth import login, logout, authenticate
 from rest_framework import views, response, status
 from rest_framework.permissions import IsAuthenticated
 from .models import User
+from . import access
 from .serializers import UserSerializer # We'll create this serializer
 
 class SessionLoginView(views.APIView):
@@ -13,6 +14,7 @@ class SessionLoginView(views.APIView):
         user = authenticate(request, email=email, password=password)
         if user:
             login(request, user)
+            access.resolve(user)
             return response.Response(UserSerializer(user).data)
         return response.Response(
             {"detail": "Invalid credentials"}, 
@@ -28,4 +30,6 @@ class SessionLogoutView(views.APIView):
 class CurrentUserView(views.APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request, *args, **kwargs):
+        # Serves roles from the access cache instead of querying them.
+        access.resolve(request.user)
         return response.Response(UserSerializer(request.user).data)
\ No newline at end of file
@@ -13,4 +13,12 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up. The change stream (server-sent events) is
+# answered in front of Django so idle connections don't hold a thread; the
+# lifespan wrapper flushes buffered analytics events on shutdown.
+from apps.analytics.buffer import with_lifespan_flush  # noqa: E402
+from apps.analytics.stream import with_change_stream  # noqa: E402
+
+application = with_lifespan_flush(with_change_stream(django_application))
@@ -69,6 +69,14 @@ interface ApiExpense {
   status?: string | null;
   receipt?: string | null;
 }
+
+interface ApiFinancialWorkspace {
+  sales_orders: ApiSalesOrder[];
+  purchase_orders: ApiPurchaseOrder[];
+  invoices: ApiInvoice[];
+  bills: ApiInvoice[];
+  expenses: ApiExpense[];
+}
 //
 // --- FIX ENDS HERE ---
 //
@@ -144,13 +152,14 @@ export const FinancialProvider: React.FC<{ children: ReactNode }> = ({ children
     setIsLoading(true);
 
     try {
-      // Use Promise.all to fetch in parallel
-      const [soRes, poRes, invRes, expRes] = await Promise.all([
-        api<ApiSalesOrder[]>('/api/sales-orders/'),
-        api<ApiPurchaseOrder[]>('/api/purchase-orders/'),
-        api<ApiInvoice[]>('/api/invoices/'),
-        api<ApiExpense[]>('/api/expenses/'),
-      ]);
+      // One round trip; the server already splits invoices into customer invoices and vendor bills.
+      const {
+        sales_orders: soRes,
+        purchase_orders: poRes,
+        invoices: invRes,
+        bills: billRes,
+        expenses: expRes,
+      } = await api<ApiFinancialWorkspace>('/api/finance/bootstrap/');
 
       // Process Sales Orders
       setSalesOrders(soRes.map((d): SalesOrder => ({
@@ -177,15 +186,8 @@ export const FinancialProvider: React.FC<{ children: ReactNode }> = ({ children
       })));
 
       // Process Invoices and Bills
-      const customers: CustomerInvoice[] = [];
-      const vendors: VendorBill[] = [];
-      invRes.forEach((d) => {
-        const item = transformApiInvoice(d);
-        if (item) {
-          if (d.invoice_type === 'customer') customers.push(item as CustomerInvoice);
-          else vendors.push(item as VendorBill);
-        }
-      });
+      const customers = invRes.map((d) => transformApiInvoice({ ...d, invoice_type: 'customer' }) as CustomerInvoice);
+      const vendors = billRes.map((d) => transformApiInvoice({ ...d, invoice_type: 'vendor' }) as VendorBill);
       setInvoices(customers);
       setBills(vendors);
 
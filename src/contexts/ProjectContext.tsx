@@ -2,6 +2,7 @@
 /* eslint-disable react-refresh/only-export-components */
 import React, { createContext, useContext, useState, useEffect, ReactNode, useCallback } from 'react';
 import { api } from '@/lib/api';
+import { fetchAllPages } from '@/lib/pagination';
 import { useAuth } from './AuthContext'; // To re-fetch on login
 
 // Define your Project type
@@ -44,7 +45,7 @@ export const ProjectProvider: React.FC<{ children: ReactNode }> = ({ children })
     if (!isAuthenticated) return; // Don't fetch if not logged in
     setIsLoading(true);
     try {
-      const data = await api<Project[]>('/api/projects/');
+      const data = await fetchAllPages<Project>('/api/projects/');
       setProjects(data);
     } catch (error) {
       console.error('Failed to fetch projects:', error);
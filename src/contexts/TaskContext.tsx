@@ -2,6 +2,7 @@
 /* eslint-disable react-refresh/only-export-components */
 import React, { createContext, useContext, useState, useEffect, ReactNode, useCallback } from 'react';
 import { api } from '@/lib/api';
+import { fetchAllPages } from '@/lib/pagination';
 import { useAuth } from './AuthContext';
 
 // Define your Task type
@@ -47,7 +48,7 @@ export const TaskProvider: React.FC<{ children: ReactNode }> = ({ children }) =>
     if (!isAuthenticated) return;
     setIsLoading(true);
     try {
-      const data = await api<Task[]>('/api/tasks/');
+      const data = await fetchAllPages<Task>('/api/tasks/');
       setTasks(data);
     } catch (error) {
       console.error('Failed to fetch tasks:', error);
@@ -0,0 +1,28 @@
+// src/lib/pagination.ts
+import { api } from '@/lib/api';
+
+// Cursor-paginated list response returned by the API's list endpoints.
+export interface Page<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
+/**
+ * Fetch every page of a cursor-paginated list endpoint.
+ *
+ * Only the `cursor` query parameter is taken from each `next` link, so the
+ * requests keep going through the same `/api` path (and dev proxy) as `path`.
+ */
+export async function fetchAllPages<T>(path: string): Promise<T[]> {
+  const items: T[] = [];
+  let cursor: string | null = null;
+  do {
+    const separator = path.includes('?') ? '&' : '?';
+    const url = cursor ? `${path}${separator}cursor=${encodeURIComponent(cursor)}` : path;
+    const page = await api<Page<T>>(url);
+    items.push(...page.results);
+    cursor = page.next ? new URL(page.next, window.location.origin).searchParams.get('cursor') : null;
+  } while (cursor);
+  return items;
+}